@@ -6,16 +6,35 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State, ClientsideFunction
 import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
 
 import flask
+from flask_compress import Compress
 
 import pandas as pd
+import numpy as np
 import os
 import copy
-
-import pycountry_convert as pc
+import json
+import time
+from collections import namedtuple
 
 from html_layout import create_appLayout
+from calculator import format_results, report_fields
+from footprint import compute_footprint, rank_locations
+from result_cache import ResultCache
+from cache_backends import backend_from_url
+from precompressed import PrecompressedResource, PrecompressedFiles
+from build_geometry import GEOMETRY_FILE
+from build_assets import PRECOMPRESSED_DIR
+from reference_store import ReferenceStore
+from ci_store import CI_STORE_FILE, open_CI_timeseries
+from ci_timeseries import CI_TIMESERIES_FILE, to_seconds
+from ci_providers import provider_from_url
+from footprint_api import ARROW_MIMETYPE, JOB_INPUTS, MAX_BATCH, check_arrow_schema, check_references, read_lines, \
+    score_arrow, score_batch, score_stream, validate_job
+from reference_data import build_lookups, build_options_index, build_region_index, clientside_payload, \
+    ALL_PROVIDERS, ALL_DATACENTERS
 
 #############
 # LOAD DATA #
@@ -25,99 +44,136 @@ data_dir = os.path.join(os.path.abspath(''),'data')
 image_dir = os.path.join('assets/images')
 static_image_route = '/static/'
 
-# We download each csv and store it in a pd.DataFrame
-# We ignore the first row, as it contains metadata
-# All these correspond to tabs of the spreadsheet on the Google Drive
-
-### CPU ###
-cpu_df = pd.read_csv(os.path.join(data_dir, "TDP_cpu.csv"),
-                     sep=',', skiprows=1)
-cpu_df.drop(['source'], axis=1, inplace=True)
-
-### GPU ###
-gpu_df = pd.read_csv(os.path.join(data_dir, "TDP_gpu.csv"),
-                     sep=',', skiprows=1)
-gpu_df.drop(['source'], axis=1, inplace=True)
-
-# Dict of dict with all the possible models
-# e.g. {'CPU': {'Intel(R) Xeon(R) Gold 6142': 150, 'Core i7-10700K': 125, ...
-cores_dict = dict()
-cores_dict['CPU'] = pd.Series(cpu_df.TDP_per_core.values,index=cpu_df.model).to_dict()
-cores_dict['GPU'] = pd.Series(gpu_df.TDP_per_core.values,index=gpu_df.model).to_dict()
-
-### PUE ###
-pue_df = pd.read_csv(os.path.join(data_dir, "servers_PUE.csv"),
-                     sep=',', skiprows=1)
-pue_df.drop(['source'], axis=1, inplace=True)
-
-### HARDWARE ###
-hardware_df = pd.read_csv(os.path.join(data_dir, "providers_hardware.csv"),
-                          sep=',', skiprows=1)
-hardware_df.drop(['source'], axis=1, inplace=True)
-
-### OFFSET ###
-# TODO include offset of cloud providers
-# offset_df = pd.read_csv(os.path.join(data_dir, "servers_offset.csv"),
-#                         sep=',', skiprows=1)
-# offset_df.drop(['source'], axis=1, inplace=True)
-
-### CARBON INTENSITY BY LOCATION ###
-# TODO Use live electricitymap API for evaluation
-CI_df =  pd.read_csv(os.path.join(data_dir, "CI_aggregated.csv"),
-                     sep=',', skiprows=1)
-CI_df.drop(['source','Type'], axis=1, inplace=True)
-CI_dict = pd.Series(CI_df.carbonIntensity.values,index=CI_df.location).to_dict()
-
-def iso2_to_iso3(x):
-    try:
-        output = pc.country_name_to_country_alpha3(pc.country_alpha2_to_country_name(x, cn_name_format="default"),
-                                                   cn_name_format="default")
-    except:
-        output = ''
-    return output
-CI_df['ISO3'] = CI_df.location.apply(iso2_to_iso3)
-
-### CLOUD DATACENTERS ###
-# TODO update cloud datacenters
-cloudDatacenters_df = pd.read_csv(os.path.join(data_dir, "cloudProviders_datacenters.csv"),
-                                  sep=',', skiprows=1)
-
-### LOCAL DATACENTERS ###
-localDatacenters_df = pd.read_csv(os.path.join(data_dir, "localProviders_datacenters.csv"),
-                                  sep=',', skiprows=1)
-
-datacenters_df = pd.concat([cloudDatacenters_df, localDatacenters_df], axis = 1)
-datacenters_dict = dict()
-for col in datacenters_df.columns:
-    datacenters_dict[col] = list(datacenters_df[col].dropna().values)
+# Everything derived from the reference tables. It is rebuilt as a whole, off the request path,
+# when the files of data/ change, and the callbacks read it from reference_store (see further down)
+AppData = namedtuple('AppData', ['data_hash', 'revision', 'tables', 'cores_dict', 'CI_dict', 'datacenters_dict',
+                                 'refValues_dict', 'lookups', 'options_index', 'regions', 'platformType_options',
+                                 'PUE_default',
+                                 'CI_series', 'geometry_resource', 'mapCI_resource', 'mapCI_url', 'layout'])
+
+def build_appData(tables, data_hash, revision):
+    # We download each csv and store it in a pd.DataFrame
+    # All these correspond to tabs of the spreadsheet on the Google Drive
+    # They are read from the compiled snapshot (see build_data.py) when it is up to date,
+    # and from the csv files otherwise
+
+    ### CPU ###
+    cpu_df = tables['cpu']
+
+    ### GPU ###
+    gpu_df = tables['gpu']
+
+    # Dict of dict with all the possible models
+    # e.g. {'CPU': {'Intel(R) Xeon(R) Gold 6142': 150, 'Core i7-10700K': 125, ...
+    cores_dict = dict()
+    cores_dict['CPU'] = pd.Series(cpu_df.TDP_per_core.values,index=cpu_df.model).to_dict()
+    cores_dict['GPU'] = pd.Series(gpu_df.TDP_per_core.values,index=gpu_df.model).to_dict()
+
+    ### PUE ###
+    pue_df = tables['pue']
+
+    ### HARDWARE ###
+    hardware_df = tables['hardware']
+
+    ### CARBON INTENSITY BY LOCATION ###
+    # Annual averages, replaced by live values in the footprint when ci_provider is live (see ci_providers.py)
+    CI_df = tables['CI']
+    CI_dict = pd.Series(CI_df.carbonIntensity.values,index=CI_df.location).to_dict()
+
+    ### DATACENTERS ###
+    # TODO update cloud datacenters
+    datacenters_df = tables['datacenters']
+    datacenters_dict = dict()
+    for col in datacenters_df.columns:
+        datacenters_dict[col] = list(datacenters_df[col].dropna().values)
+
+    ### PROVIDERS CODES AND NAMES ###
+    providersNames_df = tables['providersNames']
+
+    ### REFERENCE VALUES
+    refValues_df = tables['refValues']
+    refValues_dict = pd.Series(refValues_df.value.values,index=refValues_df.variable).to_dict()
+
+    ### LOOKUPS ###
+    # Indexed once here, callbacks use these instead of filtering the DataFrames
+    lookups = build_lookups(CI_df=CI_df, pue_df=pue_df, cpu_df=cpu_df, gpu_df=gpu_df)
+
+    ### OPTIONS ###
+    # All the choices of the cascading dropdowns, pre-computed
+    options_index = build_options_index(CI_df=CI_df, datacenters_dict=datacenters_dict, hardware_df=hardware_df,
+                                        providersNames_df=providersNames_df, cores_dict=cores_dict)
+
+    platformType_options = [
+        {'label': k,
+         'value': v} for k,v in list(providersNames_df.loc[:,['platformName',
+                                                              'platformType']].drop_duplicates().apply(tuple, axis=1)) +
+                                [('Personal computer', 'personalComputer')] +
+                                [('Local server', 'localServer')]
+    ]
 
-### PROVIDERS CODES AND NAMES ###
-providersNames_df = pd.read_csv(os.path.join(data_dir, "providersNamesCodes.csv"),
-                                sep=',', skiprows=1)
+    PUE_default = lookups.pue['Unknown']
+
+    ### REGIONS ###
+    # Every location where a job could run, as arrays, see rank_regions
+    regions = build_region_index(lookups, datacenters_dict)
+
+    ### CARBON INTENSITY OVER TIME ###
+    # Hourly series of some locations, None if there are none (see ci_store.py)
+    CI_series = open_CI_timeseries(data_dir)
+
+    ### MAP ###
+    # Simplified outlines of the countries, built by build_geometry.py and served with the same caching as the map.
+    # Without them, the map uses plotly's own outlines
+    geometry_resource = load_geometry(data_dir)
+    geometry_url = None
+    if geometry_resource is not None:
+        geometry_url = '/figures/world.geo.json?v={}'.format(geometry_resource.etag[:12])
+    mapCI_resource = build_mapCI(CI_df, geometry_url)
+    mapCI_url = '/figures/mapCI.json?v={}'.format(mapCI_resource.etag[:12])
+
+    ### LAYOUT ###
+    # Reference data and default values shipped with the layout for the clientside callbacks
+    if clientside_callbacks:
+        referenceData = clientside_payload(lookups, refValues_dict,
+                                           defaults=dict(usage=usageFactor_default, PUE=PUE_default,
+                                                         PSF=PSF_default),
+                                           regions=regions)
+        referenceData['revision'] = revision
+    else:
+        referenceData = None
+
+    layout = create_appLayout(
+        platformType_options=platformType_options,
+        yesNo_options=yesNo_options,
+        PUE_default=PUE_default,
+        usage_default=usageFactor_default,
+        PSF_default=PSF_default,
+        image_dir=image_dir,
+        mapCI_placeholder=dict(layout=layout_map),
+        mapCI_url=mapCI_url,
+        referenceData=referenceData,
+        startTime_available=startTime_panel and (CI_series is not None),
+    )
 
-### REFERENCE VALUES
-refValues_df = pd.read_csv(os.path.join(data_dir, "referenceValues.csv"),
-                           sep=',', skiprows=1)
-refValues_df.drop(['source'], axis=1, inplace=True)
-refValues_dict = pd.Series(refValues_df.value.values,index=refValues_df.variable).to_dict()
+    return AppData(data_hash=data_hash, revision=revision, tables=tables, cores_dict=cores_dict,
+                   CI_dict=CI_dict, datacenters_dict=datacenters_dict, refValues_dict=refValues_dict,
+                   lookups=lookups, options_index=options_index, regions=regions,
+                   platformType_options=platformType_options,
+                   PUE_default=PUE_default, CI_series=CI_series, geometry_resource=geometry_resource,
+                   mapCI_resource=mapCI_resource, mapCI_url=mapCI_url, layout=layout)
 
 ###########
 # OPTIONS #
 ###########
 
-platformType_options = [
-    {'label': k,
-     'value': v} for k,v in list(providersNames_df.loc[:,['platformName',
-                                                          'platformType']].drop_duplicates().apply(tuple, axis=1)) +
-                            [('Personal computer', 'personalComputer')] +
-                            [('Local server', 'localServer')]
-]
-
 yesNo_options = [
     {'label': 'Yes', 'value': 'Yes'},
     {'label': 'No', 'value': 'No'}
 ]
 
+usageFactor_default = 1
+PSF_default = 1
+
 ## COLOURS
 myColors = {
     'fontColor':'rgb(60, 60, 60)',
@@ -157,9 +213,6 @@ layout_plots = dict(
 
 ## make map
 
-map_df = CI_df.loc[CI_df.ISO3 != '', ['ISO3', 'carbonIntensity', 'countryName']]
-map_df['text'] = map_df.carbonIntensity.apply(round).astype('str') + " gCO2e/kWh"
-
 layout_map = copy.deepcopy(layout_plots)
 
 layout_map['height'] = 250
@@ -179,40 +232,62 @@ layout_map['geo'] = dict(
     bgcolor=myColors['boxesColor'],
 )
 
-mapCI = go.Figure(
-    data=go.Choropleth(
-        geojson=os.path.join(data_dir, 'world.geo.json'),
-        locations = map_df.ISO3,
-        locationmode='geojson-id',
-        z=map_df.carbonIntensity.astype(float),
-        colorscale=myColors['map'],
-        colorbar=dict(
-            title=dict(
-                # text="Carbon <br> intensity <br> (gCO2e/kWh)",
-                font=dict(
+def load_geometry(data_dir):
+    # None if build_geometry.py hasn't been run
+    path = os.path.join(data_dir, GEOMETRY_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return PrecompressedResource(f.read(), 'application/json')
+
+def build_mapCI(CI_df, geometry_url=None):
+    '''
+    The map is the same for every visitor: it is serialised and gzipped once, and fetched by the
+    browser after the page has loaded (assets/lazy_figures.js) instead of being part of the layout.
+    '''
+    map_df = CI_df.loc[CI_df.ISO3 != '', ['ISO3', 'carbonIntensity', 'countryName']]
+    map_df['text'] = map_df.carbonIntensity.apply(round).astype('str') + " gCO2e/kWh"
+
+    if geometry_url is not None:
+        outlines = dict(geojson=geometry_url, locationmode='geojson-id')
+    else:
+        outlines = dict(locationmode='ISO-3')
+
+    mapCI = go.Figure(
+        data=go.Choropleth(
+            **outlines,
+            locations = map_df.ISO3,
+            z=map_df.carbonIntensity.astype(float),
+            colorscale=myColors['map'],
+            colorbar=dict(
+                title=dict(
+                    # text="Carbon <br> intensity <br> (gCO2e/kWh)",
+                    font=dict(
+                        color=myColors['fontColor'],
+                    )
+                ),
+                tickfont=dict(
                     color=myColors['fontColor'],
-                )
+                    size=12,
+                ),
+                thicknessmode='fraction',
+                thickness=0.04,
+                xpad=3,
             ),
-            tickfont=dict(
-                color=myColors['fontColor'],
-                size=12,
+            showscale=True,
+            hovertemplate="%{text} <extra> %{z:.0f} gCO2e/kWh </extra>",
+            text=map_df.countryName,
+            marker=dict(
+                line=dict(
+                    color=myColors['boxesColor'],
+                    width=0.5
+                )
             ),
-            thicknessmode='fraction',
-            thickness=0.04,
-            xpad=3,
         ),
-        showscale=True,
-        hovertemplate="%{text} <extra> %{z:.0f} gCO2e/kWh </extra>",
-        text=map_df.countryName,
-        marker=dict(
-            line=dict(
-                color=myColors['boxesColor'],
-                width=0.5
-            )
-        ),
-    ),
-    layout=layout_map
-)
+        layout=layout_map
+    )
+
+    return PrecompressedResource(json.dumps(mapCI, cls=PlotlyJSONEncoder), 'application/json')
 
 images_dir = os.path.join(os.path.abspath(''),'images')
 
@@ -235,34 +310,123 @@ app = dash.Dash(
     meta_tags=[dict(
         name= 'viewport',
         content="width=device-width, initial-scale=1.0" #maximum-scale=1.0
-    )]
+    )],
+    # compression is set up below
+    compress=False,
 )
 app.title = "Green Algorithms"
 server = app.server
 
-usageFactor_default = 1
-PUE_default = pue_df.loc[pue_df.provider == 'Unknown', 'PUE'][0]
-PSF_default = 1
-
-app.layout = create_appLayout(
-    platformType_options=platformType_options,
-    yesNo_options=yesNo_options,
-    PUE_default=PUE_default,
-    usage_default=usageFactor_default,
-    PSF_default=PSF_default,
-    image_dir=image_dir,
-    mapCI=mapCI,
+# Static files are served from their versions compressed by build_assets.py, when there are some,
+# and the JSON responses (_dash-layout, _dash-update-component...) are compressed on the fly above a minimum size
+precompressed_files = PrecompressedFiles(app, os.path.join(os.path.abspath(''), PRECOMPRESSED_DIR))
+precompressed_files.init_app(server)
+server.config.update(
+    COMPRESS_MIMETYPES=['application/json'],
+    COMPRESS_LEVEL=6,
+    COMPRESS_MIN_SIZE=int(os.environ.get('GREEN_ALGORITHMS_COMPRESS_MIN_SIZE', 1024)),
 )
+Compress(server)
+
+# The footprint and the simple show/hide callbacks run in the browser (assets/clientside.js)
+# unless this is set to 'false', in which case their Python versions run on the server
+clientside_callbacks = os.environ.get('GREEN_ALGORITHMS_CLIENTSIDE', 'true').lower() != 'false'
+
+# Results of the callbacks are cached by input values, see result_cache.py
+# (a size of 0 disables the cache, a TTL of 0 keeps the results until they are evicted)
+# GREEN_ALGORITHMS_SHARED_CACHE adds a cache shared by all the workers, see cache_backends.py
+# e.g. sqlite:///tmp/green-algorithms-cache.db or unix:///tmp/green-algorithms-cache.sock
+cache_ttl = float(os.environ.get('GREEN_ALGORITHMS_CACHE_TTL', 0)) or None
+shared_cache_url = os.environ.get('GREEN_ALGORITHMS_SHARED_CACHE')
+results_cache = ResultCache(maxsize=int(os.environ.get('GREEN_ALGORITHMS_CACHE_SIZE', 1024)),
+                            ttl=cache_ttl,
+                            backend=backend_from_url(shared_cache_url, ttl=cache_ttl) if shared_cache_url else None)
+
+# The panel of the best start time (and its callback) is only there if there are hourly carbon intensity series
+# when the app starts, see ci_timeseries.py
+startTime_panel = any(os.path.exists(os.path.join(data_dir, name)) for name in [CI_TIMESERIES_FILE, CI_STORE_FILE])
+
+# The reference data is loaded here, and then checked every GREEN_ALGORITHMS_RELOAD_INTERVAL seconds
+# (0 to disable): new versions replace the current one without a restart, see reference_store.py
+reference_store = ReferenceStore(data_dir, build_appData,
+                                 extra_files=[GEOMETRY_FILE, CI_TIMESERIES_FILE, CI_STORE_FILE])
+results_cache.set_data_hash(reference_store.current.data_hash)
+
+@reference_store.on_swap
+def reset_results_cache(appData):
+    # results computed with the previous data are dropped
+    results_cache.set_data_hash(appData.data_hash)
+
+reload_interval = float(os.environ.get('GREEN_ALGORITHMS_RELOAD_INTERVAL', 30))
+if reload_interval > 0:
+    reference_store.watch(reload_interval)
+
+# Carbon intensity used for the footprint: the annual averages of CI_aggregated.csv by default,
+# or live values fetched in the background from GREEN_ALGORITHMS_CI_PROVIDER, see ci_providers.py
+# e.g. https://api.electricitymap.org/v3/carbon-intensity/latest (or the stand-in, http://127.0.0.1:8089/...)
+ci_provider = provider_from_url(os.environ.get('GREEN_ALGORITHMS_CI_PROVIDER'),
+                                token=os.environ.get('GREEN_ALGORITHMS_CI_TOKEN'),
+                                ttl=float(os.environ.get('GREEN_ALGORITHMS_CI_TTL', 900)),
+                                stale=float(os.environ.get('GREEN_ALGORITHMS_CI_STALE', 3600)))
+
+@server.route('/figures/mapCI.json')
+def serve_mapCI():
+    return reference_store.current.mapCI_resource.response()
+
+@server.route('/figures/world.geo.json')
+def serve_geometry():
+    geometry_resource = reference_store.current.geometry_resource
+    if geometry_resource is None:
+        flask.abort(404)
+    return geometry_resource.response()
+
+# Hit rates of this worker's cache (and of the shared cache)
+@server.route('/stats/cache')
+def cache_stats():
+    return flask.jsonify(pid=os.getpid(), **results_cache.stats())
+
+# Where this worker's carbon intensity comes from, and how fresh it is
+@server.route('/stats/ci')
+def ci_stats():
+    return flask.jsonify(pid=os.getpid(), **ci_provider.stats())
+
+# Version of the reference data used by this worker
+@server.route('/stats/data')
+def data_stats():
+    return flask.jsonify(pid=os.getpid(), **reference_store.stats())
+
+# Built with the reference data, so that new visitors get the new options after a reload
+def serve_layout():
+    return reference_store.current.layout
+
+app.layout = serve_layout
 
 
 ##############
 # CALLBACKS #
 ##############
 
+def clientside_or_server_callback(output, inputs, state=[], clientside_state=[], clientside=True):
+    '''
+    Registers the decorated function as a server callback, or registers instead its clientside twin
+    (same name, in assets/clientside.js) if clientside_callbacks and clientside are on.
+    clientside_state is passed to the clientside function, in place of state.
+    '''
+    def decorator(function):
+        if clientside_callbacks and clientside:
+            app.clientside_callback(
+                ClientsideFunction(namespace='clientside', function_name=function.__name__),
+                output, inputs, clientside_state
+            )
+        else:
+            app.callback(output, inputs, state)(function)
+        return function
+    return decorator
+
 ### PLATFORM AND PROVIDER ###
 
 # This callback shows or hides the choice of provider
-@app.callback(
+@clientside_or_server_callback(
     Output('provider_dropdown', 'style'),
     [Input('platformType_dropdown', 'value')])
 def display_provider(selected_platform):
@@ -277,9 +441,8 @@ def display_provider(selected_platform):
     Output('provider_dropdown', 'options'),
     [Input('platformType_dropdown', 'value')])
 def set_providers_options(selected_platform):
-    availableOptions = providersNames_df.loc[providersNames_df.platformType == selected_platform]
-    return [{'label': k, 'value': v} for k,v in list(zip(availableOptions.providerName, availableOptions.provider))+
-            [("Other","other")]]
+    options_index = reference_store.current.options_index
+    return options_index.providers.get(selected_platform, [{'label': "Other", 'value': "other"}])
 
 # ...and the default value
 @app.callback(
@@ -300,10 +463,11 @@ def set_providers_value(selected_platform):
      Input('platformType_dropdown', 'value')])
 def set_coreType_options(selected_provider, selected_platform):
     if (selected_provider == 'other')|(selected_platform in ['personalComputer','cloudComputing','localServer']):
-        availableOptions = cores_dict.keys()
-    else:
-        availableOptions = list(set(hardware_df.loc[hardware_df.provider == selected_provider, 'type']))
-    return [{'label': k, 'value': k} for k in sorted(availableOptions)]
+        selected_provider = ALL_PROVIDERS
+    options_index = reference_store.current.options_index
+    if selected_provider not in options_index.hardware:
+        return []
+    return options_index.hardware[selected_provider].coreTypes
 
 # This callback adjusts the list of computing cores to choose from (models)
 @app.callback(
@@ -312,12 +476,13 @@ def set_coreType_options(selected_provider, selected_platform):
      Input('provider_dropdown','value'),
      Input('platformType_dropdown', 'value')])
 def set_coreModels_options(selected_coreType,selected_provider,selected_platform):
+    options_index = reference_store.current.options_index
     if (selected_provider == 'other')|(selected_platform in ['personalComputer','cloudComputing','localServer']):
-        availableOptions = sorted(list(cores_dict[selected_coreType].keys()))
-    else:
-        availableOptions = sorted(hardware_df.loc[(hardware_df.type == selected_coreType)&(
-                hardware_df.provider == selected_provider), 'model'].tolist())
-    return [{'label': k, 'value': v} for k, v in list(zip(availableOptions, availableOptions))+[("Other","other")]]
+        return options_index.hardware[ALL_PROVIDERS].modelOptions[selected_coreType]
+    elif selected_provider not in options_index.hardware:
+        return [{'label': "Other", 'value': "other"}]
+    return options_index.hardware[selected_provider].modelOptions.get(selected_coreType,
+                                                                      [{'label': "Other", 'value': "other"}])
 
 @app.callback(
     Output('coreModel_dropdown', 'value'),
@@ -332,11 +497,10 @@ def set_coreModels_value(selected_coreType,selected_provider,selected_platform):
         else:
             return 'Tesla V100'
     else:
-        return sorted(hardware_df.loc[(hardware_df.type == selected_coreType)&(
-                hardware_df.provider == selected_provider), 'model'].tolist())[0]
+        return reference_store.current.options_index.hardware[selected_provider].models[selected_coreType][0]
 
 # This callback shows or hide the TDP input
-@app.callback(
+@clientside_or_server_callback(
     Output('tdp_div', 'style'),
     [Input('coreModel_dropdown', 'value')])
 def display_TDP(selected_coreModel):
@@ -345,7 +509,7 @@ def display_TDP(selected_coreModel):
     else:
         return {'display': 'none'}
 
-@app.callback(
+@clientside_or_server_callback(
     Output('tdp_input','value'),
     [Input('coreType_dropdown', 'value')]
 )
@@ -364,11 +528,8 @@ def tdp_default(selected_coreType):
      Input('platformType_dropdown', 'value')])
 def set_continents_options(selected_provider,selected_platform):
     if (selected_provider == 'other')|(selected_platform == 'personalComputer'):
-        availableOptions = list(set(CI_df.continentName))
-    else:
-        availableOptions = list(set(CI_df.loc[CI_df.location.isin(datacenters_dict[selected_provider]),
-                                              'continentName']))
-    return [{'label': k, 'value': k} for k in sorted(availableOptions)]
+        selected_provider = ALL_PROVIDERS
+    return reference_store.current.options_index.locations[selected_provider].continents
 
 # This callback adjusts the list of countries to choose from depending on the continent & the provider
 @app.callback(
@@ -378,11 +539,8 @@ def set_continents_options(selected_provider,selected_platform):
      Input('platformType_dropdown', 'value')])
 def set_countries_options(selected_continent, selected_provider,selected_platform):
     if (selected_provider == 'other')|(selected_platform == 'personalComputer'):
-        availableOptions = list(set(CI_df.loc[(CI_df.continentName == selected_continent), 'countryName']))
-    else:
-        availableOptions = list(set(CI_df.loc[(CI_df.location.isin(datacenters_dict[selected_provider])) & (
-                CI_df.continentName == selected_continent), 'countryName']))
-    return [{'label': k, 'value': k} for k in sorted(availableOptions)]
+        selected_provider = ALL_PROVIDERS
+    return reference_store.current.options_index.locations[selected_provider].countries.get(selected_continent, [])
 
 # and this one adjusts the list of region depending on the country & the provider
 @app.callback(
@@ -393,17 +551,12 @@ def set_countries_options(selected_continent, selected_provider,selected_platfor
      Input('platformType_dropdown', 'value')])
 def set_cities_options(selected_continent, selected_country,selected_provider,selected_platform):
     if (selected_provider == 'other')|(selected_platform == 'personalComputer'):
-        availableOptions = CI_df.loc[(CI_df.continentName == selected_continent) & (
-                CI_df.countryName == selected_country)]
-    else:
-        availableOptions = CI_df.loc[(CI_df.location.isin(datacenters_dict[selected_provider])) & (
-                CI_df.continentName == selected_continent) & (
-                                             CI_df.countryName == selected_country)]
-    availableOptions = availableOptions.sort_values(by=['regionName'])
-    return [{'label': k, 'value': v} for k,v in zip(availableOptions.regionName, availableOptions.location)]
+        selected_provider = ALL_PROVIDERS
+    locationOptions = reference_store.current.options_index.locations[selected_provider]
+    return locationOptions.regions.get((selected_continent, selected_country), [])
 
 # This callback shows or hide the country/region if WORLD is selected
-@app.callback(
+@clientside_or_server_callback(
     [
         Output('location_country_dropdown', 'style'),
         Output('location_region_dropdown', 'style'),
@@ -431,12 +584,13 @@ def display_countryRegion(selected_continent):
 ### Usage ###
 
 # This asks for Usage input if necessary
-@app.callback(
+@clientside_or_server_callback(
     [
         Output('usage_input','style'),
         Output('usage_input','value')
     ],
-    [Input('usage_radio', 'value')]
+    [Input('usage_radio', 'value')],
+    clientside_state=[State('reference_data', 'data')]
 )
 def display_usage_input(answer_usage):
     if answer_usage == 'No':
@@ -454,26 +608,26 @@ def display_usage_input(answer_usage):
      Input('provider_dropdown', 'value')]
 )
 def display_pue_question(selected_datacenter, selected_platform, selected_provider):
-    providers_knownPUE = list(set(pue_df.provider))
-
     if selected_platform in ['cloudComputing','personalComputer']:
         return {'display': 'none'}
 
-    elif selected_provider in providers_knownPUE:
+    elif selected_provider in reference_store.current.lookups.pue:
         return {'display': 'none'}
 
     else:
         return {'display': 'flex'}
 
 # And then asks for PUE input if necessary
-@app.callback(
+@clientside_or_server_callback(
     [
         Output('PUE_input','style'),
         Output('PUE_input','value'),
     ],
-    [Input('pue_radio', 'value')]
+    [Input('pue_radio', 'value')],
+    clientside_state=[State('reference_data', 'data')]
 )
 def display_pue_input(answer_pue):
+    PUE_default = reference_store.current.PUE_default
     if answer_pue == 'No':
         return {'display': 'none'}, PUE_default
     else:
@@ -482,12 +636,13 @@ def display_pue_input(answer_pue):
 ### PSF ###
 
 # This asks for PSF input if necessary
-@app.callback(
+@clientside_or_server_callback(
     [
         Output('PSF_input','style'),
         Output('PSF_input','value')
     ],
-    [Input('PSF_radio', 'value')]
+    [Input('PSF_radio', 'value')],
+    clientside_state=[State('reference_data', 'data')]
 )
 def display_PSF_input(answer_PSF):
     if answer_PSF == 'No':
@@ -496,7 +651,7 @@ def display_PSF_input(answer_PSF):
         return {'display': 'block'}, PSF_default
 
 ### STORE ###
-@app.callback(
+@clientside_or_server_callback(
     Output("aggregate_data", "data"),
     [
         Input("coreType_dropdown", "value"),
@@ -515,10 +670,19 @@ def display_PSF_input(answer_PSF):
     ],
     [
         State("aggregate_data", "data")
-    ]
+    ],
+    clientside_state=[State("reference_data", "data")],
+    # the browser only has the static values
+    clientside=not ci_provider.live,
 )
+# the existing state is not used, the revision of the live carbon intensity of the location is part of the key
+@results_cache.cached(key=lambda *args: args[:-1] + (ci_provider.revision(args[7]),))
 def aggregate_input_values(coreType, coreModel, n_cores, tdp, memory, runTime_hours, runTime_min, location,
                            usage, PUE, PSF, selected_platform, selected_provider, existing_state):
+    # one version of the reference data for the whole computation, even if it is reloaded meanwhile
+    appData = reference_store.current
+    lookups = appData.lookups
+
     output = dict()
 
     test_runTime = 0
@@ -566,38 +730,29 @@ def aggregate_input_values(coreType, coreModel, n_cores, tdp, memory, runTime_ho
         output['energy_needed'] = 0
         output['power_needed'] = 0
         output['flying_text'] = None
+        output['data_version'] = appData.revision
 
         return output
 
     else:
-        carbonIntensity = CI_df.loc[CI_df.location == location, "carbonIntensity"].values[0]
+        carbonIntensity = ci_provider.carbonIntensity(location, lookups.CI[location])
 
         if selected_platform == 'personalComputer':
             PUE_used = 1
-        elif selected_provider in pue_df.provider.values:
-            PUE_used = pue_df.loc[pue_df.provider == selected_provider, "PUE"].values[0]
+        elif selected_provider in lookups.pue:
+            PUE_used = lookups.pue[selected_provider]
         else:
             PUE_used = PUE
 
         if coreModel == 'other':
             corePower = tdp
         else:
-            corePower = cores_dict[coreType][coreModel]
+            corePower = lookups.cores[coreType][coreModel]
 
-        # Power needed, in Watt
-        powerNeeded_core = PUE_used * (n_cores * corePower) * usage
-        powerNeeded_memory = PUE_used * (memory * refValues_dict['memoryPower'])
-        powerNeeded = powerNeeded_core + powerNeeded_memory
-
-        # Energy needed, in kWh (so dividing by 1000 to convert to kW)
-        energyNeeded_core = runTime * powerNeeded_core * PSF / 1000
-        eneregyNeeded_memory = runTime * powerNeeded_memory * PSF / 1000
-        energyNeeded = runTime * powerNeeded * PSF / 1000
-
-        # Carbon emissions: carbonIntensity is in g per kWh, so results in gCO2
-        CE_core = energyNeeded_core * carbonIntensity
-        CE_memory  = eneregyNeeded_memory * carbonIntensity
-        carbonEmissions = energyNeeded * carbonIntensity
+        # Same formula as the batch engine, see footprint.py
+        footprint = compute_footprint(runTime=runTime, n_cores=n_cores, corePower=corePower, memory=memory,
+                                      carbonIntensity=carbonIntensity, usage=usage, PUE=PUE_used, PSF=PSF,
+                                      refValues_dict=appData.refValues_dict)
 
         output['coreType'] = coreType
         output['coreModel'] = coreModel
@@ -612,150 +767,210 @@ def aggregate_input_values(coreType, coreModel, n_cores, tdp, memory, runTime_ho
         output['PUE'] = PUE_used
         output['PSF'] = PSF
         output['selected_platform'] = selected_platform
-        output['carbonEmissions'] = carbonEmissions
-        output['CE_core'] = CE_core
-        output['CE_memory'] = CE_memory
-        output['energy_needed'] = energyNeeded
-        output['power_needed'] = powerNeeded
-
-        ### CONTEXT
-
-        output['n_treeMonths'] = carbonEmissions / refValues_dict['treeYear'] * 12
-
-        output['nkm_drivingUS'] = carbonEmissions / refValues_dict['passengerCar_US_perkm']
-        output['nkm_drivingEU'] = carbonEmissions / refValues_dict['passengerCar_EU_perkm']
-        output['nkm_train'] = carbonEmissions / refValues_dict['train_perkm']
-
-        if carbonEmissions < 0.5 * refValues_dict['flight_NY-SF']:
-            output['flying_context'] = carbonEmissions / refValues_dict['flight_PAR-LON']
-            output['flying_text'] = "Paris-London"
-        elif carbonEmissions < 0.5 * refValues_dict['flight_NYC-MEL']:
-            output['flying_context'] = carbonEmissions / refValues_dict['flight_NY-SF']
-            output['flying_text'] = "NYC-San Francisco"
-        else:
-            output['flying_context'] = carbonEmissions / refValues_dict['flight_NYC-MEL']
-            output['flying_text'] = "NYC-Melbourne"
+
+        ### RESULTS AND CONTEXT
+        for key in ['carbonEmissions', 'CE_core', 'CE_memory', 'energy_needed', 'power_needed',
+                    'n_treeMonths', 'nkm_drivingUS', 'nkm_drivingEU', 'nkm_train', 'flying_context']:
+            output[key] = footprint[key]
+        output['flying_text'] = str(footprint['flying_text'])
+        output['data_version'] = appData.revision
 
         return output
 
+### RESULTS ###
+
+# All the callbacks below only depend on the aggregate_data Store.
+# By default they are served by a single callback (update_results), so that a change of input
+# triggers one request instead of one per callback. Set this to 'false' to register them separately.
+consolidated_results = os.environ.get('GREEN_ALGORITHMS_CONSOLIDATED_RESULTS', 'true').lower() != 'false'
+
+results_callbacks = []
+
+def results_callback(output):
+    '''
+    Records the decorated function as a callback of the aggregate_data Store, registered further down.
+    '''
+    def decorator(function):
+        results_callbacks.append((output, function))
+        return function
+    return decorator
+
 ### UPDATE TOP TEXT ###
 
-@app.callback(
+@results_callback(
     [
         Output("carbonEmissions_text", "children"),
         Output("energy_text", "children"),
         Output("treeMonths_text", "children"),
         Output("driving_text", "children"),
         Output("flying_text", "children"),
-    ],
-    [Input("aggregate_data", "data")],
+    ]
 )
+@results_cache.cached()
 def update_text(data):
-    carbonEmissions_value = data['carbonEmissions'] # in g CO2e
-    carbonEmissions_unit = "g"
-    if carbonEmissions_value >= 1e6:
-        carbonEmissions_value /= 1e6
-        carbonEmissions_unit = "T"
-    elif carbonEmissions_value >= 1e3:
-        carbonEmissions_value /= 1e3
-        carbonEmissions_unit = "kg"
-    text_CE = "{:,.2f} {} CO2e".format(carbonEmissions_value,
-                                       carbonEmissions_unit)
-
-    energyNeeded_value = data['energy_needed'] # in kWh
-    energyNeeded_unit = "kWh"
-    if energyNeeded_value >= 1e3:
-        energyNeeded_value /= 1e3
-        energyNeeded_unit = "MWh"
-    text_energy = "{:,.2f} {}".format(energyNeeded_value, energyNeeded_unit)
-
-    treeTime_value = data['n_treeMonths'] # in tree-months
-    treeTime_unit = "tree-months"
-    if treeTime_value >= 24:
-        treeTime_value /= 12
-        treeTime_unit = "tree-years"
-    text_ty = "{:,.2f} {}".format(treeTime_value, treeTime_unit)
-
-    text_car = "{:,.2f} km".format(data['nkm_drivingEU'])
-    text_fly = "{:,.0f} %".format(data['flying_context']*100)
-
-    return text_CE, text_energy, text_ty, text_car, text_fly
+    # shared with the command-line tool, see calculator.py
+    return format_results(data)
 
-@app.callback(
-    Output("flying_label", "children"),
-    [Input("aggregate_data", "data")],
-)
-def update_text(data):
+@results_callback(Output("flying_label", "children"))
+@results_cache.cached()
+def update_flying_label(data):
     return "of a flight {}".format(data['flying_text'])
     # return ["of a flight", html.Br(), "{}".format(data['flying_text'])]
 
-### UPDATE PIE GRAPH ###
-@app.callback(
-    Output("pie_graph", "figure"),
-    [Input("aggregate_data", "data")],
-)
-def create_pie_graph(aggData):
-    layout_pie = copy.deepcopy(layout_plots)
-
-    layout_pie['margin'] = dict(l=0, r=0, b=0, t=20)
-
-    layout_pie['height'] = 300
-
-    fig = go.Figure(
-        data=[
-            go.Pie(
-                labels=['Computing <br> cores', 'Memory'],
-                values=[aggData['CE_core'], aggData['CE_memory']],
-                hole=0.4,
-                insidetextorientation='horizontal',
-                showlegend=False,
-                pull=[0.05, 0.05],
-                marker=dict(
-                    colors=myColors['pieChart']
-                ),
-                texttemplate="<b>%{label}</b><br>%{percent}",
-                textfont=dict(
+### FIGURES ###
+# Each figure is built (and validated by plotly) once here, as a dict.
+# The callbacks only fill in the data of the first trace, see figure_from_template.
+
+def _merge(base, updates):
+    output = dict(base)
+    for k, v in updates.items():
+        if isinstance(v, dict) and isinstance(base.get(k), dict):
+            output[k] = _merge(base[k], v)
+        else:
+            output[k] = v
+    return output
+
+def figure_from_template(template, **trace_updates):
+    '''
+    Figure dict from a pre-built template, with the first trace updated (nested dicts are merged).
+    Only the updated branches are copied, the rest is shared with the template, which must not be modified.
+    '''
+    return dict(data=[_merge(template['data'][0], trace_updates)], layout=template['layout'])
+
+layout_pie = copy.deepcopy(layout_plots)
+
+layout_pie['margin'] = dict(l=0, r=0, b=0, t=20)
+
+layout_pie['height'] = 300
+
+pie_template = go.Figure(
+    data=[
+        go.Pie(
+            labels=['Computing <br> cores', 'Memory'],
+            values=[0, 0],
+            hole=0.4,
+            insidetextorientation='horizontal',
+            showlegend=False,
+            pull=[0.05, 0.05],
+            marker=dict(
+                colors=myColors['pieChart']
+            ),
+            texttemplate="<b>%{label}</b><br>%{percent}",
+            textfont=dict(
+                family=font_graphs,
+                color=myColors['fontColor'],
+            ),
+            hovertemplate='%{value:.0f} gCO2e<extra></extra>',
+            hoverlabel=dict(
+                font=dict(
                     family=font_graphs,
                     color=myColors['fontColor'],
-                ),
-                hovertemplate='%{value:.0f} gCO2e<extra></extra>',
-                hoverlabel=dict(
-                    font=dict(
-                        family=font_graphs,
-                        color=myColors['fontColor'],
-                    )
                 )
             )
-        ],
-        layout=layout_pie
-    )
+        )
+    ],
+    layout=layout_pie
+).to_plotly_json()
 
-    return fig
+layout_bar = copy.deepcopy(layout_plots)
 
+layout_bar['xaxis'] = dict(
+    color=myColors['fontColor'],
+)
 
-### UPDATE BAR CHART COMPARISON
-@app.callback(
-    Output("barPlotComparison", "figure"),
-    [Input("aggregate_data", "data")],
+layout_bar['yaxis'] = dict(
+    color=myColors['fontColor'],
+    title=dict(
+        text='Emissions (gCO2e)',
+        standoff=100,
+    ),
+    showspikes=False,
+    showgrid=True,
+    gridcolor=myColors['plotGrid'],
 )
-def create_bar_chart(aggData):
-    layout_bar = copy.deepcopy(layout_plots)
 
-    layout_bar['xaxis'] = dict(
+bar_template = go.Figure(
+    data = [
+        go.Bar(
+            x=[],
+            y=[],
+            marker = dict(
+                color=[],
+                colorscale=myColors['map'],
+                line=dict(
+                    width=0,
+                    color=myColors['fontColor'],
+                )
+            ),
+            hovertemplate='%{y:.0f} gCO2e<extra></extra>',
+            hoverlabel=dict(
+                font=dict(
+                    color=myColors['fontColor'],
+                )
+            ),
+
+        )
+    ],
+    layout = layout_bar
+).to_plotly_json()
+
+# One template per core type, as only the title of the y axis differs
+barCores_templates = dict()
+for coreType, yaxis_title in [('GPU', 'Power draw (W)'), ('CPU', 'Power draw per core (W)')]:
+    layout_barCores = copy.deepcopy(layout_plots)
+
+    layout_barCores['margin']['t'] = 60
+
+    layout_barCores['xaxis'] = dict(
         color=myColors['fontColor'],
     )
 
-    layout_bar['yaxis'] = dict(
+    layout_barCores['yaxis'] = dict(
         color=myColors['fontColor'],
-        title=dict(
-            text='Emissions (gCO2e)',
-            standoff=100,
-        ),
         showspikes=False,
         showgrid=True,
         gridcolor=myColors['plotGrid'],
+        title=dict(text=yaxis_title),
     )
 
+    barCores_templates[coreType] = go.Figure(
+        data = [
+            go.Bar(
+                x=[],
+                y=[],
+                marker = dict(
+                    color=[],
+                    colorscale='OrRd',
+                    line=dict(
+                        width=0,
+                        color=myColors['fontColor'],
+                    )
+                ),
+                hovertemplate='%{y:.1f} W<extra></extra>',
+                hoverlabel=dict(
+                    font=dict(
+                        color=myColors['fontColor'],
+                    )
+                ),
+
+            )
+        ],
+        layout = layout_barCores
+    ).to_plotly_json()
+
+empty_figure = go.Figure().to_plotly_json()
+
+### UPDATE PIE GRAPH ###
+@results_callback(Output("pie_graph", "figure"))
+@results_cache.cached()
+def create_pie_graph(aggData):
+    return figure_from_template(pie_template, values=[aggData['CE_core'], aggData['CE_memory']])
+
+
+### UPDATE BAR CHART COMPARISON
+@results_callback(Output("barPlotComparison", "figure"))
+@results_cache.cached()
+def create_bar_chart(aggData):
     loc_ref = {
         'CH':{'name':'Switzerland'},
         'SE':{'name':'Sweden'},
@@ -769,79 +984,39 @@ def create_bar_chart(aggData):
     }
 
     # calculate carbon emissions for each location
+    CI = reference_store.current.lookups.CI
     for countryCode in loc_ref.keys():
-        loc_ref[countryCode]['carbonEmissions'] = aggData['energy_needed'] * CI_df.loc[CI_df.location == countryCode, "carbonIntensity"].values[0]
-        loc_ref[countryCode]['opacity'] = 0.2
+        loc_ref[countryCode]['carbonEmissions'] = aggData['energy_needed'] * CI[countryCode]
 
     loc_ref['You'] = dict(
         name='Your algorithm',
         carbonEmissions=aggData['carbonEmissions'],
-        opacity=1
     )
 
-    loc_df = pd.DataFrame.from_dict(loc_ref, orient='index')
-
-    loc_df.sort_values(by=['carbonEmissions'], inplace=True)
-
-    lines_thickness = [0] * len(loc_df)
-    lines_thickness[loc_df.index.get_loc('You')] = 4
-
-    fig = go.Figure(
-        data = [
-            go.Bar(
-                x=loc_df.name.values,
-                y=loc_df.carbonEmissions.values,
-                marker = dict(
-                    color=loc_df.carbonEmissions.values,
-                    colorscale=myColors['map'],
-                    line=dict(
-                        width=lines_thickness,
-                        color=myColors['fontColor'],
-                    )
-                ),
-                hovertemplate='%{y:.0f} gCO2e<extra></extra>',
-                hoverlabel=dict(
-                    font=dict(
-                        color=myColors['fontColor'],
-                    )
-                ),
+    locs = list(loc_ref)
+    sorted_locs = [locs[i] for i in np.argsort([loc_ref[loc]['carbonEmissions'] for loc in locs])]
+    carbonEmissions = [loc_ref[loc]['carbonEmissions'] for loc in sorted_locs]
 
-            )
-        ],
-        layout = layout_bar
+    return figure_from_template(
+        bar_template,
+        x=[loc_ref[loc]['name'] for loc in sorted_locs],
+        y=carbonEmissions,
+        marker=dict(
+            color=carbonEmissions,
+            line=dict(width=[4 if loc == 'You' else 0 for loc in sorted_locs]),
+        ),
     )
 
-    return fig
-
 ### UPDATE BAR CHARTCPU
-@app.callback(
-    Output("barPlotComparison_cores", "figure"),
-    [Input("aggregate_data", "data")],
-)
+@results_callback(Output("barPlotComparison_cores", "figure"))
+@results_cache.cached()
 def create_bar_chart_cores(aggData):
-    layout_bar = copy.deepcopy(layout_plots)
-
-    layout_bar['margin']['t'] = 60
-
-    layout_bar['xaxis'] = dict(
-        color=myColors['fontColor'],
-    )
-
-    layout_bar['yaxis'] = dict(
-        color=myColors['fontColor'],
-        showspikes=False,
-        showgrid=True,
-        gridcolor=myColors['plotGrid'],
-    )
-
     if aggData['coreType'] is None:
-        return go.Figure()
+        return empty_figure
 
     else:
 
         if aggData['coreType'] == 'GPU':
-            layout_bar['yaxis']['title'] = dict(text='Power draw (W)')
-
             list_cores = [
                 'Jetson AGX Xavier',
                 'Tesla T4',
@@ -854,8 +1029,6 @@ def create_bar_chart_cores(aggData):
             ]
 
         else:
-            layout_bar['yaxis']['title'] = dict(text='Power draw per core (W)')
-
             list_cores = [
                 'Ryzen 5 3500U',
                 'Xeon Platinum 9282',
@@ -874,122 +1047,332 @@ def create_bar_chart_cores(aggData):
         if aggData['coreModel'] not in list_cores:
             list_cores.append(aggData['coreModel'])
 
-        power_list = []
-
-        # calculate carbon emissions for each location
-        if aggData['coreType'] == 'GPU':
-            for gpu in list_cores:
-                if gpu == 'other':
-                    power_list.append(aggData['corePower'])
-                else:
-                    power_list.append(gpu_df.loc[gpu_df.model == gpu, 'TDP_per_core'].values[0])
-        else:
-            for cpu in list_cores:
-                if cpu == 'other':
-                    power_list.append(aggData['corePower'])
-                else:
-                    power_list.append(cpu_df.loc[cpu_df.model == cpu, 'TDP_per_core'].values[0])
-
-        power_df = pd.DataFrame(dict(coreModel=list_cores, corePower=power_list))
-
-        power_df.sort_values(by=['corePower'], inplace=True)
-
-        power_df.set_index('coreModel', inplace=True)
-
-        lines_thickness = [0] * len(power_df)
-        lines_thickness[power_df.index.get_loc(aggData['coreModel'])] = 4
-
-        fig = go.Figure(
-            data = [
-                go.Bar(
-                    x=list(power_df.index),
-                    y=power_df.corePower.values,
-                    marker = dict(
-                        color=power_df.corePower.values,
-                        colorscale='OrRd',
-                        line=dict(
-                            width=lines_thickness,
-                            color=myColors['fontColor'],
-                        )
-                    ),
-                    hovertemplate='%{y:.1f} W<extra></extra>',
-                    hoverlabel=dict(
-                        font=dict(
-                            color=myColors['fontColor'],
-                        )
-                    ),
-
-                )
-            ],
-            layout = layout_bar
+        # get the power draw of each model
+        lookups = reference_store.current.lookups
+        power_dict = dict()
+        for coreModel in list_cores:
+            if coreModel == 'other':
+                power_dict[coreModel] = aggData['corePower']
+            else:
+                power_dict[coreModel] = lookups.tdp[(aggData['coreType'], coreModel)]
+
+        sorted_cores = [list_cores[i] for i in np.argsort([power_dict[coreModel] for coreModel in list_cores])]
+        power_list = [power_dict[coreModel] for coreModel in sorted_cores]
+
+        return figure_from_template(
+            barCores_templates['GPU' if aggData['coreType'] == 'GPU' else 'CPU'],
+            x=sorted_cores,
+            y=power_list,
+            marker=dict(
+                color=power_list,
+                line=dict(width=[4 if coreModel == aggData['coreModel'] else 0 for coreModel in sorted_cores]),
+            ),
         )
 
-        return fig
-
 
 ### UPDATE THE REPORT TEXT ###
 
-@app.callback(
-    Output('report_markdown', 'children'),
-    [Input("aggregate_data", "data")],
-)
+@results_callback(Output('report_markdown', 'children'))
+@results_cache.cached()
 def fillin_report_text(aggData):
 
     if aggData['n_cores'] is None:
         return('')
 
     else:
+        # same values as the sentence of the command-line tool, see calculator.report_fields
+        myText = '''
+        > This algorithm runs in {} on {} {}{} {},
+        > which draws {:,.2f} kWh. 
+        > Based in {}{}{},{} this produces {:,.0f} g of CO2e, which is equivalent to {:.2f} tree-months
+        (calculated using green-algorithms.org v1.0 \\[1\\]).
+        '''.format(*report_fields(aggData, reference_store.current.lookups))
 
-        minutes = aggData['runTime_min']
-        hours = aggData['runTime_hours']
-
-        if (minutes > 0)&(hours>0):
-            textRuntime = "{}h and {}min".format(hours, minutes)
-        elif (hours > 0):
-            textRuntime = "{}h".format(hours)
-        else:
-            textRuntime = "{}min".format(minutes)
-
-
-        if aggData['n_cores'] > 1:
-            suffixProcessor = 's'
-
-        else:
-            suffixProcessor = ''
+        return myText
 
-        country = CI_df.loc[CI_df.location == aggData['location'], 'countryName'].values[0]
-        region = CI_df.loc[CI_df.location == aggData['location'], 'regionName'].values[0]
+### REGISTER THE RESULTS CALLBACKS ###
 
-        if region == 'Any':
-            textRegion = ''
-        else:
-            textRegion = ' ({})'.format(region)
+if consolidated_results:
+    @app.callback(
+        [output_ for output, _ in results_callbacks
+         for output_ in (output if isinstance(output, list) else [output])],
+        [Input("aggregate_data", "data")],
+    )
+    def update_results(aggData):
+        outputs = []
+        for output, function in results_callbacks:
+            if isinstance(output, list):
+                outputs.extend(function(aggData))
+            else:
+                outputs.append(function(aggData))
+        return outputs
+else:
+    for output, function in results_callbacks:
+        app.callback(output, [Input("aggregate_data", "data")])(function)
+
+### WHEN TO RUN IT ###
+
+def format_time(t):
+    # seconds since the epoch -> ISO 8601, UTC
+    return str(np.datetime64(int(round(t)), 's')) + 'Z'
+
+def find_start_time(aggData, earliest, latest):
+    '''
+    Lowest-emission start time, between earliest and latest, of the job described by aggData
+    (the output of aggregate_input_values), and the emissions saved compared to starting at earliest.
+    Raises KeyError if there is no hourly carbon intensity for its location,
+    and ValueError if the series doesn't cover the window.
+    '''
+    CI_series = reference_store.current.CI_series
+    if (CI_series is None) or (aggData['location'] not in CI_series):
+        raise KeyError("No hourly carbon intensity for {}".format(aggData['location']))
+
+    result = CI_series[aggData['location']].best_start(aggData['runTime'], earliest, latest)
+    energy = aggData['energy_needed'] # in kWh
+    return dict(
+        location=aggData['location'],
+        runTime=aggData['runTime'],
+        start=format_time(result.start),
+        carbonIntensity=result.carbonIntensity,
+        carbonEmissions=energy * result.carbonIntensity,
+        start_now=format_time(result.start_now),
+        carbonIntensity_now=result.carbonIntensity_now,
+        carbonEmissions_now=energy * result.carbonIntensity_now,
+        carbonEmissions_saved=energy * (result.carbonIntensity_now - result.carbonIntensity),
+        data_version=aggData['data_version'],
+    )
 
-        if country in ['United States of America', 'United Kingdom']:
-            prefixCountry = 'the '
-        else:
-            prefixCountry = ''
+def update_startTime_text(n_clicks, startWindow, aggData):
+    '''
+    Best start time of the job of the form, when asked for (it isn't updated with every input).
+    '''
+    if (not n_clicks) or (aggData is None) or (aggData['location'] is None) or (startWindow is None):
+        return ''
 
-        if aggData['PSF'] > 1:
-            textPSF = ' and ran {} times in total,'.format(aggData['PSF'])
+    now = time.time()
+    try:
+        output = find_start_time(aggData, now, now + startWindow * 3600)
+    except KeyError:
+        return "_There is no hourly carbon intensity for this location._"
+    except ValueError:
+        return "_The hourly carbon intensity of this location doesn't cover the next {} hours._".format(startWindow)
+
+    job = "{}h {}min in {}".format(aggData['runTime_hours'], aggData['runTime_min'], aggData['location'])
+    if output['carbonEmissions_saved'] <= 0:
+        return "> Now is the best time to run this job ({}).".format(job)
+
+    return '''
+    > Starting this job ({}) at __{} UTC__ instead of now would emit __{:,.0f} g__ of CO2e instead of {:,.0f} g 
+    ({:,.0f} g less).
+    '''.format(job, output['start'][:-4].replace('T', ' '), output['carbonEmissions'],
+               output['carbonEmissions_now'], output['carbonEmissions_saved'])
+
+if startTime_panel:
+    app.callback(
+        Output('startTime_markdown', 'children'),
+        [Input('startTime_button', 'n_clicks'),
+         Input('startWindow_input', 'value')],
+        [State('aggregate_data', 'data')]
+    )(update_startTime_text)
+
+### WHERE TO RUN IT ###
+
+# Scopes of the ranking of the regions
+REGIONS_SCOPES = ['provider', 'datacenters', 'all']
+
+def rank_regions(aggData, scope, selected_provider=None):
+    '''
+    Every region where the job described by aggData could run, from the lowest to the highest emissions:
+    the datacenters of selected_provider ('provider', same as 'all' without datacenters), of every provider
+    ('datacenters'), or every location ('all'), with the PUE of each provider.
+    '''
+    appData = reference_store.current
+    if scope == 'provider':
+        key = selected_provider if selected_provider in appData.regions else ALL_PROVIDERS
+    elif scope == 'datacenters':
+        key = ALL_DATACENTERS
+    elif scope == 'all':
+        key = ALL_PROVIDERS
+    else:
+        raise ValueError("Unknown scope: {}, expected one of {}".format(scope, REGIONS_SCOPES))
+
+    regions = appData.regions[key]
+    order, carbonEmissions = rank_locations(aggData['energy_needed'], aggData['PUE'],
+                                            regions.carbonIntensity, regions.PUE)
+    PUE = np.where(np.isnan(regions.PUE), aggData['PUE'], regions.PUE)
+
+    ranking = []
+    for rank, i in enumerate(order, start=1):
+        locationInfo = appData.lookups.locations[regions.locations[i]]
+        ranking.append(dict(
+            rank=rank,
+            location=str(regions.locations[i]),
+            provider=str(regions.providers[i]) or None,
+            countryName=locationInfo.countryName,
+            regionName=locationInfo.regionName,
+            carbonIntensity=float(regions.carbonIntensity[i]),
+            PUE=float(PUE[i]),
+            carbonEmissions=float(carbonEmissions[i]),
+        ))
+    return ranking
+
+# Only the `top` regions with the lowest emissions are shown (and the current location, if it isn't one of them),
+# and only once the ranking is opened: it is then updated in the browser, like the results
+@clientside_or_server_callback(
+    Output('regionsRanking_div', 'children'),
+    [Input('aggregate_data', 'data'),
+     Input('regionsScope_radio', 'value'),
+     Input('regionsTop_radio', 'value'),
+     Input('regionsShow_checklist', 'value')],
+    [State('provider_dropdown', 'value')],
+    clientside_state=[State('reference_data', 'data'), State('provider_dropdown', 'value')]
+)
+def update_regions_ranking(aggData, scope, top, show, selected_provider):
+    if (not show) or (aggData is None) or (aggData['location'] is None):
+        return ''
+
+    ranking = rank_regions(aggData, scope, selected_provider)
+    if top != 'all':
+        ranking = ranking[:top] + [row for row in ranking[top:] if row['location'] == aggData['location']]
+    showProvider = scope == 'datacenters'
+
+    header = ["#", "Region"] + (["Provider"] if showProvider else []) + \
+             ["Carbon intensity (gCO2e/kWh)", "PUE", "Emissions (gCO2e)", "Compared to yours"]
+    rows = []
+    for row in ranking:
+        region = row['countryName'] if row['regionName'] == 'Any' else \
+            "{} ({})".format(row['countryName'], row['regionName'])
+        cells = [row['rank'], region] + ([row['provider']] if showProvider else []) + [
+            "{:,.0f}".format(row['carbonIntensity']),
+            "{:.2f}".format(row['PUE']),
+            "{:,.0f}".format(row['carbonEmissions']),
+            "{:+,.0f} %".format((row['carbonEmissions'] / aggData['carbonEmissions'] - 1) * 100)
+            if aggData['carbonEmissions'] > 0 else '',
+        ]
+        if row['location'] == aggData['location']:
+            rows.append(html.Tr([html.Td(x) for x in cells], className='current-location'))
         else:
-            textPSF = ''
-
-        myText = '''
-        > This algorithm runs in {} on {} {}{} {},
-        > which draws {:,.2f} kWh. 
-        > Based in {}{}{},{} this produces {:,.0f} g of CO2e, which is equivalent to {:.2f} tree-months
-        (calculated using green-algorithms.org v1.0 \[1\]).
-        '''.format(
-            textRuntime,
-            aggData['n_cores'], aggData['coreType'], suffixProcessor, aggData['coreModel'],
-            aggData['energy_needed'],
-            prefixCountry, country, textRegion,
-            textPSF,
-            aggData['carbonEmissions'], aggData['n_treeMonths']
-        )
+            rows.append(html.Tr([html.Td(x) for x in cells]))
+
+    return html.Table([html.Thead(html.Tr([html.Th(x) for x in header])), html.Tbody(rows)])
+
+#######
+# API #
+#######
+
+def api_error(message, status=400):
+    response = flask.jsonify(error=message)
+    response.status_code = status
+    return response
+
+def aggregate_job(job):
+    '''
+    aggregate_input_values of a job validated by footprint_api.validate_job.
+    Raises KeyError if a model or the location isn't in the reference data.
+    '''
+    error = check_references(job, reference_store.current.lookups)
+    if error is not None:
+        raise KeyError(error)
+    # the tdp is only used for the models set to 'other', but the form always has one
+    inputs = dict(job, tdp=job['tdp'] if job.get('tdp') is not None else 0)
+    return aggregate_input_values(*[inputs.get(x) for x in JOB_INPUTS], None)
+
+# Footprint of a job, with the fields of the aggregate_data Store, e.g.
+# {"coreType": "GPU", "coreModel": "Tesla V100", "n_cores": 4, "memory": 64, "runTime_hours": 6,
+#  "runTime_min": 0, "location": "GB", "usage": 1, "PUE": 1.67, "PSF": 1, "selected_platform": "localServer"}
+# (tdp is needed when coreModel is "other", selected_provider is optional), see footprint_api.py
+@server.route('/api/v1/footprint', methods=['POST'])
+def api_footprint():
+    try:
+        return flask.jsonify(aggregate_job(validate_job(flask.request.get_json(silent=True))))
+    except KeyError as e:
+        return api_error(str(e.args[0]), status=404)
+    except ValueError as e:
+        return api_error(str(e))
+
+# Footprints of a list of jobs, sent as {"jobs": [...]} (up to MAX_BATCH), scored at once.
+# results are in the same order, each being the fields of the aggregate_data Store or {"error": ...}
+@server.route('/api/v1/footprint/batch', methods=['POST'])
+def api_footprint_batch():
+    body = flask.request.get_json(silent=True)
+    if (not isinstance(body, dict)) or (not isinstance(body.get('jobs'), list)):
+        return api_error("The body must be a JSON object with a list of jobs")
+    jobs = body['jobs']
+    if len(jobs) > MAX_BATCH:
+        return api_error("At most {} jobs per request".format(MAX_BATCH), status=413)
+
+    appData = reference_store.current
+    results = score_batch(jobs, appData.lookups, appData.refValues_dict, appData.revision,
+                          carbonIntensity=ci_provider.carbonIntensity if ci_provider.live else None)
+    return flask.jsonify(results=results, data_version=appData.revision)
+
+# Same as /api/v1/footprint/batch for any number of jobs, sent as newline-delimited JSON (one job per line):
+# the results are streamed back as newline-delimited JSON while the body is read, STREAM_CHUNK jobs at a time
+# (application/x-ndjson isn't compressed, which would hold the whole response)
+@server.route('/api/v1/footprint/stream', methods=['POST'])
+def api_footprint_stream():
+    appData = reference_store.current
+    results = score_stream(read_lines(flask.request.stream), appData.lookups, appData.refValues_dict, appData.revision,
+                           carbonIntensity=ci_provider.carbonIntensity if ci_provider.live else None)
+    return flask.Response(flask.stream_with_context(results), mimetype='application/x-ndjson')
+
+# Same as /api/v1/footprint/stream, in columns: the body is an Arrow IPC stream whose columns are the inputs,
+# and the results are an Arrow IPC stream with a column per field of the aggregate_data Store, and an error column.
+# Each record batch is scored at once and sent back before the next one is read. Needs pyarrow.
+@server.route('/api/v1/footprint/arrow', methods=['POST'])
+def api_footprint_arrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return api_error("Arrow isn't available on this server", status=501)
 
-        return myText
+    try:
+        reader = pa.ipc.open_stream(flask.request.stream)
+        check_arrow_schema(reader.schema)
+    except pa.ArrowInvalid as e:
+        return api_error("The body must be an Arrow IPC stream ({})".format(e))
+    except ValueError as e:
+        return api_error(str(e))
+
+    appData = reference_store.current
+    results = score_arrow(reader, appData.lookups, appData.refValues_dict, appData.revision,
+                          carbonIntensity=ci_provider.carbonIntensity if ci_provider.live else None)
+    return flask.Response(flask.stream_with_context(results), mimetype=ARROW_MIMETYPE)
+
+# Lowest-emission start time of a job, e.g.
+# {"coreType": "GPU", "coreModel": "Tesla V100", "n_cores": 4, "memory": 64, "runTime_hours": 6,
+#  "runTime_min": 0, "location": "GB", "usage": 1, "PUE": 1.67, "PSF": 1, "selected_platform": "localServer",
+#  "earliest": "2020-06-01T00:00Z", "latest": "2020-06-02T00:00Z"}
+# earliest is now by default, latest is 24h after earliest by default
+@server.route('/api/v1/start-time', methods=['POST'])
+def api_start_time():
+    try:
+        body = validate_job(flask.request.get_json(silent=True))
+        earliest = float(to_seconds(body.get('earliest', time.time())))
+        latest = float(to_seconds(body['latest'])) if 'latest' in body else earliest + 24 * 3600
+        aggData = aggregate_job(body)
+        return flask.jsonify(find_start_time(aggData, earliest, latest))
+    except KeyError as e:
+        # unknown location or model, or no hourly carbon intensity (from find_start_time)
+        return api_error(str(e.args[0]), status=404)
+    except (ValueError, TypeError) as e:
+        return api_error(str(e))
+
+# Emissions of a job in every region, from the lowest: same inputs as /api/v1/footprint,
+# plus "scope": "provider" (default), "datacenters" or "all", see rank_regions
+@server.route('/api/v1/regions', methods=['POST'])
+def api_regions():
+    try:
+        body = validate_job(flask.request.get_json(silent=True))
+        aggData = aggregate_job(body)
+        scope = body.get('scope', 'provider')
+        return flask.jsonify(scope=scope, location=aggData['location'], carbonEmissions=aggData['carbonEmissions'],
+                             ranking=rank_regions(aggData, scope, body.get('selected_provider')),
+                             data_version=aggData['data_version'])
+    except KeyError as e:
+        return api_error(str(e.args[0]), status=404)
+    except (ValueError, TypeError) as e:
+        return api_error(str(e))
 
 if __name__ == '__main__':
     # allows app to update when code is changed!
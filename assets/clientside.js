@@ -0,0 +1,254 @@
+// Clientside versions of callbacks of app.py, registered by clientside_or_server_callback
+// They must give the same results as their Python counterparts, which remain the reference.
+
+// Python's format(x, ',.Nf') (or '+,.Nf' with sign): toFixed rounds exact ties up, Python to the even digit
+function formatNumber(x, digits, sign) {
+    var negative = (x < 0) || Object.is(x, -0);
+    var text = Math.abs(x).toFixed(digits);
+    var exact = Math.abs(x).toFixed(100);
+    var cut = exact.indexOf('.') + 1 + digits;
+    if (/^50*$/.test(exact.slice(cut)) && (Number(text.slice(-1)) % 2 === 1)) {
+        text = exact.slice(0, digits > 0 ? cut : cut - 1);
+    }
+    var parts = text.split('.');
+    parts[0] = parts[0].replace(/\B(?=(\d{3})+(?!\d))/g, ',');
+    return (negative ? '-' : (sign ? '+' : '')) + parts.join('.');
+}
+
+// Dash component, as sent by the server
+function htmlComponent(type, props) {
+    return {'type': type, 'namespace': 'dash_html_components', 'props': props};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    clientside: {
+
+        // Same as display_provider in app.py
+        display_provider: function(selected_platform) {
+            if (selected_platform === 'cloudComputing') {
+                return {'display': 'block'};
+            } else {
+                return {'display': 'none'};
+            }
+        },
+
+        // Same as display_TDP in app.py
+        display_TDP: function(selected_coreModel) {
+            if (selected_coreModel === 'other') {
+                return {'display': 'flex'};
+            } else {
+                return {'display': 'none'};
+            }
+        },
+
+        // Same as tdp_default in app.py
+        tdp_default: function(selected_coreType) {
+            if (selected_coreType === 'GPU') {
+                return 200;
+            } else {
+                return 12;
+            }
+        },
+
+        // Same as display_countryRegion in app.py
+        display_countryRegion: function(selected_continent) {
+            var dictOut = {'display': 'block'};
+            var defaults = {
+                'Africa': ['South Africa', 'ZA'],
+                'Asia': ['China', 'CN'],
+                'Europe': ['United Kingdom', 'GB'],
+                'North America': ['United States of America', 'US'],
+                'Oceania': ['Australia', 'AU'],
+                'South America': ['Brazil', 'BR']
+            };
+            if (defaults.hasOwnProperty(selected_continent)) {
+                return [dictOut, dictOut].concat(defaults[selected_continent]);
+            } else { // selected_continent == 'World'
+                return [{'display': 'none'}, {'display': 'none'}, 'Any', 'WORLD'];
+            }
+        },
+
+        // Same as display_usage_input, display_pue_input and display_PSF_input in app.py
+        display_usage_input: function(answer_usage, referenceData) {
+            return [{'display': answer_usage === 'No' ? 'none' : 'block'}, referenceData.defaults.usage];
+        },
+
+        display_pue_input: function(answer_pue, referenceData) {
+            return [{'display': answer_pue === 'No' ? 'none' : 'block'}, referenceData.defaults.PUE];
+        },
+
+        display_PSF_input: function(answer_PSF, referenceData) {
+            return [{'display': answer_PSF === 'No' ? 'none' : 'block'}, referenceData.defaults.PSF];
+        },
+
+        // Same as aggregate_input_values in app.py (and compute_footprint in calculator.py)
+        // referenceData is the 'reference_data' Store, see reference_data.clientside_payload
+        aggregate_input_values: function(coreType, coreModel, n_cores, tdp, memory, runTime_hours, runTime_min,
+                                         location, usage, PUE, PSF, selected_platform, selected_provider,
+                                         referenceData) {
+            var output = {};
+
+            var inputs = [coreType, coreModel, n_cores, tdp, memory, runTime_hours, runTime_min, location,
+                          usage, PUE, PSF, selected_platform];
+
+            if (inputs.some(function(x) { return (x === null) || (x === undefined); })) {
+                console.log('Not enough information to display the results');
+
+                ['coreType', 'coreModel', 'n_cores', 'corePower', 'memory', 'runTime_hours', 'runTime_min',
+                 'runTime', 'location', 'carbonIntensity', 'usage', 'PUE', 'PSF', 'selected_platform',
+                 'flying_text'].forEach(function(key) { output[key] = null; });
+                ['carbonEmissions', 'CE_core', 'CE_memory', 'n_treeMonths', 'flying_context', 'nkm_drivingUS',
+                 'nkm_drivingEU', 'nkm_train', 'energy_needed', 'power_needed'].forEach(function(key) {
+                    output[key] = 0;
+                });
+                output['data_version'] = referenceData.revision;
+
+                return output;
+            }
+
+            var runTime = runTime_hours + runTime_min/60.;
+
+            if (!(location in referenceData.CI)) {
+                throw new Error('Unknown location: ' + location);
+            }
+            var carbonIntensity = referenceData.CI[location];
+
+            var PUE_used;
+            if (selected_platform === 'personalComputer') {
+                PUE_used = 1;
+            } else if (selected_provider in referenceData.PUE) {
+                PUE_used = referenceData.PUE[selected_provider];
+            } else {
+                PUE_used = PUE;
+            }
+
+            var corePower;
+            if (coreModel === 'other') {
+                corePower = tdp;
+            } else if ((coreType in referenceData.cores) && (coreModel in referenceData.cores[coreType])) {
+                corePower = referenceData.cores[coreType][coreModel];
+            } else {
+                throw new Error('Unknown ' + coreType + ' model: ' + coreModel);
+            }
+
+            var refValues = referenceData.refValues;
+
+            // Power needed, in Watt
+            var powerNeeded_core = PUE_used * (n_cores * corePower) * usage;
+            var powerNeeded_memory = PUE_used * (memory * refValues['memoryPower']);
+            var powerNeeded = powerNeeded_core + powerNeeded_memory;
+
+            // Energy needed, in kWh (so dividing by 1000 to convert to kW)
+            var energyNeeded_core = runTime * powerNeeded_core * PSF / 1000;
+            var energyNeeded_memory = runTime * powerNeeded_memory * PSF / 1000;
+            var energyNeeded = runTime * powerNeeded * PSF / 1000;
+
+            // Carbon emissions: carbonIntensity is in g per kWh, so results in gCO2
+            var carbonEmissions = energyNeeded * carbonIntensity;
+
+            output['coreType'] = coreType;
+            output['coreModel'] = coreModel;
+            output['n_cores'] = n_cores;
+            output['corePower'] = corePower;
+            output['memory'] = memory;
+            output['runTime_hours'] = runTime_hours;
+            output['runTime_min'] = runTime_min;
+            output['runTime'] = runTime;
+            output['location'] = location;
+            output['carbonIntensity'] = carbonIntensity;
+            output['PUE'] = PUE_used;
+            output['PSF'] = PSF;
+            output['selected_platform'] = selected_platform;
+            output['carbonEmissions'] = carbonEmissions;
+            output['CE_core'] = energyNeeded_core * carbonIntensity;
+            output['CE_memory'] = energyNeeded_memory * carbonIntensity;
+            output['energy_needed'] = energyNeeded;
+            output['power_needed'] = powerNeeded;
+
+            // Context
+            output['n_treeMonths'] = carbonEmissions / refValues['treeYear'] * 12;
+
+            output['nkm_drivingUS'] = carbonEmissions / refValues['passengerCar_US_perkm'];
+            output['nkm_drivingEU'] = carbonEmissions / refValues['passengerCar_EU_perkm'];
+            output['nkm_train'] = carbonEmissions / refValues['train_perkm'];
+
+            if (carbonEmissions < 0.5 * refValues['flight_NY-SF']) {
+                output['flying_context'] = carbonEmissions / refValues['flight_PAR-LON'];
+                output['flying_text'] = "Paris-London";
+            } else if (carbonEmissions < 0.5 * refValues['flight_NYC-MEL']) {
+                output['flying_context'] = carbonEmissions / refValues['flight_NY-SF'];
+                output['flying_text'] = "NYC-San Francisco";
+            } else {
+                output['flying_context'] = carbonEmissions / refValues['flight_NYC-MEL'];
+                output['flying_text'] = "NYC-Melbourne";
+            }
+
+            output['data_version'] = referenceData.revision;
+
+            return output;
+        },
+
+        // Same as update_regions_ranking in app.py (and rank_regions, footprint.rank_locations)
+        // referenceData.regions is the region index, see reference_data.clientside_payload
+        update_regions_ranking: function(aggData, scope, top, show, referenceData, selected_provider) {
+            if (!show || (show.length === 0) || !aggData || (aggData['location'] === null)) {
+                return '';
+            }
+
+            var regions = referenceData.regions;
+            var index;
+            if (scope === 'provider') {
+                index = regions.providers.hasOwnProperty(selected_provider) ? regions.providers[selected_provider]
+                                                                            : regions.all;
+            } else if (scope === 'datacenters') {
+                index = regions.datacenters;
+            } else if (scope === 'all') {
+                index = regions.all;
+            } else {
+                throw new Error('Unknown scope: ' + scope);
+            }
+
+            // the energy is proportional to the PUE
+            var PUE = index.PUE.map(function(x) { return x === null ? aggData['PUE'] : x; });
+            var energy = aggData['energy_needed'] / aggData['PUE'];
+            var carbonEmissions = index.carbonIntensity.map(function(x, i) { return energy * (PUE[i] * x); });
+            var order = carbonEmissions.map(function(x, i) { return i; });
+            order.sort(function(a, b) { return (carbonEmissions[a] - carbonEmissions[b]) || (a - b); });
+
+            var ranking = order.map(function(i, k) { return {'rank': k + 1, 'i': i}; });
+            if (top !== 'all') {
+                ranking = ranking.slice(0, top).concat(ranking.slice(top).filter(function(row) {
+                    return index.locations[row.i] === aggData['location'];
+                }));
+            }
+
+            var showProvider = scope === 'datacenters';
+            var header = ['#', 'Region'].concat(showProvider ? ['Provider'] : [],
+                ['Carbon intensity (gCO2e/kWh)', 'PUE', 'Emissions (gCO2e)', 'Compared to yours']);
+            var rows = ranking.map(function(row) {
+                var i = row.i;
+                var names = regions.names[index.locations[i]];
+                var region = names[1] === 'Any' ? names[0] : names[0] + ' (' + names[1] + ')';
+                var cells = [row.rank, region].concat(showProvider ? [index.providers[i] || null] : [], [
+                    formatNumber(index.carbonIntensity[i], 0),
+                    formatNumber(PUE[i], 2),
+                    formatNumber(carbonEmissions[i], 0),
+                    aggData['carbonEmissions'] > 0 ?
+                        formatNumber((carbonEmissions[i] / aggData['carbonEmissions'] - 1) * 100, 0, true) + ' %' : ''
+                ]);
+                var props = {'children': cells.map(function(x) { return htmlComponent('Td', {'children': x}); })};
+                if (index.locations[i] === aggData['location']) {
+                    props['className'] = 'current-location';
+                }
+                return htmlComponent('Tr', props);
+            });
+
+            return htmlComponent('Table', {'children': [
+                htmlComponent('Thead', {'children': htmlComponent('Tr', {'children': header.map(function(x) {
+                    return htmlComponent('Th', {'children': x});
+                })})}),
+                htmlComponent('Tbody', {'children': rows})
+            ]});
+        }
+    }
+});
@@ -0,0 +1,42 @@
+// Figures that are not part of the layout (e.g. the carbon intensity map), see mapCI_url in app.py.
+// Each element with a data-figure-url attribute gets its graph filled in with the figure at that url.
+// If the figure can't be loaded, the placeholder figure of the layout is kept.
+
+(function() {
+    var done = new Set(); // graphs loaded, or given up on
+
+    function loadFigures() {
+        var containers = document.querySelectorAll('[data-figure-url]');
+        containers.forEach(function(container) {
+            var graphDiv = container.querySelector('.js-plotly-plot');
+            var url = container.getAttribute('data-figure-url');
+            if (!graphDiv || !window.Plotly || done.has(graphDiv)) {
+                return;
+            }
+            done.add(graphDiv);
+
+            fetch(url, {credentials: 'same-origin'})
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error('HTTP ' + response.status);
+                    }
+                    return response.json();
+                })
+                .then(function(figure) {
+                    window.Plotly.react(graphDiv, figure.data, figure.layout, {responsive: true});
+                })
+                .catch(function(error) {
+                    console.error('Could not load ' + url, error);
+                });
+        });
+
+        // every figure has been requested, there is nothing left to watch for
+        if ((containers.length > 0) && (done.size >= containers.length)) {
+            observer.disconnect();
+        }
+    }
+
+    // The graphs are rendered by Dash after the page has loaded
+    var observer = new MutationObserver(loadFigures);
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+})();
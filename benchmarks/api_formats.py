@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Compares the formats of the footprint API on the same jobs: JSON batches (/api/v1/footprint/batch),
+# newline-delimited JSON (/api/v1/footprint/stream) and Arrow IPC streams (/api/v1/footprint/arrow).
+# The requests are sent to the app in this process (Flask test client), so that the encoding, parsing,
+# scoring and serialisation are measured, but not the network.
+#
+# Usage: python benchmarks/api_formats.py [n_jobs]
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BATCH_SIZE = 10000 # jobs per request of /api/v1/footprint/batch (at most MAX_BATCH)
+
+def make_jobs(n, seed=0):
+    '''
+    Columns of n jobs (as numpy arrays), with the models and locations of the reference data.
+    '''
+    rng = np.random.RandomState(seed)
+    models = np.array(['Xeon E5-2683 v4', 'Xeon Gold 6142', 'Core i7-8700K'])
+    locations = np.array(['GB', 'FR', 'US-CA', 'DE', 'IN'])
+    return dict(
+        coreType=np.full(n, 'CPU'),
+        coreModel=models[rng.randint(0, len(models), n)],
+        n_cores=rng.randint(1, 64, n),
+        memory=rng.randint(1, 256, n).astype(float),
+        runTime_hours=rng.randint(0, 48, n),
+        runTime_min=rng.randint(0, 60, n),
+        location=locations[rng.randint(0, len(locations), n)],
+        usage=np.ones(n),
+        PUE=np.full(n, 1.67),
+        PSF=np.ones(n),
+        selected_platform=np.full(n, 'localServer'),
+    )
+
+def job_dicts(columns):
+    lists = {name: values.tolist() for name, values in columns.items()}
+    n = len(next(iter(lists.values())))
+    return [{name: values[i] for name, values in lists.items()} for i in range(n)]
+
+def run_batch(client, columns):
+    jobs = job_dicts(columns)
+    sent = received = 0
+    carbonEmissions = []
+    for i in range(0, len(jobs), BATCH_SIZE):
+        body = json.dumps(dict(jobs=jobs[i:i + BATCH_SIZE])).encode('utf-8')
+        response = client.post('/api/v1/footprint/batch', data=body, content_type='application/json')
+        data = response.get_data()
+        sent += len(body)
+        received += len(data)
+        carbonEmissions += [x['carbonEmissions'] for x in json.loads(data)['results']]
+    return carbonEmissions, sent, received
+
+def run_stream(client, columns):
+    body = ''.join(json.dumps(job) + '\n' for job in job_dicts(columns)).encode('utf-8')
+    response = client.post('/api/v1/footprint/stream', data=body, content_type='application/x-ndjson')
+    data = response.get_data()
+    carbonEmissions = [json.loads(line)['carbonEmissions'] for line in data.splitlines()]
+    return carbonEmissions, len(body), len(data)
+
+def run_arrow(client, columns):
+    from footprint_api import ARROW_MIMETYPE
+
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=65536):
+            writer.write_batch(batch)
+    body = sink.getvalue().to_pybytes()
+    response = client.post('/api/v1/footprint/arrow', data=body, content_type=ARROW_MIMETYPE)
+    data = response.get_data()
+    results = pa.ipc.open_stream(data).read_all()
+    return results['carbonEmissions'].to_pylist(), len(body), len(data)
+
+FORMATS = [
+    ('JSON batches', run_batch),
+    ('NDJSON stream', run_stream),
+    ('Arrow stream', run_arrow),
+]
+
+def main(n):
+    # app.py reads data/ from the working directory
+    os.environ.setdefault('GREEN_ALGORITHMS_RELOAD_INTERVAL', '0')
+    os.chdir(ROOT)
+    import app
+
+    client = app.server.test_client()
+    columns = make_jobs(n)
+    # a first small request of each format, so that the imports aren't measured
+    for _, run in FORMATS:
+        run(client, make_jobs(10))
+
+    print("{:,} jobs".format(n))
+    print("{:<15}{:>10}{:>14}{:>12}{:>16}".format("format", "seconds", "jobs/s", "sent (MB)", "received (MB)"))
+    reference = None
+    timings = dict()
+    for name, run in FORMATS:
+        start = time.perf_counter()
+        carbonEmissions, sent, received = run(client, columns)
+        timings[name] = time.perf_counter() - start
+        print("{:<15}{:>10.2f}{:>14,.0f}{:>12.1f}{:>16.1f}".format(name, timings[name], n / timings[name],
+                                                                  sent / 1e6, received / 1e6))
+        if reference is None:
+            reference = carbonEmissions
+        elif carbonEmissions != reference:
+            print("ERROR the results of {} differ from those of {}".format(name, FORMATS[0][0]), file=sys.stderr)
+            return 1
+
+    print("Arrow is {:.0f} times faster than NDJSON, {:.0f} times faster than JSON batches".format(
+        timings['NDJSON stream'] / timings['Arrow stream'], timings['JSON batches'] / timings['Arrow stream']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000))
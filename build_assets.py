@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Writes gzip and brotli versions of the static files of the app into precompressed/,
+# where PrecompressedFiles (see precompressed.py) serves them from:
+#   - precompressed/assets/...: the files of assets/
+#   - precompressed/_dash-component-suites/<package>/...: the Dash and Plotly bundles
+# so that they are compressed once, at the highest level, instead of never or at every request.
+# Files that are already up to date are skipped. Brotli is optional: without the brotli package only .gz are written.
+#
+# Usage: python build_assets.py [assets_dir]
+
+import gzip
+import importlib.util
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PRECOMPRESSED_DIR = "precompressed"
+EXTENSIONS = ('.css', '.js', '.json', '.svg')
+MIN_SIZE = 1024 # in bytes, smaller files aren't worth it
+
+# Packages whose files Dash serves under /_dash-component-suites/
+# (dash 1.x has a package per library, dash 2.x bundles them all in dash)
+DASH_PACKAGES = ['dash', 'dash_renderer', 'dash_core_components', 'dash_html_components', 'dash_table']
+
+def compress_gzip(data):
+    # mtime=0 so that the compressed bytes only depend on the content
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+COMPRESSORS = [('.gz', compress_gzip)]
+if brotli is not None:
+    COMPRESSORS.append(('.br', compress_brotli))
+
+def package_dir(name):
+    '''
+    Directory of an installed package, without importing it (None if it isn't installed).
+    '''
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if (spec is None) or (not spec.submodule_search_locations):
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+def static_files(directory):
+    '''
+    Relative paths (with /) of the files of directory worth compressing.
+    '''
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if name.endswith(EXTENSIONS) and os.path.getsize(path) >= MIN_SIZE:
+                yield os.path.relpath(path, directory).replace(os.sep, '/')
+
+def precompress_file(source, target):
+    '''
+    Writes target + '.gz' (and '.br') unless they are newer than source. Returns the number of files written.
+    '''
+    n_written = 0
+    data = None
+    for extension, compress in COMPRESSORS:
+        path = target + extension
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            continue
+        if data is None:
+            with open(source, 'rb') as f:
+                data = f.read()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to it and renamed, as the workers may be reading it
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(compress(data))
+        os.replace(tmp_path, path)
+        n_written += 1
+    return n_written
+
+def sources(assets_dir):
+    '''
+    (source directory, directory in PRECOMPRESSED_DIR) of everything that is precompressed.
+    '''
+    output = [(assets_dir, 'assets')]
+    for name in DASH_PACKAGES:
+        directory = package_dir(name)
+        if directory is not None:
+            output.append((directory, '_dash-component-suites/' + name))
+    return output
+
+def main(assets_dir, output_dir=None):
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(assets_dir)), PRECOMPRESSED_DIR)
+
+    n_files = 0
+    n_written = 0
+    for source_dir, target_dir in sources(assets_dir):
+        for path in static_files(source_dir):
+            n_files += 1
+            n_written += precompress_file(os.path.join(source_dir, path), os.path.join(output_dir, target_dir, path))
+
+    print("{} static files, {} compressed files written to {} ({})".format(
+        n_files, n_written, output_dir, ', '.join(extension for extension, _ in COMPRESSORS)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.abspath(''), 'assets')))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Validates the csv files of data/ and compiles them into a single snapshot
+# that the app workers load at startup instead of parsing the csv files.
+# It also maintains CI_ISO3.csv (ISO3 code of each location of CI_aggregated.csv),
+# which is the only step that needs pycountry.
+# If there is a CI_timeseries.csv, it is compiled into CI_timeseries.store as well (see ci_store.py).
+#
+# Usage: python build_data.py [data_dir]
+
+import csv
+import os
+import sys
+
+from reference_data import load_csv_tables, CSV_FILES
+from reference_snapshot import write_snapshot, read_snapshot
+from ci_timeseries import load_CI_timeseries
+from ci_store import CI_STORE_FILE, CIStore, write_CI_store
+
+REQUIRED_COLUMNS = {
+    'cpu': ['model', 'TDP_per_core'],
+    'gpu': ['model', 'TDP_per_core'],
+    'pue': ['provider', 'PUE'],
+    'hardware': ['provider', 'type', 'model'],
+    'CI': ['location', 'continentName', 'countryName', 'regionName', 'carbonIntensity'],
+    'providersNames': ['provider', 'providerName', 'platformType', 'platformName'],
+    'refValues': ['variable', 'value'],
+}
+
+REQUIRED_REFVALUES = ['memoryPower', 'passengerCar_EU_perkm', 'passengerCar_US_perkm', 'train_perkm',
+                      'treeYear', 'flight_NY-SF', 'flight_PAR-LON', 'flight_NYC-MEL']
+
+def iso2_to_iso3(x):
+    import pycountry_convert as pc
+
+    try:
+        output = pc.country_name_to_country_alpha3(pc.country_alpha2_to_country_name(x, cn_name_format="default"),
+                                                   cn_name_format="default")
+    except Exception:
+        output = ''
+    return output
+
+def update_ISO3_file(data_dir):
+    '''
+    Writes the ISO3 code of every location of CI_aggregated.csv into CI_ISO3.csv.
+    Returns the number of locations that had to be resolved with pycountry.
+    '''
+    def read_rows(name):
+        with open(os.path.join(data_dir, name), newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f.readlines()[1:]))
+
+    locations = [row['location'] for row in read_rows(CSV_FILES['CI'])]
+
+    ISO3_path = os.path.join(data_dir, CSV_FILES['CI_ISO3'])
+    known = dict()
+    if os.path.exists(ISO3_path):
+        known = {row['location']: row['ISO3'] for row in read_rows(CSV_FILES['CI_ISO3'])}
+
+    missing = [loc for loc in locations if loc not in known]
+    for loc in missing:
+        known[loc] = iso2_to_iso3(loc)
+
+    if missing or (len(known) != len(locations)):
+        with open(ISO3_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['index', 'Generated by build_data.py, empty if not a country'])
+            writer.writerow(['location', 'ISO3'])
+            for loc in locations:
+                writer.writerow([loc, known[loc]])
+
+    return len(missing)
+
+def validate_tables(tables):
+    '''
+    Returns the list of problems found in the reference tables (empty if they are valid).
+    '''
+    errors = []
+
+    for name, columns in REQUIRED_COLUMNS.items():
+        missing = [col for col in columns if col not in tables[name]]
+        if missing:
+            errors.append("{}: missing columns {}".format(name, missing))
+    if errors:
+        return errors
+
+    def check_unique(name, col):
+        duplicated = tables[name][col][tables[name][col].duplicated()]
+        if len(duplicated) > 0:
+            errors.append("{}: duplicated {} {}".format(name, col, sorted(set(duplicated))))
+
+    def check_numeric(name, col, minimum):
+        values = tables[name][col]
+        if values.dtype.kind not in 'iuf':
+            errors.append("{}: {} is not numeric".format(name, col))
+        elif values.isna().any() or (values < minimum).any():
+            errors.append("{}: {} must be >= {} for every row".format(name, col, minimum))
+
+    for name in ['cpu', 'gpu']:
+        check_unique(name, 'model')
+        check_numeric(name, 'TDP_per_core', 0)
+    check_unique('pue', 'provider')
+    check_numeric('pue', 'PUE', 1)
+    check_unique('CI', 'location')
+    check_numeric('CI', 'carbonIntensity', 0)
+    check_unique('refValues', 'variable')
+
+    if 'Unknown' not in set(tables['pue'].provider):
+        errors.append("pue: the 'Unknown' provider is used as default PUE")
+
+    missing = [x for x in REQUIRED_REFVALUES if x not in set(tables['refValues'].variable)]
+    if missing:
+        errors.append("refValues: missing {}".format(missing))
+
+    locations = set(tables['CI'].location)
+    for provider in tables['datacenters'].columns:
+        unknown = [x for x in tables['datacenters'][provider].dropna() if x not in locations]
+        if unknown:
+            errors.append("datacenters: unknown locations for {}: {}".format(provider, unknown))
+
+    models = {'CPU': set(tables['cpu'].model), 'GPU': set(tables['gpu'].model)}
+    for provider, coreType, model in zip(tables['hardware'].provider, tables['hardware'].type,
+                                         tables['hardware'].model):
+        if model not in models.get(coreType, set()):
+            errors.append("hardware: {} {} of {} not in TDP_{}".format(coreType, model, provider,
+                                                                    str(coreType).lower()))
+
+    return errors
+
+def main(data_dir):
+    n_resolved = update_ISO3_file(data_dir)
+    if n_resolved > 0:
+        print("{} new ISO3 codes written to {}".format(n_resolved, CSV_FILES['CI_ISO3']))
+
+    tables = load_csv_tables(data_dir)
+
+    errors = validate_tables(tables)
+    if errors:
+        for error in errors:
+            print("ERROR " + error, file=sys.stderr)
+        return 1
+
+    path = write_snapshot(tables, data_dir)
+    snapshot = read_snapshot(data_dir, path=path)
+    print("Snapshot {} written to {}".format(snapshot['_meta']['data_hash'], path))
+
+    timeseries = load_CI_timeseries(data_dir)
+    if timeseries is not None:
+        unknown = [x for x in timeseries.locations() if x not in set(tables['CI'].location)]
+        if unknown:
+            print("ERROR CI_timeseries: unknown locations {}".format(unknown), file=sys.stderr)
+            return 1
+        path = write_CI_store(timeseries, os.path.join(data_dir, CI_STORE_FILE))
+        print("{} carbon intensity series written to {} ({:,} bytes)".format(
+            len(CIStore(path).locations()), path, os.path.getsize(path)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.abspath(''), 'data')))
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+# Builds the geometry of the carbon intensity map (data/world.simplified.geo.json) from a full
+# resolution world GeoJSON, whose features have the ISO3 code of the country as id:
+#   - only the countries of CI_ISO3.csv are kept,
+#   - outlines are simplified (Douglas-Peucker) and coordinates are rounded,
+# as the map is only 250 pixels high. Shared borders are simplified once, see TOPOLOGY below.
+# The build fails if the result is over SIZE_BUDGET (see also tests/test_build_geometry.py).
+#
+# Usage: python build_geometry.py path/to/world.geo.json [data_dir]
+
+import csv
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+
+from reference_data import CSV_FILES
+
+GEOMETRY_FILE = "world.simplified.geo.json"
+SIZE_BUDGET = 200 * 1024 # in bytes, uncompressed
+
+TOLERANCE = 0.1 # in degrees
+PRECISION = 2 # number of decimals kept
+
+def simplify_line(points, tolerance):
+    '''
+    Douglas-Peucker simplification of an array of (lon, lat) points; the first and last points are kept.
+    '''
+    n = len(points)
+    if n < 3:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        vectors = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(vectors[:, 0], vectors[:, 1])
+        else:
+            distances = np.abs(segment[0] * vectors[:, 1] - segment[1] * vectors[:, 0]) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            middle = start + 1 + i
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return points[keep]
+
+############
+# TOPOLOGY #
+############
+# Neighbouring countries share their borders. Each border is cut at the junctions (points where outlines
+# meet or split) into an arc, which is simplified once and used by every outline it is part of,
+# as in TopoJSON, so that the simplified countries still meet without gaps or overlaps.
+
+def ring_points(ring):
+    # points of a ring as (lon, lat) tuples, without the closing point
+    points = [tuple(point[:2]) for point in ring]
+    if (len(points) > 1) and (points[0] == points[-1]):
+        points = points[:-1]
+    return points
+
+def find_junctions(rings):
+    '''
+    Points where outlines meet or split: the points whose neighbours differ from one ring to another.
+    '''
+    neighbours = dict()
+    junctions = set()
+    for points in rings:
+        for i, point in enumerate(points):
+            pair = frozenset([points[i - 1], points[(i + 1) % len(points)]])
+            if neighbours.setdefault(point, pair) != pair:
+                junctions.add(point)
+    return junctions
+
+def cut_ring(points, junctions):
+    '''
+    Arcs of a ring: lists of points from a junction to the next one (both included).
+    A ring without junctions is a single closed arc, starting at its smallest point,
+    so that it is the same for every ring it is shared with (e.g. an enclave and the hole around it).
+    '''
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        start = points.index(min(points))
+        points = points[start:] + points[:start]
+        return [points + points[:1]]
+
+    points = points[cuts[0]:] + points[:cuts[0]]
+    cuts = [i - cuts[0] for i in cuts] + [len(points)]
+    points = points + points[:1]
+    return [points[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+
+def build_arcs(rings):
+    '''
+    Cuts rings (lists of points) into the arcs they share.
+    Returns the distinct arcs, as arrays, and for each ring the list of its (arc index, reversed).
+    '''
+    junctions = find_junctions(rings)
+    arcs = []
+    arc_ids = dict()
+    rings_arcs = []
+    for points in rings:
+        ring_arcs = []
+        if len(points) >= 3:
+            for arc in cut_ring(points, junctions):
+                key = tuple(arc)
+                # an arc is shared in the opposite direction by the ring on its other side
+                reverse = key[::-1] < key
+                if reverse:
+                    key = key[::-1]
+                if key not in arc_ids:
+                    arc_ids[key] = len(arcs)
+                    arcs.append(np.array(key, dtype=float))
+                ring_arcs.append((arc_ids[key], reverse))
+        rings_arcs.append(ring_arcs)
+    return arcs, rings_arcs
+
+def simplify_arc(arc, tolerance, precision):
+    # Douglas-Peucker, then rounding: both ends are kept, so arcs still meet at the junctions
+    return np.round(simplify_line(arc, tolerance), precision)
+
+def assemble_ring(ring_arcs, arcs):
+    '''
+    Ring made of simplified arcs, or None if it collapses to less than a triangle.
+    '''
+    if not ring_arcs:
+        return None
+    parts = []
+    for k, (i, reverse) in enumerate(ring_arcs):
+        arc = arcs[i][::-1] if reverse else arcs[i]
+        parts.append(arc if k == 0 else arc[1:])
+    points = np.concatenate(parts)
+    # remove the consecutive duplicates created by the rounding
+    points = points[np.concatenate([[True], np.any(np.diff(points, axis=0) != 0, axis=1)])]
+    if len(points) < 4:
+        return None
+    if np.any(points[0] != points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points.tolist()
+
+def geometry_polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError("Unsupported geometry type {}".format(geometry['type']))
+
+def build_geometry(source, ISO3_codes, tolerance=TOLERANCE, precision=PRECISION):
+    '''
+    FeatureCollection with the simplified outline of each country of ISO3_codes present in source.
+    '''
+    features = [feature for feature in source['features'] if feature.get('id') in ISO3_codes]
+    polygons = [geometry_polygons(feature['geometry']) for feature in features]
+
+    rings = [ring_points(ring) for feature in polygons for polygon in feature for ring in polygon]
+    arcs, rings_arcs = build_arcs(rings)
+    # the arcs of each ring, nested like the polygons: feature -> polygon -> ring
+    refs = iter(rings_arcs)
+    features_arcs = [[[next(refs) for _ in polygon] for polygon in feature] for feature in polygons]
+
+    def assemble(simplified):
+        output = []
+        for feature_arcs in features_arcs:
+            feature_polygons = []
+            for polygon_arcs in feature_arcs:
+                exterior = assemble_ring(polygon_arcs[0], simplified)
+                if exterior is not None:
+                    holes = [assemble_ring(hole_arcs, simplified) for hole_arcs in polygon_arcs[1:]]
+                    feature_polygons.append([exterior] + [hole for hole in holes if hole is not None])
+            output.append(feature_polygons)
+        return output
+
+    simplified = [simplify_arc(arc, tolerance, precision) for arc in arcs]
+    assembled = assemble(simplified)
+
+    # Small countries: keep them visible, with their arcs only rounded (on both sides of their borders)
+    vanished = [k for k, feature_polygons in enumerate(assembled) if not feature_polygons]
+    if vanished:
+        for k in vanished:
+            for polygon_arcs in features_arcs[k]:
+                for ring_arcs in polygon_arcs:
+                    for i, _ in ring_arcs:
+                        simplified[i] = simplify_arc(arcs[i], 0, precision)
+        assembled = assemble(simplified)
+
+    output = []
+    for feature, feature_polygons in zip(features, assembled):
+        if not feature_polygons:
+            continue
+        if len(feature_polygons) == 1:
+            geometry = dict(type='Polygon', coordinates=feature_polygons[0])
+        else:
+            geometry = dict(type='MultiPolygon', coordinates=feature_polygons)
+        output.append(dict(type='Feature', id=feature['id'], geometry=geometry))
+    return dict(type='FeatureCollection', features=output)
+
+def read_ISO3_codes(data_dir):
+    with open(os.path.join(data_dir, CSV_FILES['CI_ISO3']), newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(f.readlines()[1:])
+        return set(row['ISO3'] for row in rows if row['ISO3'])
+
+def main(source_path, data_dir):
+    with open(source_path, encoding='utf-8') as f:
+        source = json.load(f)
+
+    ISO3_codes = read_ISO3_codes(data_dir)
+    geometry = build_geometry(source, ISO3_codes)
+    output = json.dumps(geometry, separators=(',', ':')).encode('utf-8')
+
+    missing = ISO3_codes - set(feature['id'] for feature in geometry['features'])
+    if missing:
+        print("WARNING no geometry for {}".format(sorted(missing)), file=sys.stderr)
+
+    if len(output) > SIZE_BUDGET:
+        print("ERROR geometry is {:,} bytes, over the budget of {:,} bytes".format(len(output), SIZE_BUDGET),
+              file=sys.stderr)
+        return 1
+
+    path = os.path.join(data_dir, GEOMETRY_FILE)
+    with open(path, 'wb') as f:
+        f.write(output)
+    print("{} countries written to {} ({:,} bytes, {:,} gzipped)".format(
+        len(geometry['features']), path, len(output), len(gzip.compress(output))))
+    return 0
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python build_geometry.py path/to/world.geo.json [data_dir]", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.abspath(''), 'data')))
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# Shared backends for ResultCache (see result_cache.py), so that the gunicorn workers
+# reuse each other's results instead of each warming up its own cache.
+#
+# - SQLiteBackend: a SQLite file on the local disk
+# - SocketBackend: a small key-value server on the same machine, started with
+#       python cache_backends.py unix:///tmp/green-algorithms-cache.sock
+#   (or tcp://127.0.0.1:7070)
+#
+# Values are stored as JSON, which is what the callbacks return anyway: Dash components are stored
+# as what Dash sends to the browser (to_plotly_json), which renders the same when returned by a callback.
+# A backend that fails (locked database, server down...) behaves like a miss and never breaks a callback.
+
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+from result_cache import ResultCache
+
+def _default(x):
+    # Dash components and plotly figures, as plotly.utils.PlotlyJSONEncoder does
+    if hasattr(x, 'to_plotly_json'):
+        return x.to_plotly_json()
+    # numpy scalars and arrays
+    if hasattr(x, 'tolist'):
+        return x.tolist()
+    raise TypeError("{} is not JSON serializable".format(type(x)))
+
+def encode(value):
+    return json.dumps(value, default=_default)
+
+def decode(text):
+    return json.loads(text)
+
+class SharedBackend(object):
+    '''
+    Interface of the shared backends. get() returns (found, value, writer) with writer the pid of
+    the process that stored the value, so that hits on other workers' results can be counted.
+    '''
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def stats(self):
+        return dict()
+
+##########
+# SQLITE #
+##########
+
+class SQLiteBackend(SharedBackend):
+
+    def __init__(self, path, maxsize=100000, ttl=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._n_sets = 0
+        self.errors = 0
+
+        with self._connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS results
+                            (key TEXT PRIMARY KEY, value TEXT, writer INTEGER, created REAL, expires REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connection().execute('SELECT value, writer, expires FROM results WHERE key = ?',
+                                             (key,)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return False, None, None
+        if row is None:
+            return False, None, None
+        value, writer, expires = row
+        if (expires is not None) and (time.time() >= expires):
+            return False, None, None
+        return True, decode(value), writer
+
+    def set(self, key, value):
+        now = time.time()
+        expires = None if self.ttl is None else now + self.ttl
+        try:
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                             (key, encode(value), os.getpid(), now, expires))
+                # Trim the oldest entries from time to time
+                self._n_sets += 1
+                if self._n_sets % 100 == 0:
+                    conn.execute('''DELETE FROM results WHERE key IN
+                                    (SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)''',
+                                 (self.maxsize,))
+        except (sqlite3.Error, TypeError, ValueError):
+            self.errors += 1
+
+    def stats(self):
+        try:
+            size = self._connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        return dict(backend='sqlite', path=self.path, size=size, errors=self.errors)
+
+#####################
+# KEY-VALUE SERVER  #
+#####################
+
+# Protocol: one JSON object per line in each direction
+# {"op": "get", "key": k} -> {"found": bool, "value": v, "writer": pid}
+# {"op": "set", "key": k, "value": v, "writer": pid} -> {"ok": true}
+# {"op": "stats"} -> {...}
+
+def _parse_address(url):
+    if url.startswith('unix://'):
+        return socket.AF_UNIX, url[len('unix://'):]
+    if url.startswith('tcp://'):
+        host, port = url[len('tcp://'):].rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    raise ValueError("Unknown address {}, expected unix://path or tcp://host:port".format(url))
+
+class SocketBackend(SharedBackend):
+
+    def __init__(self, url, timeout=0.2):
+        self.url = url
+        self.family, self.address = _parse_address(url)
+        self.timeout = timeout
+        self._local = threading.local()
+        self.errors = 0
+
+    def _request(self, message):
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            try:
+                if conn is None:
+                    sock = socket.socket(self.family, socket.SOCK_STREAM)
+                    sock.settimeout(self.timeout)
+                    sock.connect(self.address)
+                    conn = self._local.conn = (sock, sock.makefile('rb'))
+                sock, reader = conn
+                sock.sendall(encode(message).encode('utf-8') + b'\n')
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("connection closed by the cache server")
+                return decode(line)
+            except (OSError, ValueError):
+                # reconnect once (e.g. server restarted), then give up
+                self._local.conn = None
+                if conn is not None:
+                    conn[0].close()
+        self.errors += 1
+        return None
+
+    def get(self, key):
+        response = self._request(dict(op='get', key=key))
+        if (response is None) or (not response['found']):
+            return False, None, None
+        return True, response['value'], response['writer']
+
+    def set(self, key, value):
+        try:
+            self._request(dict(op='set', key=key, value=value, writer=os.getpid()))
+        except TypeError:
+            self.errors += 1
+
+    def stats(self):
+        server_stats = self._request(dict(op='stats')) or dict()
+        return dict(backend='socket', url=self.url, errors=self.errors, server=server_stats)
+
+class _KeyValueHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        store = self.server.store
+        for line in self.rfile:
+            try:
+                request = decode(line)
+                if request['op'] == 'get':
+                    entry = store.get(request['key'])
+                    if entry is None:
+                        response = dict(found=False)
+                    else:
+                        response = dict(found=True, value=entry[0], writer=entry[1])
+                elif request['op'] == 'set':
+                    store.set(request['key'], (request['value'], request.get('writer')))
+                    response = dict(ok=True)
+                elif request['op'] == 'stats':
+                    response = store.stats()
+                else:
+                    response = dict(error="unknown op")
+            except (ValueError, KeyError, TypeError) as e:
+                response = dict(error=str(e))
+            self.wfile.write(encode(response).encode('utf-8') + b'\n')
+
+def make_server(url, maxsize=100000, ttl=None):
+    '''
+    Key-value server for SocketBackend, backed by an LRU ResultCache.
+    '''
+    family, address = _parse_address(url)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.remove(address)
+        server_class = socketserver.ThreadingUnixStreamServer
+    else:
+        server_class = socketserver.ThreadingTCPServer
+        server_class.allow_reuse_address = True
+    server_class.daemon_threads = True
+    server = server_class(address, _KeyValueHandler)
+    server.store = ResultCache(maxsize=maxsize, ttl=ttl)
+    return server
+
+###########
+# FACTORY #
+###########
+
+def backend_from_url(url, ttl=None):
+    '''
+    sqlite:///path/to/file.db, unix:///path/to/socket or tcp://host:port
+    '''
+    if url.startswith('sqlite://'):
+        return SQLiteBackend(url[len('sqlite://'):], ttl=ttl)
+    return SocketBackend(url)
+
+if __name__ == '__main__':
+    url = sys.argv[1] if len(sys.argv) > 1 else 'unix:///tmp/green-algorithms-cache.sock'
+    server = make_server(url)
+    print("Cache server listening on {}".format(url))
+    server.serve_forever()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+# The calculator without the web app: loading of the reference data, the formula, and the conversion
+# of the emissions into tree-months, km driven and share of a flight, one job at a time.
+# Only the standard library is imported, so that it is imported in a few milliseconds
+# (numpy alone takes over 100 ms, pandas and Dash much more), for scripts run after every job.
+# The formula is also the one of footprint.py, which applies it to numpy arrays: for many jobs at once,
+# footprint.score_jobs is faster.
+#
+#   import calculator
+#   reference = calculator.load_reference_data()
+#   calculator.aggregate(reference, coreType='CPU', coreModel='Xeon E5-2683 v4', n_cores=12, memory=64,
+#                        runTime_hours=12, runTime_min=0, location='GB')['carbonEmissions']
+
+import math
+import os
+from collections import namedtuple
+
+from reference_data import CSV_FILES, content_hash, files_revision, load_csv_lookups, sources_hashes
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Platforms for which the datacenter PUE is ignored
+PUE_FREE_PLATFORMS = ('personalComputer',)
+
+# 0: Paris-London, 1: NYC-San Francisco, 2: NYC-Melbourne
+FLYING_TEXTS = ("Paris-London", "NYC-San Francisco", "NYC-Melbourne")
+
+# Fields of the aggregate_data Store, when the inputs are complete (see aggregate_input_values)
+RESULT_FIELDS = [
+    'coreType', 'coreModel', 'n_cores', 'corePower', 'memory', 'runTime_hours', 'runTime_min', 'runTime',
+    'location', 'carbonIntensity', 'PUE', 'PSF', 'selected_platform',
+    'carbonEmissions', 'CE_core', 'CE_memory', 'energy_needed', 'power_needed',
+    'n_treeMonths', 'nkm_drivingUS', 'nkm_drivingEU', 'nkm_train', 'flying_context', 'flying_text',
+    'data_version',
+]
+
+# data_hash identifies the content of the csv files, revision (the data_version of the results) their last change
+ReferenceData = namedtuple('ReferenceData', ['data_hash', 'revision', 'lookups', 'refValues_dict'])
+
+def load_reference_data(data_dir=DATA_DIR):
+    '''
+    The reference data of data_dir (see reference_data.ReferenceLookups), read from the csv files.
+    '''
+    lookups, refValues_dict = load_csv_lookups(data_dir)
+    names = sorted(set(CSV_FILES.values()))
+    return ReferenceData(data_hash=content_hash(sources_hashes(data_dir)),
+                         revision=files_revision([os.path.join(data_dir, name) for name in names]),
+                         lookups=lookups, refValues_dict=refValues_dict)
+
+##########
+# INPUTS #
+##########
+
+# Inputs of a job, as sent to the API (see footprint_api.py) or read by cli.py
+# name: (type, required)
+JOB_SCHEMA = [
+    ('coreType', str, True),
+    ('coreModel', str, True),
+    ('n_cores', float, True),
+    ('tdp', float, False), # required if coreModel is 'other'
+    ('memory', float, True),
+    ('runTime_hours', float, True),
+    ('runTime_min', float, True),
+    ('location', str, True),
+    ('usage', float, True),
+    ('PUE', float, True),
+    ('PSF', float, True),
+    ('selected_platform', str, True),
+    ('selected_provider', str, False),
+]
+
+JOB_INPUTS = [name for name, _, _ in JOB_SCHEMA]
+
+CORE_TYPES = ('CPU', 'GPU')
+
+class ValidationError(ValueError):
+    '''
+    Invalid job: errors is the list of the problems found.
+    '''
+
+    def __init__(self, errors):
+        super(ValidationError, self).__init__('; '.join(errors))
+        self.errors = errors
+
+def _is_number(value):
+    # bool is an int, but not a number here
+    return (type(value) in (int, float)) and math.isfinite(value)
+
+def validate_job(job):
+    '''
+    Checks the types of the inputs of a job, and that the numbers are positive.
+    Returns the job, or raises ValidationError with every problem found.
+    '''
+    if not isinstance(job, dict):
+        raise ValidationError(["A job must be a JSON object"])
+
+    errors = []
+    for name, kind, required in JOB_SCHEMA:
+        value = job.get(name)
+        if value is None:
+            if required:
+                errors.append("Missing input: {}".format(name))
+        elif kind is float:
+            if not _is_number(value):
+                errors.append("{} must be a number".format(name))
+            elif value < 0:
+                errors.append("{} can't be negative".format(name))
+        elif type(value) is not str:
+            errors.append("{} must be a string".format(name))
+
+    if (type(job.get('coreType')) is str) and (job['coreType'] not in CORE_TYPES):
+        errors.append("coreType must be one of {}".format(', '.join(CORE_TYPES)))
+    if (job.get('coreModel') == 'other') and (job.get('tdp') is None):
+        errors.append("Missing input: tdp (needed when coreModel is 'other')")
+
+    if errors:
+        raise ValidationError(errors)
+    return job
+
+###########
+# FORMULA #
+###########
+
+def compute_runTime(runTime_hours, runTime_min):
+    # Run time, in hours
+    return runTime_hours + runTime_min/60.
+
+def compute_footprint(runTime, n_cores, corePower, memory, carbonIntensity, usage, PUE, PSF, refValues_dict,
+                      context=None):
+    '''
+    Energy and carbon emissions of a job, or element-wise for arrays.
+    context converts the emissions into the other units: compute_context by default,
+    footprint.compute_context for arrays.
+    '''
+    output = dict()
+
+    # Power needed, in Watt
+    powerNeeded_core = PUE * (n_cores * corePower) * usage
+    powerNeeded_memory = PUE * (memory * refValues_dict['memoryPower'])
+    powerNeeded = powerNeeded_core + powerNeeded_memory
+
+    # Energy needed, in kWh (so dividing by 1000 to convert to kW)
+    energyNeeded_core = runTime * powerNeeded_core * PSF / 1000
+    energyNeeded_memory = runTime * powerNeeded_memory * PSF / 1000
+    energyNeeded = runTime * powerNeeded * PSF / 1000
+
+    # Carbon emissions: carbonIntensity is in g per kWh, so results in gCO2
+    output['carbonEmissions'] = energyNeeded * carbonIntensity
+    output['CE_core'] = energyNeeded_core * carbonIntensity
+    output['CE_memory'] = energyNeeded_memory * carbonIntensity
+    output['energy_needed'] = energyNeeded
+    output['power_needed'] = powerNeeded
+
+    output.update((context or compute_context)(output['carbonEmissions'], refValues_dict))
+
+    return output
+
+def compute_context(carbonEmissions, refValues_dict):
+    '''
+    Converts carbon emissions (in gCO2e) into tree-months, km driven and share of a flight.
+    '''
+    output = dict()
+
+    output['n_treeMonths'] = carbonEmissions / refValues_dict['treeYear'] * 12
+
+    output['nkm_drivingUS'] = carbonEmissions / refValues_dict['passengerCar_US_perkm']
+    output['nkm_drivingEU'] = carbonEmissions / refValues_dict['passengerCar_EU_perkm']
+    output['nkm_train'] = carbonEmissions / refValues_dict['train_perkm']
+
+    if carbonEmissions < 0.5 * refValues_dict['flight_NY-SF']:
+        flight_idx = 0
+    elif carbonEmissions < 0.5 * refValues_dict['flight_NYC-MEL']:
+        flight_idx = 1
+    else:
+        flight_idx = 2
+    flight_ref = [refValues_dict['flight_PAR-LON'], refValues_dict['flight_NY-SF'], refValues_dict['flight_NYC-MEL']]
+
+    output['flying_context'] = carbonEmissions / flight_ref[flight_idx]
+    output['flying_text'] = FLYING_TEXTS[flight_idx]
+
+    return output
+
+def aggregate(reference, coreType, coreModel, n_cores, memory, runTime_hours, runTime_min, location,
+              usage=1, PUE=None, PSF=1, selected_platform='localServer', selected_provider=None, tdp=None):
+    '''
+    Same results as aggregate_input_values (the fields of RESULT_FIELDS), for a ReferenceData.
+    PUE is the default one of the app if None, tdp is only needed when coreModel is 'other'.
+    Raises KeyError for unknown locations and models.
+    '''
+    lookups = reference.lookups
+
+    if location not in lookups.CI:
+        raise KeyError("Unknown location: {}".format(location))
+    carbonIntensity = lookups.CI[location]
+
+    if PUE is None:
+        PUE = lookups.pue['Unknown']
+    if selected_platform in PUE_FREE_PLATFORMS:
+        PUE_used = 1
+    elif selected_provider in lookups.pue:
+        PUE_used = lookups.pue[selected_provider]
+    else:
+        PUE_used = PUE
+
+    if coreModel == 'other':
+        if tdp is None:
+            raise ValueError("A tdp is needed for models set to 'other'")
+        corePower = tdp
+    elif coreModel in lookups.cores.get(coreType, {}):
+        corePower = lookups.cores[coreType][coreModel]
+    else:
+        raise KeyError("Unknown {} model: {}".format(coreType, coreModel))
+
+    runTime = compute_runTime(runTime_hours, runTime_min)
+    footprint = compute_footprint(runTime=runTime, n_cores=n_cores, corePower=corePower, memory=memory,
+                                  carbonIntensity=carbonIntensity, usage=usage, PUE=PUE_used, PSF=PSF,
+                                  refValues_dict=reference.refValues_dict)
+
+    output = dict(coreType=coreType, coreModel=coreModel, n_cores=n_cores, corePower=corePower, memory=memory,
+                  runTime_hours=runTime_hours, runTime_min=runTime_min, runTime=runTime, location=location,
+                  carbonIntensity=carbonIntensity, PUE=PUE_used, PSF=PSF, selected_platform=selected_platform,
+                  data_version=reference.revision)
+    output.update(footprint)
+    return {name: output[name] for name in RESULT_FIELDS}
+
+########
+# TEXT #
+########
+
+def format_results(aggData):
+    '''
+    Texts of the top of the page (carbon emissions, energy, tree-months, km driven, share of a flight).
+    '''
+    carbonEmissions_value = aggData['carbonEmissions'] # in g CO2e
+    carbonEmissions_unit = "g"
+    if carbonEmissions_value >= 1e6:
+        carbonEmissions_value /= 1e6
+        carbonEmissions_unit = "T"
+    elif carbonEmissions_value >= 1e3:
+        carbonEmissions_value /= 1e3
+        carbonEmissions_unit = "kg"
+    text_CE = "{:,.2f} {} CO2e".format(carbonEmissions_value,
+                                       carbonEmissions_unit)
+
+    energyNeeded_value = aggData['energy_needed'] # in kWh
+    energyNeeded_unit = "kWh"
+    if energyNeeded_value >= 1e3:
+        energyNeeded_value /= 1e3
+        energyNeeded_unit = "MWh"
+    text_energy = "{:,.2f} {}".format(energyNeeded_value, energyNeeded_unit)
+
+    treeTime_value = aggData['n_treeMonths'] # in tree-months
+    treeTime_unit = "tree-months"
+    if treeTime_value >= 24:
+        treeTime_value /= 12
+        treeTime_unit = "tree-years"
+    text_ty = "{:,.2f} {}".format(treeTime_value, treeTime_unit)
+
+    text_car = "{:,.2f} km".format(aggData['nkm_drivingEU'])
+    text_fly = "{:,.0f} %".format(aggData['flying_context']*100)
+
+    return text_CE, text_energy, text_ty, text_car, text_fly
+
+def report_fields(aggData, lookups):
+    '''
+    Values filled in the sentence describing the job (see report_text), also used by the page (fillin_report_text).
+    '''
+    minutes = aggData['runTime_min']
+    hours = aggData['runTime_hours']
+
+    if (minutes > 0)&(hours>0):
+        textRuntime = "{}h and {}min".format(hours, minutes)
+    elif (hours > 0):
+        textRuntime = "{}h".format(hours)
+    else:
+        textRuntime = "{}min".format(minutes)
+
+    if aggData['n_cores'] > 1:
+        suffixProcessor = 's'
+    else:
+        suffixProcessor = ''
+
+    locationInfo = lookups.locations[aggData['location']]
+    country = locationInfo.countryName
+    region = locationInfo.regionName
+
+    if region == 'Any':
+        textRegion = ''
+    else:
+        textRegion = ' ({})'.format(region)
+
+    if country in ['United States of America', 'United Kingdom']:
+        prefixCountry = 'the '
+    else:
+        prefixCountry = ''
+
+    if aggData['PSF'] > 1:
+        textPSF = ' and ran {} times in total,'.format(aggData['PSF'])
+    else:
+        textPSF = ''
+
+    return (
+        textRuntime,
+        aggData['n_cores'], aggData['coreType'], suffixProcessor, aggData['coreModel'],
+        aggData['energy_needed'],
+        prefixCountry, country, textRegion,
+        textPSF,
+        aggData['carbonEmissions'], aggData['n_treeMonths']
+    )
+
+def report_text(aggData, lookups):
+    '''
+    Sentence describing the job and its footprint, to be copied into articles (markdown-free).
+    '''
+    return "This algorithm runs in {} on {} {}{} {}, which draws {:,.2f} kWh. " \
+           "Based in {}{}{},{} this produces {:,.0f} g of CO2e, which is equivalent to {:.2f} tree-months " \
+           "(calculated using green-algorithms.org v1.0 [1]).".format(*report_fields(aggData, lookups))
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+# Where the carbon intensity of a location comes from:
+#   - StaticCIProvider: the annual averages of CI_aggregated.csv (the default)
+#   - HTTPCIProvider: live values from an electricityMap-like API, e.g.
+#       https://api.electricitymap.org/v3/carbon-intensity/latest (GET ?zone=FR -> {"carbonIntensity": 56, ...})
+#
+# Callbacks never wait for the network: HTTPCIProvider answers from its cache, and values that are
+# missing or older than the TTL are fetched in the background by a small pool of threads, each
+# reusing its keep-alive connection. Until a value arrives the static one is used, and a value past
+# its TTL keeps being used (stale-while-revalidate) while it is refreshed, up to `stale` seconds more.
+# Concurrent requests for the same zone share a single fetch.
+#
+# A stand-in for the API, serving the values of data/CI_aggregated.csv, is started with
+#   python ci_providers.py 127.0.0.1:8089 [data_dir]
+
+import http.client
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# source is 'static', 'live' or 'stale', fetched_at is a time.time() (None for static values)
+CIValue = namedtuple('CIValue', ['carbonIntensity', 'source', 'fetched_at'])
+
+class CIProvider(object):
+    '''
+    Carbon intensity (gCO2e/kWh) of the locations of CI_aggregated.csv.
+    `default` is the static value of the location, used when the provider has nothing better.
+    '''
+    live = False
+
+    def lookup(self, location, default):
+        raise NotImplementedError
+
+    def carbonIntensity(self, location, default):
+        return self.lookup(location, default).carbonIntensity
+
+    def revision(self, location):
+        '''
+        Changes whenever lookup(location) would return another value or start a fetch, but doesn't count
+        as a lookup and never fetches anything, e.g. to key cached results on it. None for the static value.
+        '''
+        return None
+
+    def stats(self):
+        return dict(provider=type(self).__name__, live=self.live)
+
+class StaticCIProvider(CIProvider):
+
+    def lookup(self, location, default):
+        return CIValue(default, 'static', None)
+
+########
+# HTTP #
+########
+
+class ConnectionPool(object):
+    '''
+    Keep-alive connections to a single host, shared by the fetching threads.
+    '''
+
+    def __init__(self, url, size, timeout):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported scheme in {}".format(url))
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.created = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            self.created += 1
+            return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _put(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def get(self, path, headers):
+        '''
+        (status, body) of a GET. A reused connection that the server has closed meanwhile is retried once.
+        '''
+        connection, reused = self._get()
+        try:
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                connection.close()
+                connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+                self.created += 1
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._put(connection)
+        return response.status, body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class HTTPCIProvider(CIProvider):
+    '''
+    Live carbon intensity from `url`, queried with ?zone=<zone> and read from the 'carbonIntensity' field.
+    zones maps locations to zones (locations are used as such otherwise, None to never fetch one).
+    Values are fresh for `ttl` seconds, then served while they are refreshed for `stale` more seconds.
+    A failed fetch isn't retried before `retry_after` seconds.
+    '''
+    live = True
+
+    def __init__(self, url, token=None, ttl=900, stale=3600, retry_after=60, timeout=5, max_connections=4,
+                 zones=None, clock=time.monotonic):
+        self.url = url
+        self.path = urllib.parse.urlsplit(url).path or '/'
+        self.headers = {'Accept': 'application/json'}
+        if token:
+            self.headers['auth-token'] = token
+        self.ttl = ttl
+        self.stale = stale
+        self.retry_after = retry_after
+        self.zones = dict(zones or {})
+        self.clock = clock
+        self.pool = ConnectionPool(url, max_connections, timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='ci-provider')
+        self.counts = dict(fresh=0, stale=0, missing=0, fetches=0, coalesced=0, errors=0)
+        self._values = dict() # zone: (carbonIntensity, fetched_at, clock at fetch)
+        self._failures = dict() # zone: clock at failure
+        self._pending = dict() # zone: Future
+        self._lock = threading.Lock()
+
+    def _zone(self, location):
+        return self.zones.get(location, location)
+
+    def lookup(self, location, default):
+        zone = self._zone(location)
+        if zone is None:
+            return CIValue(default, 'static', None)
+
+        now = self.clock()
+        with self._lock:
+            entry = self._values.get(zone)
+            if (entry is not None) and (now - entry[2] < self.ttl):
+                self.counts['fresh'] += 1
+                return CIValue(entry[0], 'live', entry[1])
+            if (entry is not None) and (now - entry[2] < self.ttl + self.stale):
+                self.counts['stale'] += 1
+                output = CIValue(entry[0], 'stale', entry[1])
+            else:
+                self.counts['missing'] += 1
+                output = CIValue(default, 'static', None)
+            self._refresh(zone, now)
+        return output
+
+    def revision(self, location):
+        zone = self._zone(location)
+        if zone is None:
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._values.get(zone)
+            failed = self._failures.get(zone)
+        if entry is None:
+            state, fetched_at = 'missing', None
+        else:
+            age = now - entry[2]
+            state = 'live' if age < self.ttl else ('stale' if age < self.ttl + self.stale else 'expired')
+            fetched_at = entry[1]
+        if (state == 'live') or (failed is None):
+            return (state, fetched_at)
+        # Past its TTL, a value is refreshed by the lookup of the first request with a new revision: after a
+        # failed fetch the revision changes again once it may be retried, so that a cached result can't hide it
+        return (state, fetched_at, failed, now - failed >= self.retry_after)
+
+    def refresh(self, location):
+        '''
+        Starts fetching the value of location, unless it is already being fetched or has just failed.
+        Returns the Future of the fetch (None if there is none), e.g. to wait for it in tests.
+        '''
+        zone = self._zone(location)
+        if zone is None:
+            return None
+        with self._lock:
+            return self._refresh(zone, self.clock())
+
+    def _refresh(self, zone, now):
+        # with the lock held
+        if zone in self._pending:
+            self.counts['coalesced'] += 1
+            return self._pending[zone]
+        failed = self._failures.get(zone)
+        if (failed is not None) and (now - failed < self.retry_after):
+            return None
+        future = self.executor.submit(self._fetch, zone)
+        self._pending[zone] = future
+        return future
+
+    def _fetch(self, zone):
+        try:
+            status, body = self.pool.get('{}?{}'.format(self.path, urllib.parse.urlencode(dict(zone=zone))),
+                                         self.headers)
+            if status != 200:
+                raise ValueError("HTTP {}".format(status))
+            value = float(json.loads(body.decode('utf-8'))['carbonIntensity'])
+        except Exception as e:
+            with self._lock:
+                self.counts['errors'] += 1
+                self._failures[zone] = self.clock()
+                del self._pending[zone]
+            logger.warning("Carbon intensity of %s couldn't be fetched: %s: %s", zone, type(e).__name__, e)
+            return None
+
+        with self._lock:
+            self.counts['fetches'] += 1
+            self._values[zone] = (value, time.time(), self.clock())
+            self._failures.pop(zone, None)
+            del self._pending[zone]
+        return value
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(provider=type(self).__name__, live=self.live, url=self.url, zones=len(self._values),
+                        pending=len(self._pending), connections=self.pool.created, **self.counts)
+
+def provider_from_url(url, **kwargs):
+    '''
+    'static' (or nothing) for the values of CI_aggregated.csv, or the http(s) URL of a live API
+    (kwargs are those of HTTPCIProvider).
+    '''
+    if (not url) or (url == 'static'):
+        return StaticCIProvider()
+    return HTTPCIProvider(url, **kwargs)
+
+############
+# STAND-IN #
+############
+
+def make_standin_server(address, values, delay=0):
+    '''
+    HTTP server answering like the live API, with the carbon intensity of `values` ({zone: value}),
+    after `delay` seconds. server.requests counts the requests by zone.
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive
+
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            zone = query.get('zone', [None])[0]
+            with server.lock:
+                server.requests[zone] = server.requests.get(zone, 0) + 1
+            if delay:
+                time.sleep(delay)
+            if zone in values:
+                status = 200
+                body = dict(zone=zone, carbonIntensity=values[zone],
+                            datetime=time.strftime('%Y-%m-%dT%H:00:00.000Z', time.gmtime()))
+            else:
+                status = 404
+                body = dict(error="No data for zone {}".format(zone))
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    host, port = address.rsplit(':', 1)
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    server.requests = dict()
+    server.lock = threading.Lock()
+    return server
+
+if __name__ == '__main__':
+    import csv
+    from reference_data import CSV_FILES
+
+    address = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:8089'
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.abspath(''), 'data')
+    with open(os.path.join(data_dir, CSV_FILES['CI']), newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(f.readlines()[1:])
+        values = {row['location']: float(row['carbonIntensity']) for row in rows}
+    server = make_standin_server(address, values)
+    print("Carbon intensity stand-in listening on http://{}/carbon-intensity/latest".format(address))
+    server.serve_forever()
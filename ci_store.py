@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# On-disk store of the carbon intensity series (see ci_timeseries.py), built by build_data.py
+# from data/CI_timeseries.csv, for when there are too many of them to be loaded in every worker.
+#
+# Layout of the file:
+#   MAGIC | format version (uint32) | header length (uint32) | header (JSON) | padding | arrays
+# Each location is a column, cut into chunks of CHUNK_SIZE steps. Every chunk is stored as float32 (lossy),
+# byte-shuffled (the exponent bytes of neighbouring values are alike) and compressed with zlib.
+# For each column, the running total of the carbon intensity at the start of every chunk is stored
+# uncompressed, so that a window is integrated by decompressing at most the two chunks at its ends.
+# The file is memory-mapped: only the chunks that are used are read, and a few are kept decompressed.
+
+import functools
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from ci_timeseries import CISeries, CITimeSeries, CI_TIMESERIES_FILE, load_CI_timeseries, to_seconds
+
+CI_STORE_FILE = "CI_timeseries.store"
+MAGIC = b'GREENCI\0'
+FORMAT_VERSION = 1
+CHUNK_SIZE = 24 * 7 * 4 # 4 weeks of hourly values
+CACHED_CHUNKS = 64 # per location
+
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+def _pad(n):
+    return (-n) % _ALIGN
+
+def _shuffle(values):
+    return values.astype('<f4').view(np.uint8).reshape(-1, 4).T.tobytes()
+
+def _unshuffle(data, length):
+    return np.frombuffer(data, dtype=np.uint8).reshape(4, length).T.copy().view('<f4').reshape(-1)
+
+#########
+# WRITE #
+#########
+
+def write_CI_store(timeseries, path, chunk_size=CHUNK_SIZE, level=6):
+    '''
+    Writes a CITimeSeries into a store file. The file is replaced atomically.
+    The storage is lossy: values are rounded to float32 (relative error at most 2**-24, about 6e-8,
+    i.e. up to 1.5e-5 gCO2e/kWh on a value of 250), and the integrals are those of the rounded values.
+    '''
+    blobs = []
+    offset = 0
+    columns = dict()
+    for location, series in timeseries.series.items():
+        values = series.values.astype('<f4')
+        chunks = []
+        # Running totals from the float32 values, so that they match the chunks
+        totals = np.zeros(-(-len(values) // chunk_size) + 1)
+        for k, first in enumerate(range(0, len(values), chunk_size)):
+            chunk = values[first:first + chunk_size]
+            data = zlib.compress(_shuffle(chunk), level)
+            chunks.append([offset, len(data), len(chunk)])
+            blobs.append(data)
+            offset += len(data) + _pad(len(data))
+            totals[k + 1] = totals[k] + np.sum(chunk.astype(float)) * (series.step / 3600.)
+        totals = totals.astype('<f8')
+        columns[location] = dict(start=series.start, step=series.step, length=len(values),
+                                 totals_offset=offset, chunks=chunks)
+        blobs.append(totals.tobytes())
+        offset += totals.nbytes + _pad(totals.nbytes)
+
+    header = json.dumps(dict(format=FORMAT_VERSION, chunk_size=chunk_size, columns=columns)).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * _pad(_PREAMBLE.size + len(header)))
+        for data in blobs:
+            f.write(data)
+            f.write(b'\0' * _pad(len(data)))
+    os.replace(tmp_path, path)
+
+    return path
+
+########
+# READ #
+########
+
+class StoredCISeries(CISeries):
+    '''
+    A CISeries whose values stay in the memory-mapped store, and are decompressed chunk by chunk when needed.
+    They are the float32 values of the store, see write_CI_store.
+    '''
+
+    def __init__(self, buffer, data_start, chunk_size, column):
+        self.start = float(column['start'])
+        self.step = float(column['step'])
+        self.length = column['length']
+        self.chunk_size = chunk_size
+        self._buffer = buffer
+        self._data_start = data_start
+        self._chunks = column['chunks']
+        self.chunk_totals = np.frombuffer(buffer, dtype='<f8', count=len(self._chunks) + 1,
+                                          offset=data_start + column['totals_offset'])
+        self._chunk = functools.lru_cache(maxsize=CACHED_CHUNKS)(self._read_chunk)
+
+    def _read_chunk(self, k):
+        # (values, running total at the start of each step) of chunk k
+        offset, nbytes, length = self._chunks[k]
+        start = self._data_start + offset
+        values = _unshuffle(zlib.decompress(self._buffer[start:start + nbytes]), length).astype(float)
+        cumulative = self.chunk_totals[k] + np.concatenate([[0.], np.cumsum(values * (self.step / 3600.))[:-1]])
+        return values, cumulative
+
+    @property
+    def values(self):
+        # Everything, only for small series or tests, use slice otherwise
+        return np.concatenate([self._chunk(k)[0] for k in range(len(self._chunks))])
+
+    def _steps(self, i, column):
+        # values or running totals (column 0 or 1) at the steps of the array i, reading each chunk once
+        i = np.asarray(i)
+        chunk_ids = i // self.chunk_size
+        uniques, inverse = np.unique(chunk_ids, return_inverse=True)
+        table = np.zeros((len(uniques), self.chunk_size))
+        for row, k in enumerate(uniques):
+            chunk = self._chunk(int(k))[column]
+            table[row, :len(chunk)] = chunk
+        return table[inverse.reshape(i.shape), i - chunk_ids * self.chunk_size]
+
+    def _running_total(self, t):
+        position = (t - self.start) / self.step
+        i = np.clip(np.floor(position).astype(int), 0, self.length - 1)
+        values = self._steps(i, 0)
+        return self._steps(i, 1) + (position - i) * values * (self.step / 3600.)
+
+    def at(self, t):
+        position = (to_seconds(t) - self.start) / self.step
+        return self._steps(np.clip(np.floor(position).astype(int), 0, self.length - 1), 0)
+
+    def slice(self, t0, t1):
+        '''
+        (times, values) of the steps overlapping [t0, t1), decompressing only the chunks needed.
+        '''
+        first = max(int(np.floor((float(to_seconds(t0)) - self.start) / self.step)), 0)
+        last = min(int(np.ceil((float(to_seconds(t1)) - self.start) / self.step)), self.length)
+        if last <= first:
+            return np.empty(0), np.empty(0)
+        values = np.concatenate([self._chunk(k)[0]
+                                 for k in range(first // self.chunk_size, (last - 1) // self.chunk_size + 1)])
+        offset = (first // self.chunk_size) * self.chunk_size
+        times = self.start + np.arange(first, last) * self.step
+        return times, values[first - offset:last - offset]
+
+class CIStore(CITimeSeries):
+    '''
+    The series of a store file, keyed by location code like CITimeSeries.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_length = _PREAMBLE.unpack_from(self._buffer, 0)
+        if (magic != MAGIC)|(version != FORMAT_VERSION):
+            raise ValueError("{} is not a carbon intensity store of format {}".format(path, FORMAT_VERSION))
+
+        header = json.loads(self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].decode('utf-8'))
+        data_start = _PREAMBLE.size + header_length
+        data_start += _pad(data_start)
+
+        self.path = path
+        self.chunk_size = header['chunk_size']
+        super(CIStore, self).__init__({
+            location: StoredCISeries(self._buffer, data_start, header['chunk_size'], column)
+            for location, column in header['columns'].items()
+        })
+
+def open_CI_timeseries(data_dir):
+    '''
+    The carbon intensity series of data_dir: from the store if it is up to date, from the csv file otherwise
+    (None if there are none).
+    '''
+    store_path = os.path.join(data_dir, CI_STORE_FILE)
+    csv_path = os.path.join(data_dir, CI_TIMESERIES_FILE)
+    if os.path.exists(store_path) and ((not os.path.exists(csv_path)) or
+                                       (os.path.getmtime(store_path) >= os.path.getmtime(csv_path))):
+        return CIStore(store_path)
+    return load_CI_timeseries(data_dir)
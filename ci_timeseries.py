@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Time-resolved carbon intensity: one series per location, at a fixed time step (e.g. hourly).
+# Each series keeps the running total of its values, so that the carbon intensity integrated over
+# any time window is the difference of two lookups, whatever the length of the window.
+# Jobs are then scored with the average carbon intensity over the time they actually ran
+# (the power draw of a job is constant, see footprint.py), instead of the annual average of CI_aggregated.csv.
+#
+# Times are in seconds since the epoch (UTC); datetime64, datetime and ISO strings are converted.
+
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+CI_TIMESERIES_FILE = "CI_timeseries.csv"
+
+# Result of CISeries.best_start, times in seconds since the epoch
+StartTime = namedtuple('StartTime', ['start', 'carbonIntensity', 'start_now', 'carbonIntensity_now'])
+
+def _naive_UTC(x):
+    # ISO strings and datetimes with a time zone as UTC datetimes without one (numpy ignores the offsets)
+    if isinstance(x, str):
+        x = datetime.fromisoformat(x[:-1] + '+00:00' if x.endswith('Z') else x)
+    if isinstance(x, datetime) and (x.tzinfo is not None):
+        x = x.astimezone(timezone.utc).replace(tzinfo=None)
+    return x
+
+def to_seconds(times):
+    '''
+    Seconds since the epoch (float), element-wise. Numbers are taken as such,
+    and times without a time zone as UTC.
+    '''
+    times = np.asarray(times)
+    if times.dtype.kind in 'iuf':
+        return times.astype(float)
+    if times.dtype.kind in 'UO':
+        times = np.vectorize(_naive_UTC, otypes=[object])(times)
+    return np.asarray(times, dtype='datetime64[ms]').astype('int64') / 1000.
+
+class CISeries(object):
+    '''
+    Carbon intensity (gCO2e/kWh) of a location, values[i] holding from start + i * step to start + (i+1) * step.
+    '''
+
+    def __init__(self, start, step, values):
+        self.start = float(to_seconds(start))
+        self.step = float(step) # in seconds
+        self.values = np.asarray(values, dtype=float)
+        self.length = len(self.values)
+        if self.step <= 0:
+            raise ValueError("The time step must be positive")
+        if (len(self.values) == 0) or np.isnan(self.values).any():
+            raise ValueError("A carbon intensity series can't be empty or have missing values")
+        # cumulative[i]: integral from start to start + i * step, in gCO2e/kWh * hours
+        self.cumulative = np.concatenate([[0.], np.cumsum(self.values * (self.step / 3600.))])
+
+    @property
+    def end(self):
+        return self.start + self.length * self.step
+
+    def covers(self, t0, t1):
+        return (to_seconds(t0) >= self.start) & (to_seconds(t1) <= self.end)
+
+    def _running_total(self, t):
+        # Integral from start to t, the carbon intensity being constant within each step
+        position = (t - self.start) / self.step
+        i = np.clip(np.floor(position).astype(int), 0, self.length - 1)
+        return self.cumulative[i] + (position - i) * self.values[i] * (self.step / 3600.)
+
+    def integral(self, t0, t1):
+        '''
+        Carbon intensity integrated from t0 to t1, in gCO2e/kWh * hours, in constant time.
+        Raises ValueError if the series doesn't cover the window.
+        '''
+        t0 = to_seconds(t0)
+        t1 = to_seconds(t1)
+        if np.any(t1 < t0):
+            raise ValueError("The end of a window can't be before its start")
+        if not np.all(self.covers(t0, t1)):
+            raise ValueError("The series only covers {} to {}".format(
+                np.datetime64(int(self.start), 's'), np.datetime64(int(self.end), 's')))
+        return self._running_total(t1) - self._running_total(t0)
+
+    def mean(self, t0, t1):
+        '''
+        Average carbon intensity from t0 to t1 (the value at t0 if the window is empty).
+        '''
+        t0 = to_seconds(t0)
+        t1 = to_seconds(t1)
+        duration = (t1 - t0) / 3600.
+        integral = self.integral(t0, t1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(duration > 0, integral / np.where(duration > 0, duration, 1), self.at(t0))
+
+    def at(self, t):
+        position = (to_seconds(t) - self.start) / self.step
+        return self.values[np.clip(np.floor(position).astype(int), 0, self.length - 1)]
+
+    def best_start(self, duration, earliest, latest):
+        '''
+        Start time between earliest and latest with the lowest carbon intensity averaged over duration (in hours),
+        and the same average when starting at earliest. latest is brought forward if the series ends too early.
+        The average is piecewise linear in the start time, so its minimum is either at the ends of the window or
+        where the start or the end of the job crosses a step: only these candidates are evaluated, each with two
+        lookups of the running total, which makes it linear in the length of the window.
+        '''
+        d = float(duration) * 3600.
+        earliest = float(to_seconds(earliest))
+        latest = min(float(to_seconds(latest)), self.end - d)
+        if (earliest < self.start) or (latest < earliest):
+            raise ValueError("The series ({} to {}) doesn't cover a {}h job starting between these times".format(
+                np.datetime64(int(self.start), 's'), np.datetime64(int(self.end), 's'), duration))
+
+        def boundaries(t0, t1):
+            first = np.ceil((t0 - self.start) / self.step)
+            last = np.floor((t1 - self.start) / self.step)
+            return self.start + np.arange(first, last + 1) * self.step
+
+        candidates = np.unique(np.concatenate([[earliest, latest],
+                                               boundaries(earliest, latest),
+                                               boundaries(earliest + d, latest + d) - d]))
+        candidates = candidates[(candidates >= earliest) & (candidates <= latest)]
+        if d > 0:
+            means = (self._running_total(candidates + d) - self._running_total(candidates)) / (d / 3600.)
+        else:
+            means = self.at(candidates)
+        best = int(np.argmin(means)) # the earliest of the best ones
+        return StartTime(start=float(candidates[best]), carbonIntensity=float(means[best]),
+                         start_now=earliest, carbonIntensity_now=float(means[candidates == earliest][0]))
+
+class CITimeSeries(object):
+    '''
+    The series of several locations, keyed by the location codes of CI_aggregated.csv.
+    '''
+
+    def __init__(self, series):
+        self.series = dict(series)
+
+    def __contains__(self, location):
+        return location in self.series
+
+    def __getitem__(self, location):
+        return self.series[location]
+
+    def locations(self):
+        return list(self.series)
+
+    def mean_carbonIntensity(self, locations, t0, t1, fallback=None):
+        '''
+        Average carbon intensity of each job over its window, element-wise.
+        Jobs whose location has no series, or whose window isn't covered, get their value in fallback
+        (e.g. the annual averages of CI_dict); without fallback they raise KeyError/ValueError.
+        '''
+        locations = np.asarray(locations, dtype=str)
+        t0 = np.broadcast_to(to_seconds(t0), locations.shape)
+        t1 = np.broadcast_to(to_seconds(t1), locations.shape)
+
+        output = np.full(locations.shape, np.nan)
+        # jobs grouped by location, each group being handled with whole-array operations
+        uniques, inverse = np.unique(locations.reshape(-1), return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(uniques)))[:-1])
+        t0 = t0.reshape(-1)
+        t1 = t1.reshape(-1)
+        flat_output = output.reshape(-1)
+        for location, jobs in zip(uniques, groups):
+            series = self.series.get(location)
+            if series is None:
+                if fallback is None:
+                    raise KeyError("No carbon intensity series for {}".format(location))
+                covered = np.zeros(len(jobs), dtype=bool)
+            else:
+                covered = series.covers(t0[jobs], t1[jobs])
+                if (fallback is None) and (not covered.all()):
+                    raise ValueError("The series of {} only covers {} to {}".format(
+                        location, np.datetime64(int(series.start), 's'), np.datetime64(int(series.end), 's')))
+                flat_output[jobs[covered]] = series.mean(t0[jobs[covered]], t1[jobs[covered]])
+
+            if not covered.all():
+                try:
+                    flat_output[jobs[~covered]] = fallback[location]
+                except KeyError:
+                    raise KeyError("Unknown location: {}".format(location))
+        return output
+
+def load_CI_timeseries(data_dir, name=CI_TIMESERIES_FILE):
+    '''
+    Reads a csv file with a first row of metadata (like the other files of data/), then a 'datetime' column (UTC)
+    and one column of carbon intensity per location. The time step must be constant.
+    Leading and trailing empty values are dropped, so that the series can cover different periods.
+    Returns None if the file doesn't exist.
+    '''
+    import pandas as pd
+
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        return None
+
+    df = pd.read_csv(path, sep=',', skiprows=1)
+    times = to_seconds(pd.to_datetime(df['datetime'], utc=True).dt.tz_localize(None).values)
+    steps = np.diff(times)
+    if (len(steps) == 0) or np.any(steps != steps[0]):
+        raise ValueError("{}: the time step must be constant".format(name))
+    step = steps[0]
+
+    series = dict()
+    for location in df.columns.drop('datetime'):
+        values = df[location].values.astype(float)
+        valid = np.flatnonzero(~np.isnan(values))
+        if len(valid) == 0:
+            continue
+        first, last = valid[0], valid[-1]
+        if np.isnan(values[first:last + 1]).any():
+            raise ValueError("{}: missing values in the series of {}".format(name, location))
+        series[location] = CISeries(times[first], step, values[first:last + 1])
+    return CITimeSeries(series)
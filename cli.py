@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Command-line tool, run after each job by the scheduler (e.g. in a job epilogue script):
+#   ./green-algorithms --cores 12 --core-model "Xeon E5-2683 v4" --memory 64 --hours 12 --location GB
+# prints the same results as the web page, and
+#   ./green-algorithms --jobs jobs.csv --output results.csv
+# scores every row of a csv (or newline-delimited JSON) file, with the inputs of the API as columns.
+# It only imports calculator.py (standard library), so that it starts in a few tens of milliseconds.
+
+import argparse
+import csv
+import json
+import sys
+
+import calculator
+
+TEXT_FIELDS = ['carbonEmissions_text', 'energy_text', 'treeMonths_text', 'driving_text', 'flying_share_text',
+               'report_text']
+
+# Inputs that can be left out of a file of jobs (or empty), as on the web page
+DEFAULTS = dict(coreType='CPU', runTime_hours=0, runTime_min=0, usage=1, PSF=1, selected_platform='localServer')
+
+FORMATS = ['text', 'json', 'csv']
+
+def parse_number(value):
+    # int if possible, so that the texts show 12h and not 12.0h
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def is_json(name):
+    return name.endswith(('.json', '.jsonl', '.ndjson'))
+
+def read_jobs(f, name):
+    '''
+    Jobs of a csv or newline-delimited JSON file (.json, .jsonl or .ndjson), as dicts
+    (None for the lines that aren't JSON). The values of csv files are strings, see parse_row.
+    '''
+    if is_json(name):
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
+
+    for row in csv.DictReader(f):
+        yield row
+
+def parse_row(row):
+    '''
+    Job of a row of a csv file: values are converted to numbers following calculator.JOB_SCHEMA,
+    empty ones are left out. Raises ValueError if a number can't be read.
+    '''
+    kinds = {name: kind for name, kind, _ in calculator.JOB_SCHEMA}
+    job = dict()
+    for key, value in row.items():
+        if key is None:
+            # csv.DictReader puts the values past the header there
+            raise ValueError("More values than columns")
+        if (value is None) or (value.strip() == ''):
+            continue
+        if kinds.get(key) is float:
+            try:
+                value = parse_number(value)
+            except ValueError:
+                raise ValueError("{} must be a number".format(key))
+        job[key] = value
+    return job
+
+def score(job, reference):
+    '''
+    Results of a job (with DEFAULTS for the missing inputs), and their texts.
+    Raises ValueError or KeyError if the job is invalid.
+    '''
+    if job is None:
+        raise ValueError("Invalid JSON")
+    if not isinstance(job, dict):
+        raise ValueError("A job must be a JSON object")
+    job = dict(DEFAULTS, **{k: v for k, v in job.items() if v is not None})
+    job.setdefault('PUE', reference.lookups.pue['Unknown'])
+    calculator.validate_job(job)
+    aggData = calculator.aggregate(reference, **{name: job.get(name) for name in calculator.JOB_INPUTS})
+    texts = list(calculator.format_results(aggData)) + [calculator.report_text(aggData, reference.lookups)]
+    aggData.update(zip(TEXT_FIELDS, texts))
+    return aggData
+
+def print_text(aggData, out):
+    out.write("Carbon emissions:      {}\n".format(aggData['carbonEmissions_text']))
+    out.write("Energy needed:         {}\n".format(aggData['energy_text']))
+    out.write("Carbon sequestration:  {}\n".format(aggData['treeMonths_text']))
+    out.write("In a passenger car:    {}\n".format(aggData['driving_text']))
+    out.write("In a plane:            {} of a flight {}\n".format(aggData['flying_share_text'],
+                                                                  aggData['flying_text']))
+    out.write("\n{}\n".format(aggData['report_text']))
+
+def write_results(results, output_format, out):
+    '''
+    Writes (job number, results or None, error or None) as they come.
+    '''
+    writer = None
+    for i, aggData, error in results:
+        if output_format == 'json':
+            out.write(json.dumps(aggData if error is None else dict(error=error)) + '\n')
+        elif output_format == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(out, calculator.RESULT_FIELDS + TEXT_FIELDS + ['error'])
+                writer.writeheader()
+            writer.writerow(aggData if error is None else dict(error=error))
+        elif error is not None:
+            # like the results, the error of a single job isn't numbered
+            out.write("{}{}\n\n".format("" if i is None else "Job {}: ".format(i), error))
+        else:
+            if i is not None:
+                out.write("Job {}:\n".format(i))
+            print_text(aggData, out)
+            out.write("\n")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='green-algorithms',
+        description="Carbon footprint of a computation (see green-algorithms.org), "
+                    "for one job described by the options, or for a file of jobs.")
+    job = parser.add_argument_group('job')
+    job.add_argument('--hours', type=parse_number, dest='runTime_hours', help="run time, hours part")
+    job.add_argument('--minutes', type=parse_number, dest='runTime_min', help="run time, minutes part")
+    job.add_argument('--core-type', dest='coreType', choices=calculator.CORE_TYPES, help="default: CPU")
+    job.add_argument('--cores', type=parse_number, dest='n_cores', help="number of cores (or of GPUs)")
+    job.add_argument('--core-model', dest='coreModel', help="model of the cores, or 'other' with --tdp")
+    job.add_argument('--tdp', type=parse_number, help="TDP per core in W, for --core-model other")
+    job.add_argument('--memory', type=parse_number, help="memory available, in GB")
+    job.add_argument('--location', help="location code, as in data/CI_aggregated.csv (e.g. GB, US-CA)")
+    job.add_argument('--usage', type=parse_number, help="usage factor of the cores (default: 1)")
+    job.add_argument('--pue', type=parse_number, dest='PUE', help="PUE of the datacenter (default: the average)")
+    job.add_argument('--psf', type=parse_number, dest='PSF', help="pragmatic scaling factor (default: 1)")
+    job.add_argument('--platform', dest='selected_platform',
+                     help="localServer (default), personalComputer or cloudComputing")
+    job.add_argument('--provider', dest='selected_provider', help="provider code, for its PUE")
+
+    parser.add_argument('--jobs', metavar='FILE',
+                        help="csv or newline-delimited JSON file of jobs ('-' for csv on stdin), "
+                             "with the names of the API inputs as columns (runTime_hours, n_cores...)")
+    parser.add_argument('--format', choices=FORMATS, help="default: text for one job, csv for a file")
+    parser.add_argument('--output', metavar='FILE', help="default: standard output")
+    parser.add_argument('--data-dir', default=calculator.DATA_DIR, help="reference data (default: %(default)s)")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    options = {name: getattr(args, name) for name in calculator.JOB_INPUTS if getattr(args, name) is not None}
+    if args.jobs is None:
+        missing = [name for name in ['n_cores', 'coreModel', 'memory', 'location'] if name not in options]
+        if ('runTime_hours' not in options) and ('runTime_min' not in options):
+            missing.append('runTime_hours')
+        if missing:
+            parser.error("missing options for the job: {}".format(', '.join(missing)))
+
+    reference = calculator.load_reference_data(args.data_dir)
+    output_format = args.format or ('text' if args.jobs is None else 'csv')
+
+    errors = []
+
+    def results(jobs, numbered, csv_rows):
+        for i, job in enumerate(jobs, start=1):
+            try:
+                if csv_rows:
+                    job = parse_row(job)
+                # options given with a file apply to all its jobs, unless they have their own
+                if numbered and isinstance(job, dict):
+                    job = dict(options, **job)
+                yield (i if numbered else None), score(job, reference), None
+            except (KeyError, ValueError) as e:
+                errors.append(i)
+                yield (i if numbered else None), None, str(e.args[0]) if isinstance(e, KeyError) else str(e)
+
+    f = None
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.jobs is None:
+            write_results(results([options], False, False), output_format, out)
+        else:
+            f = sys.stdin if args.jobs == '-' else open(args.jobs, newline='')
+            name = 'stdin.csv' if args.jobs == '-' else args.jobs
+            write_results(results(read_jobs(f, name), True, not is_json(name)), output_format, out)
+    finally:
+        if (f is not None) and (f is not sys.stdin):
+            f.close()
+        if args.output:
+            out.close()
+
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
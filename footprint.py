@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# Carbon footprint formula, shared by the Dash callbacks and the batch tools.
+# Every function works element-wise, so the same code scores a single job (scalars)
+# or millions of jobs at once (numpy arrays). The formula itself is the one of calculator.py.
+
+import numpy as np
+
+import calculator
+from calculator import compute_runTime
+
+# Platforms for which the datacenter PUE is ignored
+PUE_FREE_PLATFORMS = calculator.PUE_FREE_PLATFORMS
+
+# Columns returned by compute_footprint, in the order of the aggregate_data Store
+FOOTPRINT_COLUMNS = [
+    'corePower', 'runTime', 'carbonIntensity', 'PUE',
+    'carbonEmissions', 'CE_core', 'CE_memory',
+    'energy_needed', 'power_needed',
+    'n_treeMonths', 'nkm_drivingUS', 'nkm_drivingEU', 'nkm_train',
+    'flying_context', 'flying_text',
+]
+
+FLYING_TEXTS = np.array(calculator.FLYING_TEXTS)
+
+###########
+# FORMULA #
+###########
+
+def compute_footprint(runTime, n_cores, corePower, memory, carbonIntensity, usage, PUE, PSF, refValues_dict):
+    '''
+    Energy and carbon emissions, element-wise: the formula of calculator.compute_footprint,
+    with the context of compute_context below.
+    '''
+    return calculator.compute_footprint(runTime, n_cores, corePower, memory, carbonIntensity, usage, PUE, PSF,
+                                        refValues_dict, context=compute_context)
+
+def compute_context(carbonEmissions, refValues_dict):
+    '''
+    Same as calculator.compute_context, element-wise.
+    '''
+    output = dict()
+
+    output['n_treeMonths'] = carbonEmissions / refValues_dict['treeYear'] * 12
+
+    output['nkm_drivingUS'] = carbonEmissions / refValues_dict['passengerCar_US_perkm']
+    output['nkm_drivingEU'] = carbonEmissions / refValues_dict['passengerCar_EU_perkm']
+    output['nkm_train'] = carbonEmissions / refValues_dict['train_perkm']
+
+    # 0: Paris-London, 1: NYC-San Francisco, 2: NYC-Melbourne
+    flight_idx = np.where(carbonEmissions < 0.5 * refValues_dict['flight_NY-SF'], 0,
+                          np.where(carbonEmissions < 0.5 * refValues_dict['flight_NYC-MEL'], 1, 2))
+    flight_ref = np.array([refValues_dict['flight_PAR-LON'],
+                           refValues_dict['flight_NY-SF'],
+                           refValues_dict['flight_NYC-MEL']])
+
+    output['flying_context'] = carbonEmissions / flight_ref[flight_idx]
+    output['flying_text'] = FLYING_TEXTS[flight_idx]
+
+    return output
+
+def rank_locations(energy_needed, PUE_used, carbonIntensity, PUE):
+    '''
+    Emissions of a job that needs energy_needed kWh with a PUE of PUE_used, if it ran at each of the locations
+    described by the arrays carbonIntensity and PUE (NaN to keep PUE_used): as the energy is proportional
+    to the PUE, this is a single array multiplication.
+    Returns the indices of the locations from the lowest to the highest emissions, and the emissions.
+    '''
+    PUE = np.where(np.isnan(PUE), PUE_used, PUE)
+    carbonEmissions = (energy_needed / PUE_used) * (PUE * carbonIntensity)
+    return np.argsort(carbonEmissions, kind='stable'), carbonEmissions
+
+#########
+# BATCH #
+#########
+
+def _lookup(keys, mapping, name):
+    # Resolves each unique key once with a dict hit, then broadcasts the results back
+    uniques, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+    values = np.empty(len(uniques), dtype=float)
+    for i, key in enumerate(uniques):
+        try:
+            values[i] = mapping[key]
+        except KeyError:
+            raise KeyError("Unknown {}: {}".format(name, key))
+    return values[inverse.reshape(-1)]
+
+def resolve_corePower(coreType, coreModel, tdp, cores_dict):
+    '''
+    TDP per core for each job: from cores_dict, or the tdp column when the model is "other".
+    '''
+    coreType = np.asarray(coreType, dtype=str)
+    coreModel = np.asarray(coreModel, dtype=str)
+    isOther = coreModel == 'other'
+
+    corePower = np.empty(len(coreModel), dtype=float)
+    for type_ in np.unique(coreType[~isOther]):
+        mask = (coreType == type_) & ~isOther
+        corePower[mask] = _lookup(coreModel[mask], cores_dict[type_], '{} model'.format(type_))
+
+    if isOther.any():
+        if tdp is None:
+            raise ValueError("A tdp column is needed for models set to 'other'")
+        corePower[isOther] = np.asarray(tdp, dtype=float)[isOther]
+
+    return corePower
+
+def resolve_PUE(PUE, selected_platform, selected_provider, pue_dict):
+    '''
+    PUE actually used for each job: 1 on personal computers, the provider's PUE if known,
+    otherwise the PUE provided.
+    '''
+    PUE_used = np.array(PUE, dtype=float)
+
+    if selected_provider is not None:
+        selected_provider = np.asarray(selected_provider, dtype=str)
+        known = np.isin(selected_provider, list(pue_dict.keys()))
+        if known.any():
+            PUE_used[known] = _lookup(selected_provider[known], pue_dict, 'provider')
+
+    if selected_platform is not None:
+        PUE_used[np.isin(np.asarray(selected_platform, dtype=str), PUE_FREE_PLATFORMS)] = 1
+
+    return PUE_used
+
+def score_jobs(jobs, cores_dict, CI_dict, pue_dict, refValues_dict, CI_series=None):
+    '''
+    Vectorised version of aggregate_input_values.
+
+    jobs is a pd.DataFrame or a dict of equal-length arrays, with the columns
+    coreType, coreModel, n_cores, memory, location, usage, PUE, PSF,
+    either runTime (in hours) or runTime_hours and runTime_min,
+    and optionally tdp, selected_platform and selected_provider.
+    With CI_series (a CITimeSeries, see ci_timeseries.py) and a start column (and optionally end,
+    otherwise start + runTime), the carbon intensity is averaged over the time each job ran;
+    jobs outside of the series use the annual values of CI_dict.
+    Returns a dict of arrays with the columns of FOOTPRINT_COLUMNS.
+    '''
+    def column(name, default=None):
+        if name in jobs:
+            return np.asarray(jobs[name])
+        return default
+
+    if 'runTime' in jobs:
+        runTime = np.asarray(jobs['runTime'], dtype=float)
+    else:
+        runTime = compute_runTime(np.asarray(jobs['runTime_hours'], dtype=float),
+                                  np.asarray(jobs['runTime_min'], dtype=float))
+
+    corePower = resolve_corePower(column('coreType'), column('coreModel'), column('tdp'), cores_dict)
+    if (CI_series is not None) and ('start' in jobs):
+        from ci_timeseries import to_seconds
+
+        start = to_seconds(column('start'))
+        end = to_seconds(column('end')) if 'end' in jobs else start + runTime * 3600
+        carbonIntensity = CI_series.mean_carbonIntensity(column('location'), start, end, fallback=CI_dict)
+    else:
+        carbonIntensity = _lookup(column('location'), CI_dict, 'location')
+    PUE_used = resolve_PUE(column('PUE'), column('selected_platform'), column('selected_provider'), pue_dict)
+
+    output = compute_footprint(
+        runTime=runTime,
+        n_cores=np.asarray(jobs['n_cores'], dtype=float),
+        corePower=corePower,
+        memory=np.asarray(jobs['memory'], dtype=float),
+        carbonIntensity=carbonIntensity,
+        usage=np.asarray(jobs['usage'], dtype=float),
+        PUE=PUE_used,
+        PSF=np.asarray(jobs['PSF'], dtype=float),
+        refValues_dict=refValues_dict,
+    )
+    output['corePower'] = corePower
+    output['runTime'] = runTime
+    output['carbonIntensity'] = carbonIntensity
+    output['PUE'] = PUE_used
+
+    return {col: output[col] for col in FOOTPRINT_COLUMNS}
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+# Validation and scoring of the jobs sent to the JSON API (see the API section of app.py),
+# without Dash: a job is the JSON object of the inputs of the form, e.g.
+#   {"coreType": "CPU", "coreModel": "Xeon E5-2683 v4", "n_cores": 12, "memory": 64, "runTime_hours": 12,
+#    "runTime_min": 0, "location": "GB", "usage": 1, "PUE": 1.67, "PSF": 1, "selected_platform": "localServer"}
+# and its result has the fields of the aggregate_data Store.
+#
+# The schema (calculator.JOB_SCHEMA) is a list of plain type checks, run once per job, which is much faster
+# than a generic JSON schema validator. Batches are then scored at once with the vectorised formula (footprint.score_jobs).
+# Streams of jobs (newline-delimited JSON) are scored chunk by chunk, so that memory doesn't grow with them.
+
+import json
+
+import numpy as np
+
+from calculator import CORE_TYPES, JOB_INPUTS, JOB_SCHEMA, RESULT_FIELDS, ValidationError, validate_job
+from footprint import FOOTPRINT_COLUMNS, score_jobs
+
+MAX_BATCH = 10000 # jobs per request
+STREAM_CHUNK = 2000 # jobs scored at once by score_stream
+
+def check_references(job, lookups):
+    '''
+    Message about the first input of a valid job that isn't in the reference data, None if there is none.
+    '''
+    if job['location'] not in lookups.CI:
+        return "Unknown location: {}".format(job['location'])
+    if (job['coreModel'] != 'other') and (job['coreModel'] not in lookups.cores[job['coreType']]):
+        return "Unknown {} model: {}".format(job['coreType'], job['coreModel'])
+    return None
+
+def score_batch(jobs, lookups, refValues_dict, data_version, carbonIntensity=None):
+    '''
+    Results of a list of jobs, in the same order: the fields of the aggregate_data Store,
+    or {'error': message} for the jobs that are invalid or refer to unknown models or locations.
+    carbonIntensity(location, default) replaces the static values if given (see ci_providers.py).
+    '''
+    results = [None] * len(jobs)
+    valid = []
+    for i, job in enumerate(jobs):
+        try:
+            validate_job(job)
+            error = check_references(job, lookups)
+        except ValidationError as e:
+            error = str(e)
+        if error is None:
+            valid.append(i)
+        else:
+            results[i] = dict(error=error)
+    if not valid:
+        return results
+
+    columns = {name: [jobs[i].get(name) for i in valid] for name in JOB_INPUTS}
+    columns['tdp'] = [np.nan if x is None else x for x in columns['tdp']]
+    columns['selected_provider'] = ['' if x is None else x for x in columns['selected_provider']]
+
+    CI_dict = lookups.CI
+    if carbonIntensity is not None:
+        CI_dict = {location: carbonIntensity(location, lookups.CI[location]) for location in set(columns['location'])}
+
+    footprint = score_jobs(columns, cores_dict=lookups.cores, CI_dict=CI_dict, pue_dict=lookups.pue,
+                           refValues_dict=refValues_dict)
+    # lists of Python numbers, which are what the single job results are made of
+    computed = {name: values.tolist() for name, values in footprint.items()}
+    computed['data_version'] = [data_version] * len(valid)
+    fields = [computed[name] if name in computed else columns[name] for name in RESULT_FIELDS]
+
+    for i, row in zip(valid, zip(*fields)):
+        results[i] = dict(zip(RESULT_FIELDS, row))
+    return results
+
+def read_lines(stream, block_size=64 * 1024):
+    '''
+    Lines of a binary file-like object, read block_size bytes at a time
+    (iterating over a WSGI input directly reads it in tiny pieces).
+    '''
+    rest = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+def score_stream(lines, lookups, refValues_dict, data_version, carbonIntensity=None, chunk_size=STREAM_CHUNK):
+    '''
+    Scores an iterable of newline-delimited JSON jobs (bytes or str, one job per line), chunk_size at a time,
+    and yields the results as newline-delimited JSON, one bytes per chunk. Each non-empty line gets a
+    line of results (see score_batch), in the same order; lines that aren't JSON get an error.
+    '''
+    invalid = object() # placeholder of the lines that aren't JSON
+
+    def score(chunk):
+        results = score_batch(chunk, lookups, refValues_dict, data_version, carbonIntensity=carbonIntensity)
+        results = [dict(error="Invalid JSON") if job is invalid else result for job, result in zip(chunk, results)]
+        return ''.join(json.dumps(result, separators=(',', ':')) + '\n' for result in results).encode('utf-8')
+
+    chunk = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError:
+            chunk.append(invalid)
+        if len(chunk) >= chunk_size:
+            yield score(chunk)
+            chunk = []
+    if chunk:
+        yield score(chunk)
+
+def score_columns(columns, lookups, refValues_dict, data_version, carbonIntensity=None):
+    '''
+    Columnar version of score_batch: columns holds an array per input of JOB_SCHEMA (numbers as floats,
+    NaN if missing, strings as objects, None if missing; absent optional columns are missing everywhere).
+    Every check is an array operation. Returns (results, errors): an array per field of RESULT_FIELDS,
+    NaN or None for the invalid jobs, and the error of each job (None for the valid ones).
+    '''
+    n = len(columns['location'])
+    errors = np.full(n, None, dtype=object)
+
+    def fail(mask, message):
+        # only the first problem of each job is reported
+        errors[mask & np.equal(errors, None)] = message
+
+    inputs = dict()
+    for name, kind, required in JOB_SCHEMA:
+        if kind is float:
+            values = np.asarray(columns[name], dtype=float) if name in columns else np.full(n, np.nan)
+            missing = np.isnan(values)
+            if required:
+                fail(missing, "Missing input: {}".format(name))
+            fail(np.isinf(values), "{} must be a number".format(name))
+            fail(values < 0, "{} can't be negative".format(name))
+        else:
+            values = np.asarray(columns[name], dtype=object) if name in columns else np.full(n, None, dtype=object)
+            missing = np.equal(values, None)
+            if required:
+                fail(missing, "Missing input: {}".format(name))
+            values = np.where(missing, '', values).astype(str)
+        inputs[name] = values
+
+    fail(~np.isin(inputs['coreType'], CORE_TYPES), "coreType must be one of {}".format(', '.join(CORE_TYPES)))
+    isOther = inputs['coreModel'] == 'other'
+    fail(isOther & np.isnan(inputs['tdp']), "Missing input: tdp (needed when coreModel is 'other')")
+
+    # the reference data is looked up once per distinct value
+    locations, inverse = np.unique(inputs['location'], return_inverse=True)
+    for k in np.flatnonzero(~np.isin(locations, list(lookups.CI))):
+        fail(inverse.reshape(-1) == k, "Unknown location: {}".format(locations[k]))
+    for coreType in CORE_TYPES:
+        isType = (inputs['coreType'] == coreType) & ~isOther
+        models = np.unique(inputs['coreModel'][isType])
+        for model in models[~np.isin(models, list(lookups.cores[coreType]))]:
+            fail(isType & (inputs['coreModel'] == model), "Unknown {} model: {}".format(coreType, model))
+
+    valid = np.equal(errors, None)
+    results = dict()
+    for name in RESULT_FIELDS:
+        if name in inputs:
+            results[name] = np.where(valid, inputs[name], np.nan if inputs[name].dtype.kind == 'f' else None)
+
+    jobs = {name: values[valid] for name, values in inputs.items()}
+    CI_dict = lookups.CI
+    if carbonIntensity is not None:
+        CI_dict = {location: carbonIntensity(location, lookups.CI[location]) for location in np.unique(jobs['location'])}
+    footprint = score_jobs(jobs, cores_dict=lookups.cores, CI_dict=CI_dict, pue_dict=lookups.pue,
+                           refValues_dict=refValues_dict)
+    for name, values in footprint.items():
+        if values.dtype.kind == 'f':
+            results[name] = np.full(n, np.nan)
+        else:
+            results[name] = np.full(n, None, dtype=object)
+        results[name][valid] = values
+    results['data_version'] = np.where(valid, data_version, None)
+
+    return results, errors
+
+#########
+# ARROW #
+#########
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+def arrow_results_schema():
+    import pyarrow as pa
+
+    types = {name: (pa.float64() if kind is float else pa.string()) for name, kind, _ in JOB_SCHEMA}
+    types.update({name: pa.float64() for name in FOOTPRINT_COLUMNS})
+    types.update(flying_text=pa.string(), data_version=pa.int64(), error=pa.string())
+    return pa.schema([(name, types[name]) for name in RESULT_FIELDS + ['error']])
+
+def check_arrow_schema(schema):
+    '''
+    Raises ValidationError if a column of the Arrow schema of a request has the wrong type.
+    '''
+    import pyarrow as pa
+
+    errors = []
+    types = {name: kind for name, kind, _ in JOB_SCHEMA}
+    for field in schema:
+        kind = types.get(field.name)
+        if (kind is None) or pa.types.is_null(field.type):
+            continue
+        if (kind is float) and not (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)):
+            errors.append("{} must be a column of numbers".format(field.name))
+        if (kind is str) and not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or
+                                  pa.types.is_dictionary(field.type)):
+            errors.append("{} must be a column of strings".format(field.name))
+    if errors:
+        raise ValidationError(errors)
+
+def score_arrow(reader, lookups, refValues_dict, data_version, carbonIntensity=None):
+    '''
+    Scores the record batches of an Arrow IPC stream reader (columns named like the inputs of JOB_SCHEMA)
+    one at a time, and yields an Arrow IPC stream of results: a column per field of RESULT_FIELDS,
+    null for the invalid jobs, and an error column. Call check_arrow_schema first.
+    '''
+    import pyarrow as pa
+
+    class Sink(object):
+        # what the writer writes, until it is yielded
+        def __init__(self):
+            self.parts = []
+            self.closed = False
+
+        def write(self, data):
+            self.parts.append(bytes(data))
+
+        def flush(self):
+            pass
+
+        def drain(self):
+            data = b''.join(self.parts)
+            self.parts = []
+            return data
+
+    sink = Sink()
+    schema = arrow_results_schema()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in reader:
+        columns = dict()
+        for name, kind, _ in JOB_SCHEMA:
+            if name not in batch.schema.names:
+                continue
+            column = batch.column(batch.schema.get_field_index(name))
+            if kind is float:
+                column = column.cast(pa.float64())
+            elif pa.types.is_dictionary(column.type):
+                column = column.cast(pa.string())
+            columns[name] = column.to_numpy(zero_copy_only=False)
+        if 'location' not in columns:
+            columns['location'] = np.full(batch.num_rows, None, dtype=object)
+
+        results, errors = score_columns(columns, lookups, refValues_dict, data_version,
+                                        carbonIntensity=carbonIntensity)
+        invalid = ~np.equal(errors, None)
+        results['error'] = errors
+        arrays = [pa.array(results[field.name], type=field.type, mask=invalid if field.type == pa.float64() else None)
+                  for field in schema]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
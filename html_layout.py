@@ -12,12 +12,18 @@ def create_appLayout(platformType_options,
                      usage_default,
                      PSF_default,
                      image_dir,
-                     mapCI):
+                     mapCI_placeholder,
+                     mapCI_url,
+                     referenceData=None,
+                     startTime_available=False):
 
     appLayout = html.Div(
         [
             dcc.Store(id="aggregate_data"),
 
+            # reference data used by the clientside callbacks
+            dcc.Store(id="reference_data", data=referenceData),
+
             #### HEADER ####
 
             html.Div(
@@ -471,14 +477,17 @@ def create_appLayout(platformType_options,
             html.Div(
                 [
                     html.H2("Carbon Intensity across the world"),
+                    # the figure is loaded from mapCI_url once the page is displayed, see assets/lazy_figures.js
                     html.Div(
                         [
                             dcc.Graph(
-                                figure=mapCI,
+                                id='mapCI_graph',
+                                figure=mapCI_placeholder,
                                 className='graph',
                             )
                         ],
-                        className='graph-container'
+                        className='graph-container',
+                        **{'data-figure-url': mapCI_url}
                     )
 
                 ],
@@ -567,6 +576,86 @@ def create_appLayout(platformType_options,
                 className='container to-do'
             ),
 
+            #### WHEN TO RUN IT ####
+
+            html.Div(
+                [
+                    html.H2("When should you run it?"),
+
+                    dcc.Markdown('''
+                    The carbon intensity of the grid changes during the day. 
+                    If your job can wait, starting it at the right time reduces its footprint.
+                    '''),
+
+                    html.Div(
+                        [
+                            html.Label("Latest start (hours from now)"),
+
+                            dcc.Input(
+                                type='number',
+                                id="startWindow_input",
+                                value=24,
+                                min=0,
+                            ),
+                        ],
+                        className='form-row short-input'
+                    ),
+
+                    html.Button("Find the best start time", id='startTime_button', n_clicks=0,
+                                className='start-time-button'),
+
+                    dcc.Markdown(id='startTime_markdown'),
+                ],
+                className='container start-time',
+                # only shown if there are hourly carbon intensity series, see ci_timeseries.py
+                style=dict() if startTime_available else dict(display='none'),
+            ),
+
+            #### WHERE TO RUN IT ####
+
+            html.Div(
+                [
+                    html.H2("Where should you run it?"),
+
+                    dcc.Markdown('''
+                    The emissions of the same job in every region, from the lowest to the highest 
+                    (taking into account the PUE of each provider).
+                    '''),
+
+                    dcc.RadioItems(
+                        id='regionsScope_radio',
+                        options=[
+                            {'label': "Datacentres of this provider", 'value': 'provider'},
+                            {'label': "All cloud datacentres", 'value': 'datacenters'},
+                            {'label': "Anywhere", 'value': 'all'},
+                        ],
+                        value='all',
+                        className="radio-input"
+                    ),
+
+                    dcc.RadioItems(
+                        id='regionsTop_radio',
+                        options=[
+                            {'label': "Top 10", 'value': 10},
+                            {'label': "Top 50", 'value': 50},
+                            {'label': "All of them", 'value': 'all'},
+                        ],
+                        value=10,
+                        className="radio-input"
+                    ),
+
+                    dcc.Checklist(
+                        id='regionsShow_checklist',
+                        options=[{'label': "Show the ranking", 'value': 'show'}],
+                        value=[],
+                        className="radio-input"
+                    ),
+
+                    html.Div(id='regionsRanking_div', className='regions-ranking'),
+                ],
+                className='container regions'
+            ),
+
             #### FORMULA ####
 
             html.Div(
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Responses that are identical for every visitor, serialised and compressed once,
+# and served with a strong ETag so that browsers only download them again when they change,
+# and static files served from the compressed versions written by build_assets.py.
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import sys
+
+import flask
+
+class PrecompressedResource(object):
+    '''
+    A response body kept in memory both raw and gzipped, with its ETag.
+    '''
+
+    def __init__(self, body, mimetype, max_age=86400):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.mimetype = mimetype
+        self.max_age = max_age
+        self.etag = hashlib.sha1(body).hexdigest()
+        # mtime=0 so that the compressed bytes only depend on the content
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+
+    def response(self, request=None):
+        if request is None:
+            request = flask.request
+
+        if self.etag in request.if_none_match:
+            response = flask.Response(status=304)
+        elif 'gzip' in request.accept_encodings:
+            response = flask.Response(self.gzip_body, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = flask.Response(self.body, mimetype=self.mimetype)
+
+        response.set_etag(self.etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age={}'.format(self.max_age)
+        return response
+
+class PrecompressedFiles(object):
+    '''
+    Serves the static files of the app (assets/ and the Dash bundles) from their gzip or brotli versions
+    made by build_assets.py, to the clients that accept them.
+    Requests for which there is no up-to-date compressed version are left to Dash.
+    '''
+
+    ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+    def __init__(self, app, directory):
+        self.app = app
+        self.directory = directory
+        prefix = app.config.routes_pathname_prefix
+        self.assets_prefix = prefix + app.config.assets_url_path.strip('/') + '/'
+        self.suites_prefix = prefix + '_dash-component-suites/'
+        self.served = 0
+
+    def _source(self, path):
+        '''
+        (path in self.directory, source file, fingerprinted) of a request path, or None.
+        '''
+        if path.startswith(self.assets_prefix):
+            path_in_dir = path[len(self.assets_prefix):]
+            source_dir = self.app.config.assets_folder
+            target_dir = 'assets'
+            fingerprinted = False
+        elif path.startswith(self.suites_prefix):
+            package_name, _, path_in_pkg = path[len(self.suites_prefix):].partition('/')
+            try:
+                # dash>=1.11 adds the version to the file names
+                from dash.fingerprint import check_fingerprint
+                path_in_pkg, fingerprinted = check_fingerprint(path_in_pkg)
+            except ImportError:
+                fingerprinted = False
+            # Same restriction as Dash: only the files of the components used by the app
+            registered_paths = getattr(self.app, 'registered_paths', {})
+            if path_in_pkg not in registered_paths.get(package_name, ()):
+                return None
+            package = sys.modules.get(package_name)
+            if package is None:
+                return None
+            path_in_dir = path_in_pkg
+            source_dir = list(package.__path__)[0]
+            target_dir = '_dash-component-suites/' + package_name
+        else:
+            return None
+
+        path_in_dir = posixpath.normpath(path_in_dir)
+        if path_in_dir.startswith(('..', '/')):
+            return None
+        return (os.path.join(self.directory, target_dir, path_in_dir), os.path.join(source_dir, path_in_dir),
+                fingerprinted)
+
+    def response(self):
+        '''
+        To be used as a before_request function: a response, or None to let Dash handle the request.
+        '''
+        request = flask.request
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        source = self._source(request.path)
+        if source is None:
+            return None
+        target, source_path, fingerprinted = source
+
+        for encoding, extension in self.ENCODINGS:
+            if request.accept_encodings[encoding] <= 0:
+                continue
+            path = target + extension
+            try:
+                if os.path.getmtime(path) < os.path.getmtime(source_path):
+                    continue # stale, build_assets.py needs to be run again
+            except OSError:
+                continue
+
+            mimetype = mimetypes.guess_type(source_path)[0] or 'application/octet-stream'
+            response = flask.send_file(path, mimetype=mimetype, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+            if fingerprinted:
+                # as Dash does, the fingerprint changes with each version
+                response.cache_control.no_cache = None
+                response.cache_control.max_age = 31536000
+            self.served += 1
+            return response
+        return None
+
+    def init_app(self, server):
+        server.before_request(self.response)
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+# Loading of the reference data (data/ directory), and read-only lookup tables built once from it,
+# so that callbacks never have to scan a DataFrame to find a value.
+
+import csv
+import hashlib
+import json
+import math
+import os
+from collections import namedtuple
+from types import MappingProxyType
+
+LocationInfo = namedtuple('LocationInfo', ['carbonIntensity', 'continentName', 'countryName', 'regionName', 'ISO3'])
+
+ReferenceLookups = namedtuple('ReferenceLookups', [
+    'locations', # location -> LocationInfo
+    'CI',        # location -> carbon intensity (gCO2e/kWh)
+    'pue',       # provider -> PUE
+    'tdp',       # (coreType, model) -> TDP per core (W)
+    'cores',     # coreType -> {model -> TDP per core (W)}
+])
+
+def _first_wins(pairs):
+    # Same semantics as `df.loc[df.key == key].values[0]`: the first matching row is used
+    output = dict()
+    for k, v in pairs:
+        output.setdefault(k, v)
+    return output
+
+def build_lookups(CI_df, pue_df, cpu_df, gpu_df):
+    '''
+    Builds the immutable lookup layer from the reference DataFrames.
+    '''
+    ISO3 = CI_df.ISO3 if 'ISO3' in CI_df else [''] * len(CI_df)
+
+    locations = _first_wins(
+        (loc, LocationInfo(float(ci), continent, country, region, iso3))
+        for loc, ci, continent, country, region, iso3 in zip(CI_df.location, CI_df.carbonIntensity,
+                                                              CI_df.continentName, CI_df.countryName,
+                                                              CI_df.regionName, ISO3)
+    )
+    CI = {loc: info.carbonIntensity for loc, info in locations.items()}
+
+    pue = _first_wins((provider, float(value)) for provider, value in zip(pue_df.provider, pue_df.PUE))
+
+    cores = dict()
+    for coreType, df in [('CPU', cpu_df), ('GPU', gpu_df)]:
+        cores[coreType] = MappingProxyType(_first_wins(
+            (model, float(value)) for model, value in zip(df.model, df.TDP_per_core)
+        ))
+    tdp = {(coreType, model): value for coreType, models in cores.items() for model, value in models.items()}
+
+    return ReferenceLookups(
+        locations=MappingProxyType(locations),
+        CI=MappingProxyType(CI),
+        pue=MappingProxyType(pue),
+        tdp=MappingProxyType(tdp),
+        cores=MappingProxyType(cores),
+    )
+
+#################
+# OPTIONS INDEX #
+#################
+
+# Key used in the options index when the choices are not restricted to one provider
+# (a sentinel, so that a missing provider, None, isn't taken for it)
+ALL_PROVIDERS = object()
+
+OptionsIndex = namedtuple('OptionsIndex', [
+    'providers',  # platformType -> provider options
+    'locations',  # provider (or ALL_PROVIDERS) -> LocationOptions
+    'hardware',   # provider (or ALL_PROVIDERS) -> HardwareOptions
+])
+
+LocationOptions = namedtuple('LocationOptions', [
+    'continents', # continent options
+    'countries',  # continent -> country options
+    'regions',    # (continent, country) -> region options
+])
+
+HardwareOptions = namedtuple('HardwareOptions', [
+    'coreTypes',  # coreType options
+    'models',     # coreType -> sorted list of models
+    'modelOptions', # coreType -> model options, with "Other" at the end
+])
+
+def _options(values):
+    return [{'label': k, 'value': k} for k in sorted(values)]
+
+def _location_options(rows):
+    countries = dict()
+    regions = dict()
+    for row in rows:
+        countries.setdefault(row.continentName, set()).add(row.countryName)
+        regions.setdefault((row.continentName, row.countryName), []).append(row)
+
+    return LocationOptions(
+        continents=_options(countries.keys()),
+        countries={continent: _options(names) for continent, names in countries.items()},
+        regions={key: [{'label': row.regionName, 'value': row.location}
+                       for row in sorted(locs, key=lambda row: row.regionName)]
+                 for key, locs in regions.items()},
+    )
+
+def _hardware_options(models_by_type):
+    models = {coreType: sorted(models) for coreType, models in models_by_type.items()}
+    return HardwareOptions(
+        coreTypes=_options(models.keys()),
+        models=models,
+        modelOptions={coreType: [{'label': k, 'value': k} for k in models[coreType]] +
+                                [{'label': "Other", 'value': "other"}]
+                      for coreType in models},
+    )
+
+def build_options_index(CI_df, datacenters_dict, hardware_df, providersNames_df, cores_dict):
+    '''
+    Pre-computes every option list of the cascading dropdowns,
+    so that each step of the cascade is a dict lookup.
+    '''
+    # Provider choices, by platform
+    providers = dict()
+    for platformType, providerName, provider in zip(providersNames_df.platformType,
+                                                    providersNames_df.providerName,
+                                                    providersNames_df.provider):
+        providers.setdefault(platformType, []).append({'label': providerName, 'value': provider})
+    for platformType in providers:
+        providers[platformType].append({'label': "Other", 'value': "other"})
+
+    # Locations: continent -> country -> region
+    CI_rows = list(CI_df[['location', 'continentName', 'countryName', 'regionName']].itertuples(index=False))
+    locations = {ALL_PROVIDERS: _location_options(CI_rows)}
+    for provider, datacenters in datacenters_dict.items():
+        datacenters = set(datacenters)
+        locations[provider] = _location_options([row for row in CI_rows if row.location in datacenters])
+
+    # Hardware: coreType -> models
+    hardware = {ALL_PROVIDERS: _hardware_options(cores_dict)}
+    models_by_provider = dict()
+    for provider, coreType, model in zip(hardware_df.provider, hardware_df.type, hardware_df.model):
+        models_by_provider.setdefault(provider, dict()).setdefault(coreType, []).append(model)
+    for provider, models_by_type in models_by_provider.items():
+        hardware[provider] = _hardware_options(models_by_type)
+
+    return OptionsIndex(providers=providers, locations=locations, hardware=hardware)
+
+################
+# REGION INDEX #
+################
+
+# Key of the region index for the datacenters of every provider
+ALL_DATACENTERS = 'allDatacenters'
+
+RegionIndex = namedtuple('RegionIndex', [
+    'providers',       # array of provider codes ('' for the locations of CI_df)
+    'locations',       # array of location codes
+    'carbonIntensity', # array, in gCO2e/kWh
+    'PUE',             # array, NaN where the PUE of the job is kept
+])
+
+def _region_index(rows):
+    import numpy as np
+
+    rows = list(rows)
+    return RegionIndex(
+        providers=np.array([row[0] for row in rows], dtype=str),
+        locations=np.array([row[1] for row in rows], dtype=str),
+        carbonIntensity=np.array([row[2] for row in rows], dtype=float),
+        PUE=np.array([row[3] for row in rows], dtype=float),
+    )
+
+def build_region_index(lookups, datacenters_dict):
+    '''
+    Candidate regions for a job, as arrays, so that a job is scored everywhere at once (see footprint.rank_locations):
+    one entry per provider with its datacenters and its PUE, ALL_DATACENTERS for the datacenters of every provider,
+    and ALL_PROVIDERS for every location of CI_df (at the PUE of the job).
+    '''
+    nan = float('nan')
+    regions = dict()
+    datacenters = []
+    for provider, locations in datacenters_dict.items():
+        rows = [(provider, loc, lookups.CI[loc], lookups.pue.get(provider, nan))
+                for loc in locations if loc in lookups.CI]
+        if rows:
+            regions[provider] = _region_index(rows)
+            datacenters += rows
+    regions[ALL_DATACENTERS] = _region_index(datacenters)
+    regions[ALL_PROVIDERS] = _region_index(('', loc, ci, nan) for loc, ci in lookups.CI.items())
+    return regions
+
+################
+# LOADING DATA #
+################
+
+# csv files of the data/ directory, by table name
+# The first row of each file contains metadata and is skipped
+CSV_FILES = {
+    'cpu': "TDP_cpu.csv",
+    'gpu': "TDP_gpu.csv",
+    'pue': "servers_PUE.csv",
+    'hardware': "providers_hardware.csv",
+    'CI': "CI_aggregated.csv",
+    'CI_ISO3': "CI_ISO3.csv", # generated by build_data.py
+    'cloudDatacenters': "cloudProviders_datacenters.csv",
+    'localDatacenters': "localProviders_datacenters.csv",
+    'providersNames': "providersNamesCodes.csv",
+    'refValues': "referenceValues.csv",
+}
+
+def sources_hashes(data_dir):
+    '''
+    Hash of each csv file the reference data is read from.
+    '''
+    output = dict()
+    for name in sorted(set(CSV_FILES.values())):
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            output[name] = hashlib.sha1(f.read()).hexdigest()
+    return output
+
+def files_hashes(data_dir, names):
+    '''
+    Hash of each of the files `names` of data_dir, None for the ones that don't exist.
+    '''
+    output = dict()
+    for name in names:
+        try:
+            with open(os.path.join(data_dir, name), 'rb') as f:
+                output[name] = hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            output[name] = None
+    return output
+
+def files_revision(paths):
+    '''
+    Revision of a set of files: the time they were last modified, in milliseconds (0 if none of them exists).
+    It only increases as they are edited, and all the processes reading them agree on it.
+    '''
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns // 1000000)
+        except OSError:
+            pass
+    return max(mtimes or [0])
+
+def content_hash(hashes):
+    # Single identifier of the content of a set of files
+    return hashlib.sha1(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:12]
+
+def read_csv_rows(data_dir, name):
+    '''
+    Rows of one of the csv files of CSV_FILES, as dicts of strings, with the csv module only.
+    '''
+    with open(os.path.join(data_dir, CSV_FILES[name]), newline='', encoding='utf-8') as f:
+        next(f) # metadata
+        return list(csv.DictReader(f))
+
+def load_csv_lookups(data_dir):
+    '''
+    Same as build_lookups(...) from load_csv_tables(data_dir), and the reference values,
+    without pandas (for calculator.py). Returns (lookups, refValues_dict).
+    '''
+    def number(x):
+        return float(x) if x.strip() else float('nan')
+
+    ISO3 = {row['location']: row['ISO3'] for row in read_csv_rows(data_dir, 'CI_ISO3')}
+    locations = _first_wins(
+        (row['location'], LocationInfo(number(row['carbonIntensity']), row['continentName'], row['countryName'],
+                                       row['regionName'], ISO3.get(row['location'], '')))
+        for row in read_csv_rows(data_dir, 'CI')
+    )
+    pue = _first_wins((row['provider'], number(row['PUE'])) for row in read_csv_rows(data_dir, 'pue'))
+    cores = {coreType: MappingProxyType(_first_wins((row['model'], number(row['TDP_per_core']))
+                                                    for row in read_csv_rows(data_dir, name)))
+             for coreType, name in [('CPU', 'cpu'), ('GPU', 'gpu')]}
+    refValues_dict = {row['variable']: number(row['value']) for row in read_csv_rows(data_dir, 'refValues')}
+
+    lookups = ReferenceLookups(
+        locations=MappingProxyType(locations),
+        CI=MappingProxyType({loc: info.carbonIntensity for loc, info in locations.items()}),
+        pue=MappingProxyType(pue),
+        tdp=MappingProxyType({(coreType, model): value for coreType, models in cores.items()
+                              for model, value in models.items()}),
+        cores=MappingProxyType(cores),
+    )
+    return lookups, refValues_dict
+
+def load_csv_tables(data_dir):
+    '''
+    Reads the csv files into pd.DataFrames, keyed like CSV_FILES
+    (the two datacenters files are merged into 'datacenters').
+    '''
+    import pandas as pd
+
+    def read(name, drop=None):
+        df = pd.read_csv(os.path.join(data_dir, CSV_FILES[name]), sep=',', skiprows=1)
+        if drop is not None:
+            df.drop(drop, axis=1, inplace=True)
+        return df
+
+    tables = dict()
+    tables['cpu'] = read('cpu', drop=['source'])
+    tables['gpu'] = read('gpu', drop=['source'])
+    tables['pue'] = read('pue', drop=['source'])
+    tables['hardware'] = read('hardware', drop=['source'])
+
+    # TODO include offset of cloud providers (servers_offset.csv)
+
+    tables['CI'] = read('CI', drop=['source','Type'])
+    # ISO3 codes are resolved by build_data.py, so that pycountry is not needed here
+    ISO3_df = read('CI_ISO3')
+    ISO3_dict = pd.Series(ISO3_df.ISO3.values, index=ISO3_df.location).to_dict()
+    tables['CI']['ISO3'] = tables['CI'].location.map(ISO3_dict).fillna('')
+
+    tables['datacenters'] = pd.concat([read('cloudDatacenters'), read('localDatacenters')], axis=1)
+    tables['providersNames'] = read('providersNames')
+    tables['refValues'] = read('refValues', drop=['source'])
+
+    return tables
+
+def load_tables(data_dir, use_snapshot=True):
+    '''
+    Loads the reference tables from the compiled snapshot (see build_data.py) if it is up to date,
+    and falls back on the csv files otherwise.
+    Returns the tables and the hash of the data they were read from (see content_hash).
+    '''
+    from reference_snapshot import read_snapshot, snapshot_to_dataframes
+
+    if use_snapshot:
+        snapshot = read_snapshot(data_dir)
+        if snapshot is not None:
+            return snapshot_to_dataframes(snapshot), snapshot['_meta']['data_hash']
+
+    return load_csv_tables(data_dir), content_hash(sources_hashes(data_dir))
+
+##############
+# CLIENTSIDE #
+##############
+
+# Reference values used by the formula, see footprint.py
+FORMULA_REFVALUES = ['memoryPower', 'treeYear', 'passengerCar_US_perkm', 'passengerCar_EU_perkm', 'train_perkm',
+                     'flight_PAR-LON', 'flight_NY-SF', 'flight_NYC-MEL']
+
+def clientside_payload(lookups, refValues_dict, defaults=None, regions=None):
+    '''
+    Compact, JSON-ready copy of the reference data needed by the clientside callbacks (assets/clientside.js).
+    defaults holds the default values of the form (usage, PUE, PSF),
+    and regions the output of build_region_index, for the ranking of the regions.
+    '''
+    output = dict(
+        CI=dict(lookups.CI),
+        PUE=dict(lookups.pue),
+        cores={coreType: dict(models) for coreType, models in lookups.cores.items()},
+        refValues={k: float(refValues_dict[k]) for k in FORMULA_REFVALUES},
+        defaults=dict(defaults or {}),
+    )
+    if regions is not None:
+        output['regions'] = _clientside_regions(regions, lookups)
+    return output
+
+def _clientside_regions(regions, lookups):
+    # The region index as lists (null where the PUE of the job is kept), by scope, and the names of the locations
+    def lists(region):
+        return dict(
+            providers=region.providers.tolist(),
+            locations=region.locations.tolist(),
+            carbonIntensity=region.carbonIntensity.tolist(),
+            PUE=[None if math.isnan(x) else x for x in region.PUE.tolist()],
+        )
+
+    return dict(
+        all=lists(regions[ALL_PROVIDERS]),
+        datacenters=lists(regions[ALL_DATACENTERS]),
+        providers={provider: lists(region) for provider, region in regions.items()
+                   if provider not in (ALL_PROVIDERS, ALL_DATACENTERS)},
+        names={location: [info.countryName, info.regionName] for location, info in lookups.locations.items()},
+    )
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# Compiled snapshot of the reference tables, built by build_data.py.
+#
+# Layout of the file:
+#   MAGIC | format version (uint32) | header length (uint32) | header (JSON) | padding | arrays
+# The header holds the string table, the description of every column and the hashes of the csv files
+# it was built from. Numeric columns are stored as raw arrays, and string columns as int32 indices
+# into the string table (-1 for missing values), so that everything can be memory-mapped.
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from reference_data import CSV_FILES, content_hash, sources_hashes
+
+SNAPSHOT_FILE = "reference_data.snapshot"
+MAGIC = b'GREENALG'
+FORMAT_VERSION = 2
+
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+def _pad(n):
+    return (-n) % _ALIGN
+
+#########
+# WRITE #
+#########
+
+def write_snapshot(tables, data_dir, path=None):
+    '''
+    Compiles a dict of pd.DataFrames into a snapshot file. The file is replaced atomically.
+    '''
+    if path is None:
+        path = os.path.join(data_dir, SNAPSHOT_FILE)
+
+    strings = []
+    string_ids = dict()
+
+    def string_id(x):
+        if not isinstance(x, str):
+            return -1
+        if x not in string_ids:
+            string_ids[x] = len(strings)
+            strings.append(x)
+        return string_ids[x]
+
+    arrays = []
+    offset = 0
+    header_tables = dict()
+    for table_name, df in tables.items():
+        columns = []
+        for col in df.columns:
+            if df[col].dtype.kind in 'iuf':
+                values = np.ascontiguousarray(df[col].values)
+                kind = 'number'
+            elif df[col].dtype.kind == 'b':
+                values = df[col].values.astype(np.uint8)
+                kind = 'bool'
+            else:
+                values = np.array([string_id(x) for x in df[col]], dtype=np.int32)
+                kind = 'string'
+            columns.append(dict(name=str(col), kind=kind, dtype=values.dtype.str,
+                                offset=offset, length=len(values)))
+            arrays.append(values)
+            offset += values.nbytes + _pad(values.nbytes)
+        header_tables[table_name] = columns
+
+    hashes = sources_hashes(data_dir)
+    header = json.dumps(dict(
+        format=FORMAT_VERSION,
+        data_hash=content_hash(hashes),
+        sources=hashes,
+        strings=strings,
+        tables=header_tables,
+    )).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * _pad(_PREAMBLE.size + len(header)))
+        for values in arrays:
+            f.write(values.tobytes())
+            f.write(b'\0' * _pad(values.nbytes))
+    os.replace(tmp_path, path)
+
+    return path
+
+########
+# READ #
+########
+
+def read_snapshot(data_dir, path=None, check_sources=True):
+    '''
+    Memory-maps a snapshot and returns {table: {column: array or list of str}},
+    or None if the file is missing, of another format version, or older than the csv files.
+    '''
+    if path is None:
+        path = os.path.join(data_dir, SNAPSHOT_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if (magic != MAGIC)|(version != FORMAT_VERSION):
+        return None
+
+    header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].decode('utf-8'))
+    if check_sources and (header['sources'] != sources_hashes(data_dir)):
+        return None
+
+    start = _PREAMBLE.size + header_length
+    start += _pad(start)
+    strings = np.array(header['strings'] + [None], dtype=object) # index -1 is None
+
+    output = dict()
+    for table_name, columns in header['tables'].items():
+        table = dict()
+        for col in columns:
+            values = np.frombuffer(buffer, dtype=np.dtype(col['dtype']), count=col['length'],
+                                   offset=start + col['offset'])
+            if col['kind'] == 'string':
+                values = strings[values]
+            elif col['kind'] == 'bool':
+                values = values.astype(bool)
+            table[col['name']] = values
+        output[table_name] = table
+    output['_meta'] = dict(data_hash=header['data_hash'], sources=header['sources'])
+
+    return output
+
+def snapshot_to_dataframes(snapshot):
+    import pandas as pd
+
+    tables = {name: pd.DataFrame(columns) for name, columns in snapshot.items() if name != '_meta'}
+    # Missing strings are NaN in the DataFrames read from the csv files
+    for df in tables.values():
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].where(df[col].notna(), np.nan)
+    return tables
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Reference data that can be updated while the app is running.
+# A watcher thread checks the files of data/ every few seconds; when they change, the new tables are
+# validated and everything derived from them is rebuilt in the background, then swapped in at once.
+# Callbacks read ReferenceStore.current once, so a request never mixes two versions of the data.
+#
+# Each version has a revision number, which only ever increases, and which is exposed in the results.
+# It is derived from the modification time of the files, so that the workers agree on it.
+
+import logging
+import os
+import threading
+import time
+
+from reference_data import CSV_FILES, content_hash, files_hashes, files_revision, load_tables
+from reference_snapshot import SNAPSHOT_FILE
+
+logger = logging.getLogger(__name__)
+
+class ReferenceStore(object):
+    '''
+    Holds the current version of the reference data, as built by build(tables, data_hash, revision),
+    whose result must have data_hash and revision attributes: data_hash identifies the content of the files
+    (e.g. for caches), and revision orders the versions (it is the data_version of the results).
+    Functions registered with on_swap are called with each new version, once it is current.
+    extra_files are the other files of data_dir that build reads itself (they may not exist):
+    they are watched too, and part of data_hash.
+    '''
+
+    def __init__(self, data_dir, build, use_snapshot=True, extra_files=()):
+        self.data_dir = data_dir
+        self.build = build
+        self.use_snapshot = use_snapshot
+        self.extra_files = sorted(extra_files)
+        self.current = None
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+        self._listeners = []
+        self._signature = None
+        self._lock = threading.Lock()
+        self._thread = None
+        # the first load isn't caught, the app can't start without data
+        self.reload()
+
+    def _files(self):
+        names = sorted(set(CSV_FILES.values())) + [SNAPSHOT_FILE] + self.extra_files
+        return [os.path.join(self.data_dir, name) for name in names]
+
+    def _signature_of_files(self):
+        # Cheap to compute, the files are only read when it changes
+        output = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+                output.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                output.append((path, None, None))
+        return tuple(output)
+
+    def reload(self, force=False):
+        '''
+        Loads the data again if the files have changed. Returns True if a new version is now current.
+        Raises ValueError if the new tables are invalid (the current version is kept).
+        '''
+        from build_data import validate_tables
+
+        with self._lock:
+            signature = self._signature_of_files()
+            if (signature == self._signature) and (not force):
+                return False
+
+            # Recorded first, so that files which can't be loaded are only tried (and logged) once,
+            # until they change again
+            self._signature = signature
+
+            tables, data_hash = load_tables(self.data_dir, use_snapshot=self.use_snapshot)
+            if self.extra_files:
+                data_hash = content_hash(dict(files_hashes(self.data_dir, self.extra_files), tables=data_hash))
+            if (self.current is not None) and (data_hash == self.current.data_hash) and (not force):
+                # e.g. touched, or the snapshot rebuilt from the same csv files
+                return False
+
+            errors = validate_tables(tables)
+            if errors:
+                raise ValueError("Invalid reference data: {}".format('; '.join(errors)))
+
+            revision = files_revision(self._files())
+            if self.current is not None:
+                revision = max(revision, self.current.revision + 1)
+
+            new = self.build(tables, data_hash, revision)
+            if self.current is not None:
+                self.reloads += 1
+            self.current = new
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            listener(new)
+        return True
+
+    def check(self):
+        '''
+        Same as reload, but errors are logged instead of raised (the files are tried again once they change).
+        '''
+        try:
+            if self.reload():
+                logger.info("Reference data %s loaded (revision %s)", self.current.data_hash,
+                            self.current.revision)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = "{}: {}".format(type(e).__name__, e)
+            logger.exception("Reference data couldn't be reloaded, keeping %s", self.current.data_hash)
+
+    def on_swap(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def watch(self, interval):
+        '''
+        Starts the watcher thread, which checks the files every `interval` seconds.
+        '''
+        if self._thread is not None:
+            return self._thread
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.check()
+
+        self._thread = threading.Thread(target=run, name='reference-data-watcher', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stats(self):
+        return dict(
+            data_hash=self.current.data_hash,
+            revision=self.current.revision,
+            reloads=self.reloads,
+            errors=self.errors,
+            last_error=self.last_error,
+            watching=self._thread is not None,
+        )
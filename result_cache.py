@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Bounded in-process cache for the results of the callbacks,
+# with least-recently-used eviction, an optional time-to-live and hit/miss counters.
+# It can be backed by a cache shared between processes, see cache_backends.py.
+
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+def normalize_key(value):
+    '''
+    Hashable version of the arguments of a callback.
+    Types are kept, so that 12, 12.0 and True are different keys (they give different outputs).
+    '''
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(normalize_key(x) for x in value)
+    if isinstance(value, dict):
+        # e.g. the content of a dcc.Store
+        return ('dict', json.dumps(value, sort_keys=True, default=repr))
+    return (type(value).__name__, value)
+
+class ResultCache(object):
+    '''
+    LRU cache of at most `maxsize` entries, each kept for at most `ttl` seconds (None for no limit).
+    The cache is emptied when the version of the reference data changes, see set_data_hash.
+    With a shared backend (see cache_backends.py), local misses are looked up there before being computed.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.backend = backend
+        self.data_hash = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.crossWorker_hits = 0 # shared hits on results computed by another process
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires = entry
+            if (expires is not None) and (self.clock() >= expires):
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _shared_key(self, key):
+        # The version is part of the key, as the workers may not all have reloaded the data yet
+        return '{}:{}'.format(self.data_hash, hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def get_shared(self, key, default=None):
+        found, value, writer = self.backend.get(self._shared_key(key))
+        with self._lock:
+            if not found:
+                self.shared_misses += 1
+                return default
+            self.shared_hits += 1
+            if writer != os.getpid():
+                self.crossWorker_hits += 1
+        return value
+
+    def set_shared(self, key, value):
+        self.backend.set(self._shared_key(key), value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def set_data_hash(self, data_hash):
+        '''
+        To be called whenever the reference data is (re)loaded, with the hash of its content:
+        results computed with other data are dropped.
+        '''
+        with self._lock:
+            if data_hash != self.data_hash:
+                self._entries.clear()
+                self.data_hash = data_hash
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            shared_lookups = self.shared_hits + self.shared_misses
+            output = dict(
+                size=len(self._entries),
+                maxsize=self.maxsize,
+                ttl=self.ttl,
+                data_hash=self.data_hash,
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups > 0 else None,
+                evictions=self.evictions,
+                expirations=self.expirations,
+            )
+            if self.backend is not None:
+                output.update(
+                    shared_hits=self.shared_hits,
+                    shared_misses=self.shared_misses,
+                    shared_hit_rate=self.shared_hits / shared_lookups if shared_lookups > 0 else None,
+                    crossWorker_hits=self.crossWorker_hits,
+                    crossWorker_hit_rate=self.crossWorker_hits / shared_lookups if shared_lookups > 0 else None,
+                )
+        if self.backend is not None:
+            output['backend'] = self.backend.stats()
+        return output
+
+    def cached(self, key=None):
+        '''
+        Decorator caching the results of a function.
+        key(*args) selects the arguments the result depends on (all of them by default).
+        '''
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args):
+                cache_key = (function.__name__, normalize_key(args if key is None else key(*args)))
+                value = self.get(cache_key, _MISSING)
+                if value is not _MISSING:
+                    return value
+
+                if self.backend is not None:
+                    value = self.get_shared(cache_key, _MISSING)
+                    if value is not _MISSING:
+                        self.set(cache_key, value)
+                        return value
+
+                data_hash = self.data_hash
+                value = function(*args)
+                if data_hash != self.data_hash:
+                    # the data was reloaded meanwhile, the result may have been computed with the old one
+                    return value
+                self.set(cache_key, value)
+                if self.backend is not None:
+                    self.set_shared(cache_key, value)
+                return value
+            return wrapper
+        return decorator
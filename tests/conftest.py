@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope='session')
+def reference():
+    import calculator
+
+    return calculator.load_reference_data()
+
+@pytest.fixture(scope='session')
+def app_module():
+    # app.py reads data/ and assets/ from the working directory, and shouldn't start its watcher thread here
+    os.environ.setdefault('GREEN_ALGORITHMS_RELOAD_INTERVAL', '0')
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+# Runs a function of assets/clientside.js on a list of argument lists, returns the list of its results
+RUN_CLIENTSIDE = '''
+var window = {};
+console.log = function() {};
+eval(require('fs').readFileSync(process.argv[1], 'utf8'));
+var input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+var clientside = window.dash_clientside.clientside;
+process.stdout.write(JSON.stringify(input.cases.map(function(args) {
+    return clientside[input.name].apply(null, args);
+})));
+'''
+
+@pytest.fixture(scope='session')
+def clientside():
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip("node is needed to run assets/clientside.js")
+
+    def run(name, cases):
+        result = subprocess.run([node, '-e', RUN_CLIENTSIDE, os.path.join(ROOT, 'assets', 'clientside.js')],
+                                input=json.dumps(dict(name=name, cases=cases)), capture_output=True, text=True,
+                                check=True)
+        return json.loads(result.stdout)
+    return run
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import sys
+
+import pytest
+
+import calculator
+from ci_timeseries import CISeries, CITimeSeries
+from footprint_api import ARROW_MIMETYPE, MAX_BATCH, read_lines, score_batch, score_stream
+
+@pytest.fixture
+def client(app_module):
+    return app_module.server.test_client()
+
+def test_arrow_unavailable(client, monkeypatch):
+    # pyarrow is optional
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    response = client.post('/api/v1/footprint/arrow', data=b'', content_type='application/vnd.apache.arrow.stream')
+    assert response.status_code == 501
+    assert response.get_json() == dict(error="Arrow isn't available on this server")
+
+JOB = dict(coreType='CPU', coreModel='Xeon E5-2683 v4', n_cores=12, memory=64, runTime_hours=12, runTime_min=0,
+           location='GB', usage=1, PUE=1.67, PSF=1, selected_platform='localServer')
+
+# jobs of each platform, GPUs and models set to 'other'
+JOBS = [
+    JOB,
+    dict(JOB, coreType='GPU', coreModel='Tesla T4', n_cores=2, runTime_min=30, location='FR'),
+    dict(JOB, coreModel='other', tdp=10.5, memory=3.5, usage=0.8, PSF=3),
+    dict(JOB, selected_platform='personalComputer', location='US-CA'),
+    dict(JOB, selected_platform='cloudComputing', selected_provider='gcp', runTime_hours=0, runTime_min=5),
+]
+
+def expected(reference, app_module, job):
+    output = calculator.aggregate(reference, **job)
+    # the app also watches the snapshot, whose revision may be more recent
+    output['data_version'] = app_module.reference_store.current.revision
+    return output
+
+def test_footprint(client, reference, app_module):
+    for job in JOBS:
+        response = client.post('/api/v1/footprint', json=job)
+        assert response.status_code == 200
+        assert response.get_json() == expected(reference, app_module, job)
+
+@pytest.mark.parametrize('body, status, error', [
+    ('not json', 400, "A job must be a JSON object"),
+    ([JOB], 400, "A job must be a JSON object"),
+    ({name: value for name, value in JOB.items() if name != 'memory'}, 400, "Missing input: memory"),
+    (dict(JOB, n_cores='12', PUE=-1), 400, "n_cores must be a number; PUE can't be negative"),
+    (dict(JOB, coreType='TPU'), 400, "coreType must be one of CPU, GPU"),
+    (dict(JOB, coreModel='other'), 400, "Missing input: tdp (needed when coreModel is 'other')"),
+    (dict(JOB, location='Atlantis'), 404, "Unknown location: Atlantis"),
+    (dict(JOB, coreModel='Z80'), 404, "Unknown CPU model: Z80"),
+])
+def test_footprint_errors(client, body, status, error):
+    if isinstance(body, str):
+        response = client.post('/api/v1/footprint', data=body, content_type='application/json')
+    else:
+        response = client.post('/api/v1/footprint', json=body)
+    assert response.status_code == status
+    assert response.get_json() == dict(error=error)
+
+def test_batch(client, reference, app_module):
+    invalid = [
+        (dict(JOB, n_cores='12'), "n_cores must be a number"),
+        (dict(JOB, location='Atlantis'), "Unknown location: Atlantis"),
+        (dict(JOB, coreType='GPU'), "Unknown GPU model: Xeon E5-2683 v4"),
+        (None, "A job must be a JSON object"),
+        (dict(JOB, memory=None), "Missing input: memory"),
+    ]
+    # invalid jobs in between the valid ones, which are scored at once
+    jobs = [x for pair in zip(JOBS, invalid) for x in pair]
+    response = client.post('/api/v1/footprint/batch', json=dict(jobs=[x[0] if isinstance(x, tuple) else x
+                                                                      for x in jobs]))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['data_version'] == app_module.reference_store.current.revision
+    assert len(body['results']) == len(jobs)
+    for job, result in zip(jobs, body['results']):
+        if isinstance(job, tuple):
+            assert result == dict(error=job[1])
+        else:
+            assert result == pytest.approx(expected(reference, app_module, job))
+            assert result == pytest.approx(client.post('/api/v1/footprint', json=job).get_json())
+
+@pytest.mark.parametrize('body, status', [
+    ('not json', 400),
+    (dict(), 400),
+    (dict(jobs=JOB), 400),
+    (dict(jobs=[JOB] * (MAX_BATCH + 1)), 413),
+])
+def test_batch_errors(client, body, status):
+    if isinstance(body, str):
+        response = client.post('/api/v1/footprint/batch', data=body, content_type='application/json')
+    else:
+        response = client.post('/api/v1/footprint/batch', json=body)
+    assert response.status_code == status
+    assert list(response.get_json()) == ['error']
+
+def test_regions(client, reference, app_module):
+    response = client.post('/api/v1/regions', json=dict(JOB, scope='all'))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['scope'], body['location']) == ('all', 'GB')
+    assert body['carbonEmissions'] == expected(reference, app_module, JOB)['carbonEmissions']
+
+    ranking = body['ranking']
+    assert [row['rank'] for row in ranking] == list(range(1, len(ranking) + 1))
+    assert set(row['location'] for row in ranking) == set(reference.lookups.CI)
+    carbonEmissions = [row['carbonEmissions'] for row in ranking]
+    assert carbonEmissions == sorted(carbonEmissions)
+    # every location with the PUE of the job
+    for row in ranking[:20]:
+        assert row['carbonEmissions'] == pytest.approx(
+            expected(reference, app_module, dict(JOB, location=row['location']))['carbonEmissions'])
+
+@pytest.mark.parametrize('body, status, error', [
+    (dict(JOB, scope='moon'), 400, "Unknown scope: moon, expected one of ['provider', 'datacenters', 'all']"),
+    (dict(JOB, location=None), 400, "Missing input: location"),
+    (dict(JOB, location='Atlantis'), 404, "Unknown location: Atlantis"),
+])
+def test_regions_errors(client, body, status, error):
+    response = client.post('/api/v1/regions', json=body)
+    assert response.status_code == status
+    assert response.get_json() == dict(error=error)
+
+@pytest.fixture
+def CI_series(app_module, monkeypatch):
+    # hourly carbon intensity of GB on 2021-06-01, lowest from 02:00 to 05:00
+    values = [200.] * 2 + [100.] * 3 + [300.] * 19
+    series = CITimeSeries(dict(GB=CISeries('2021-06-01T00:00Z', 3600, values)))
+    store = app_module.reference_store
+    monkeypatch.setattr(store, 'current', store.current._replace(CI_series=series))
+
+def test_start_time(client, reference, app_module, CI_series):
+    job = dict(JOB, runTime_hours=3, earliest='2021-06-01T00:00Z', latest='2021-06-01T12:00Z')
+    response = client.post('/api/v1/start-time', json=job)
+    assert response.status_code == 200
+    body = response.get_json()
+    energy = expected(reference, app_module, dict(JOB, runTime_hours=3))['energy_needed']
+    assert body['start'] == '2021-06-01T02:00:00Z'
+    assert body['start_now'] == '2021-06-01T00:00:00Z'
+    assert body['carbonIntensity'] == 100.
+    assert body['carbonIntensity_now'] == pytest.approx(500. / 3)
+    assert body['carbonEmissions_saved'] == pytest.approx(energy * (500. / 3 - 100.))
+
+    # latest is 24h after earliest by default, brought forward to the end of the series
+    del job['latest']
+    assert client.post('/api/v1/start-time', json=job).get_json()['start'] == '2021-06-01T02:00:00Z'
+
+@pytest.mark.parametrize('changes, status, error', [
+    (dict(location='FR'), 404, "No hourly carbon intensity for FR"),
+    (dict(location='Atlantis'), 404, "Unknown location: Atlantis"),
+    (dict(n_cores=None), 400, "Missing input: n_cores"),
+    (dict(earliest='2021-05-31T00:00Z'), 400, None),
+    (dict(earliest='yesterday'), 400, None),
+])
+def test_start_time_errors(client, CI_series, changes, status, error):
+    job = dict(JOB, runTime_hours=3, earliest='2021-06-01T00:00Z')
+    job.update(changes)
+    response = client.post('/api/v1/start-time', json=job)
+    assert response.status_code == status
+    assert list(response.get_json()) == ['error']
+    if error is not None:
+        assert response.get_json()['error'] == error
+
+def test_start_time_without_series(client):
+    response = client.post('/api/v1/start-time', json=dict(JOB, earliest='2021-06-01T00:00Z'))
+    assert response.status_code == 404
+    assert response.get_json() == dict(error="No hourly carbon intensity for GB")
+
+def test_stream(client):
+    # more jobs than STREAM_CHUNK, with a line that isn't JSON and invalid jobs partway through
+    jobs = [dict(job, n_cores=n_cores) for n_cores in range(1, 1001) for job in JOBS]
+    jobs[2500] = dict(JOB, location='Atlantis')
+    lines = [json.dumps(job) for job in jobs]
+    lines[3000] = '{"coreType": "CPU", '
+    body = '\n'.join(lines[:4000]) + '\n\n' + '\n'.join(lines[4000:]) # the empty line is skipped
+    response = client.post('/api/v1/footprint/stream', data=body.encode('utf-8'), content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    data = response.get_data(as_text=True)
+    assert data.endswith('\n')
+    results = [json.loads(line) for line in data.splitlines()]
+    assert len(results) == len(jobs)
+    assert results[2500] == dict(error="Unknown location: Atlantis")
+    assert results[3000] == dict(error="Invalid JSON")
+
+    batch = []
+    for i in range(0, len(jobs), MAX_BATCH):
+        batch += client.post('/api/v1/footprint/batch', json=dict(jobs=jobs[i:i + MAX_BATCH])).get_json()['results']
+    assert results[:3000] == batch[:3000]
+    assert results[3001:] == batch[3001:]
+
+def test_read_lines():
+    # lines split across blocks
+    lines = [b'{"a": %d}' % i for i in range(100)]
+    assert list(read_lines(io.BytesIO(b'\n'.join(lines)), block_size=7)) == lines
+    assert list(read_lines(io.BytesIO(b'\n'.join(lines) + b'\n'), block_size=7)) == lines
+
+def test_score_stream_chunks(reference):
+    lines = [json.dumps(job) for job in JOBS] + ['not json'] + [json.dumps(job) for job in JOBS]
+    chunks = list(score_stream(lines, reference.lookups, reference.refValues_dict, 1, chunk_size=3))
+    # a chunk of results for every 3 lines, each ending with a complete line
+    assert [chunk.count(b'\n') for chunk in chunks] == [3, 3, 3, 2]
+    results = [json.loads(line) for line in b''.join(chunks).splitlines()]
+    assert results[5] == dict(error="Invalid JSON")
+    assert results[:5] == results[6:] == score_batch(JOBS, reference.lookups, reference.refValues_dict, 1)
+
+def arrow_stream(pa, table, max_chunksize):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=max_chunksize):
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def test_arrow(client):
+    pa = pytest.importorskip('pyarrow')
+
+    jobs = [dict(job, n_cores=n_cores) for n_cores in range(1, 21) for job in JOBS]
+    jobs[7] = dict(JOB, location='Atlantis')
+    jobs[33] = dict(JOB, coreModel='other')
+    table = pa.Table.from_pylist([{name: job.get(name) for name in calculator.JOB_INPUTS} for job in jobs])
+    response = client.post('/api/v1/footprint/arrow', data=arrow_stream(pa, table, 30),
+                           content_type=ARROW_MIMETYPE)
+    assert response.status_code == 200
+    assert response.mimetype == ARROW_MIMETYPE
+
+    reader = pa.ipc.open_stream(response.get_data())
+    assert reader.schema.names == calculator.RESULT_FIELDS + ['error']
+    results = reader.read_all().to_pylist()
+    batch = client.post('/api/v1/footprint/batch', json=dict(jobs=jobs)).get_json()['results']
+    assert len(results) == len(batch)
+    for result, expected_result in zip(results, batch):
+        if 'error' in expected_result:
+            assert result['error'] == expected_result['error']
+            assert result['carbonEmissions'] is None
+        else:
+            assert result.pop('error') is None
+            # the numbers of the inputs are floats in Arrow
+            assert result == pytest.approx(expected_result)
+
+def test_arrow_errors(client):
+    pa = pytest.importorskip('pyarrow')
+
+    response = client.post('/api/v1/footprint/arrow', data=b'not arrow', content_type=ARROW_MIMETYPE)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith("The body must be an Arrow IPC stream")
+
+    table = pa.table(dict(location=['GB'], n_cores=['12']))
+    response = client.post('/api/v1/footprint/arrow', data=arrow_stream(pa, table, 10), content_type=ARROW_MIMETYPE)
+    assert response.status_code == 400
+    assert response.get_json() == dict(error="n_cores must be a column of numbers")
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import json
+import os
+
+import numpy as np
+import pytest
+
+import build_geometry
+from build_geometry import GEOMETRY_FILE, SIZE_BUDGET, build_geometry as build
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wiggly(start, end, n, rng):
+    # border with n points from start to end, whose inner points are moved by up to 0.05 degrees
+    points = np.linspace(start, end, n)
+    points[1:-1] += rng.uniform(-0.05, 0.05, size=(n - 2, 2))
+    return [tuple(point) for point in points]
+
+def grid_world(size, n=200, seed=0):
+    '''
+    size x size countries of 10 degrees, with wiggly borders between them (and straight outer ones).
+    '''
+    rng = np.random.RandomState(seed)
+    corners = lambda i, j: (10. * i, 10. * j)
+    def border(a, b):
+        inner = (0 < a[0] == b[0] < 10. * size) or (0 < a[1] == b[1] < 10. * size)
+        return wiggly(a, b, n, rng) if inner else [a, b]
+    # each border is drawn once, and shared by the countries on both sides
+    borders = dict()
+    def side(a, b):
+        if (b, a) in borders:
+            return borders[(b, a)][::-1]
+        borders[(a, b)] = border(a, b)
+        return borders[(a, b)]
+
+    features = []
+    for i in range(size):
+        for j in range(size):
+            square = [corners(i, j), corners(i + 1, j), corners(i + 1, j + 1), corners(i, j + 1)]
+            ring = []
+            for a, b in zip(square, square[1:] + square[:1]):
+                ring.extend(side(a, b)[:-1])
+            ring.append(ring[0])
+            features.append(dict(type='Feature', id='C{:02d}{:02d}'.format(i, j),
+                                 geometry=dict(type='Polygon', coordinates=[[list(p) for p in ring]])))
+    return dict(type='FeatureCollection', features=features)
+
+def rings(geometry):
+    for feature in geometry['features']:
+        polygons = feature['geometry']['coordinates']
+        if feature['geometry']['type'] == 'Polygon':
+            polygons = [polygons]
+        for polygon in polygons:
+            for ring in polygon:
+                yield feature['id'], ring
+
+def test_shared_borders():
+    source = grid_world(4)
+    geometry = build(source, set(feature['id'] for feature in source['features']))
+    assert len(geometry['features']) == 16
+
+    # Each edge of an inner border is used by the two countries it separates, and only the outer edges once
+    edges = collections.Counter()
+    for _, ring in rings(geometry):
+        assert ring[0] == ring[-1]
+        for a, b in zip(ring[:-1], ring[1:]):
+            edges[tuple(sorted([tuple(a), tuple(b)]))] += 1
+    assert len(edges) < 16 * 4 * 200 / 4
+    outer = lambda point: (point[0] in (0, 40)) or (point[1] in (0, 40))
+    for (a, b), count in edges.items():
+        assert count == (1 if (outer(a) and outer(b)) else 2), (a, b)
+
+def test_enclave():
+    # a small country inside a large one, whose hole is the small country
+    inner = wiggly((1., 1.), (1.5, 1.), 50, np.random.RandomState(1))
+    inner = inner + [(1.5, 1.5), (1., 1.5), (1., 1.)]
+    outer = [(0., 0.), (3., 0.), (3., 3.), (0., 3.), (0., 0.)]
+    source = dict(type='FeatureCollection', features=[
+        dict(type='Feature', id='BIG', geometry=dict(type='Polygon', coordinates=[outer, inner[::-1]])),
+        dict(type='Feature', id='SML', geometry=dict(type='Polygon', coordinates=[inner])),
+    ])
+    geometry = build(source, {'BIG', 'SML'}, tolerance=1)
+    outlines = {id: [ring for i, ring in rings(geometry) if i == id] for id in ['BIG', 'SML']}
+    # the small country is kept, and the hole follows its outline exactly
+    assert len(outlines['SML']) == 1
+    assert len(outlines['BIG']) == 2
+    assert set(map(tuple, outlines['BIG'][1])) == set(map(tuple, outlines['SML'][0]))
+
+def write_ISO3(data_dir, codes):
+    with open(os.path.join(data_dir, 'CI_ISO3.csv'), 'w', encoding='utf-8') as f:
+        f.write("metadata\nlocation,ISO3\n")
+        for code in codes:
+            f.write("{0},{0}\n".format(code))
+
+def test_budget(tmpdir, monkeypatch):
+    source = grid_world(12, n=100)
+    source_path = str(tmpdir.join('world.geo.json'))
+    with open(source_path, 'w') as f:
+        json.dump(source, f)
+    write_ISO3(str(tmpdir), [feature['id'] for feature in source['features']])
+    output_path = tmpdir.join(GEOMETRY_FILE)
+
+    monkeypatch.setattr(build_geometry, 'SIZE_BUDGET', 1024)
+    assert build_geometry.main(source_path, str(tmpdir)) == 1
+    assert not output_path.exists()
+
+    monkeypatch.setattr(build_geometry, 'SIZE_BUDGET', SIZE_BUDGET)
+    assert build_geometry.main(source_path, str(tmpdir)) == 0
+    assert os.path.getsize(str(output_path)) <= SIZE_BUDGET
+    assert len(json.loads(output_path.read())['features']) == 144
+
+def test_built_geometry():
+    # the geometry is built from a source that isn't part of the repository, see README.md
+    path = os.path.join(ROOT, 'data', GEOMETRY_FILE)
+    if not os.path.exists(path):
+        pytest.skip("{} hasn't been built".format(GEOMETRY_FILE))
+    assert os.path.getsize(path) <= SIZE_BUDGET
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import numpy as np
+import pytest
+
+from cache_backends import SQLiteBackend, decode, encode
+from result_cache import ResultCache
+
+def test_components_are_stored_as_json(tmp_path):
+    html = pytest.importorskip('dash_html_components')
+    from plotly.utils import PlotlyJSONEncoder
+
+    table = html.Table([html.Tr([html.Td(1), html.Td("GB", className='current-location')])])
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'))
+    backend.set('key', dict(table=table, values=np.arange(3.)))
+
+    found, value, _ = backend.get('key')
+    assert found and (backend.errors == 0)
+    # what Dash would have sent to the browser
+    assert value['table'] == json.loads(json.dumps(table, cls=PlotlyJSONEncoder))
+    assert value['values'] == [0., 1., 2.]
+
+def test_shared_results(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    calls = []
+
+    def make_cache():
+        cache = ResultCache(backend=SQLiteBackend(path))
+        cache.set_data_hash('v1')
+
+        @cache.cached()
+        def square(x):
+            calls.append(x)
+            return dict(value=x * x)
+        return cache, square
+
+    cache1, square1 = make_cache()
+    cache2, square2 = make_cache()
+    assert square1(3) == dict(value=9)
+    assert square2(3) == dict(value=9)
+    assert calls == [3]
+    assert cache2.stats()['shared_hits'] == 1
+
+def test_encode():
+    assert decode(encode(dict(x=np.float64(1.5), y=None))) == dict(x=1.5, y=None)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# calculator.py is imported by scripts run after every job, see cli.py
+IMPORT_BUDGET = 0.1 # in seconds
+
+def test_import_time():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import calculator'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    # "import time: self [us] | cumulative | imported package", one line per module
+    cumulative = dict()
+    for line in result.stderr.splitlines()[1:]:
+        _, time, name = line.split('|')
+        cumulative[name.strip()] = int(time) / 1e6
+
+    packages = set(name.split('.')[0] for name in cumulative)
+    assert not packages & {'numpy', 'pandas', 'dash', 'plotly', 'flask'}
+    assert cumulative['calculator'] < IMPORT_BUDGET
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from ci_providers import HTTPCIProvider, StaticCIProvider, make_standin_server
+from result_cache import ResultCache
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def start_standin():
+    # starts stand-ins of the live API (see make_standin_server), stopped after the test
+    servers = []
+
+    def start(values, delay=0):
+        server = make_standin_server('127.0.0.1:0', values, delay=delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def standin(start_standin):
+    return start_standin(dict(FR=56., GB=180.))
+
+def provider_for(server, **kwargs):
+    return HTTPCIProvider('http://127.0.0.1:{}/carbon-intensity/latest'.format(server.server_address[1]), **kwargs)
+
+def test_static():
+    provider = StaticCIProvider()
+    assert provider.carbonIntensity('FR', 47.) == 47.
+    assert provider.revision('FR') is None
+
+def test_revision_neither_counts_nor_fetches(standin):
+    clock = Clock()
+    provider = provider_for(standin, ttl=10, stale=20, clock=clock)
+    try:
+        assert provider.revision('FR') == ('missing', None)
+        assert provider.stats()['missing'] == 0
+        assert standin.requests == {}
+
+        provider.refresh('FR').result(timeout=5)
+        live = provider.revision('FR')
+        assert live[0] == 'live'
+        clock.now = 15
+        assert provider.revision('FR') == ('stale', live[1])
+        clock.now = 31
+        assert provider.revision('FR') == ('expired', live[1])
+
+        stats = provider.stats()
+        assert (stats['fresh'], stats['stale'], stats['missing'], stats['fetches']) == (0, 0, 0, 1)
+        assert standin.requests == dict(FR=1)
+    finally:
+        provider.close()
+
+def test_coalescing(start_standin):
+    # concurrent lookups of a missing value start a single fetch, and get the static value meanwhile
+    server = start_standin(dict(FR=56.), delay=0.3)
+    provider = provider_for(server)
+    barrier = threading.Barrier(50)
+    results = []
+
+    def lookup():
+        barrier.wait()
+        results.append(provider.lookup('FR', 47.))
+
+    try:
+        threads = [threading.Thread(target=lookup) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        provider.refresh('FR').result(timeout=5)
+
+        assert set((x.carbonIntensity, x.source) for x in results) == {(47., 'static')}
+        assert provider.lookup('FR', 47.)[:2] == (56., 'live')
+        stats = provider.stats()
+        assert (stats['fetches'], stats['missing'], stats['coalesced']) == (1, 50, 50)
+        assert server.requests == dict(FR=1)
+    finally:
+        provider.close()
+
+def test_stale_on_failure(start_standin):
+    # past its TTL, the last value is served while the API fails, and the failed fetch isn't retried at once
+    values = dict(FR=56.)
+    server = start_standin(values)
+    clock = Clock()
+    provider = provider_for(server, ttl=10, stale=100, retry_after=5, clock=clock)
+    try:
+        provider.refresh('FR').result(timeout=5)
+
+        del values['FR'] # the API answers 404
+        clock.now = 11
+        assert provider.refresh('FR').result(timeout=5) is None
+        assert provider.stats()['errors'] == 1
+        assert provider.lookup('FR', 47.)[:2] == (56., 'stale')
+        assert provider.refresh('FR') is None
+        assert server.requests == dict(FR=2)
+
+        # the API is down
+        provider.pool.close()
+        server.shutdown()
+        server.server_close()
+        clock.now = 17
+        assert provider.lookup('FR', 47.)[:2] == (56., 'stale')
+        assert provider.refresh('FR').result(timeout=5) is None
+        assert provider.stats()['errors'] == 2
+
+        # and the static value is used once the last one is too old
+        clock.now = 111
+        assert provider.lookup('FR', 47.)[:2] == (47., 'static')
+    finally:
+        provider.close()
+
+def test_timeout(start_standin):
+    server = start_standin(dict(FR=56.), delay=1)
+    clock = Clock()
+    provider = provider_for(server, timeout=0.2, retry_after=5, clock=clock)
+    try:
+        assert provider.refresh('FR').result(timeout=5) is None
+        stats = provider.stats()
+        assert (stats['errors'], stats['fetches']) == (1, 0)
+        assert provider.lookup('FR', 47.)[:2] == (47., 'static')
+        # no new request before retry_after
+        assert provider.refresh('FR') is None
+        assert server.requests == dict(FR=1)
+        clock.now = 6
+        assert provider.refresh('FR') is not None
+    finally:
+        provider.close()
+
+def wait_for_fetches(provider):
+    with provider._lock:
+        pending = list(provider._pending.values())
+    for future in pending:
+        future.result(timeout=5)
+
+def test_cached_results_follow_the_revision(start_standin):
+    # like aggregate_input_values: results are cached on the revision, and only cache misses look the value up
+    values = dict(FR=56.)
+    server = start_standin(values)
+    clock = Clock()
+    provider = provider_for(server, ttl=10, stale=20, retry_after=5, clock=clock)
+    cache = ResultCache()
+    cache.set_data_hash('v1')
+
+    @cache.cached(key=lambda location: (location, provider.revision(location)))
+    def carbonIntensity(location):
+        return provider.carbonIntensity(location, 5.)
+
+    try:
+        assert carbonIntensity('FR') == 5.
+        wait_for_fetches(provider)
+        assert carbonIntensity('FR') == 56.
+
+        # the refresh past the TTL fails: the stale value is served, and not fetched again before retry_after
+        del values['FR']
+        clock.now = 11
+        assert carbonIntensity('FR') == 56.
+        wait_for_fetches(provider)
+        values['FR'] = 60.
+        clock.now = 13
+        assert carbonIntensity('FR') == 56.
+        assert server.requests == dict(FR=2)
+        clock.now = 17
+        assert carbonIntensity('FR') == 56.
+        wait_for_fetches(provider)
+        assert carbonIntensity('FR') == 60.
+        assert server.requests == dict(FR=3)
+
+        # expired, then fetched again once the API is back: the result of the static value isn't kept
+        del values['FR']
+        clock.now = 48
+        assert carbonIntensity('FR') == 5.
+        wait_for_fetches(provider)
+        assert carbonIntensity('FR') == 5.
+        values['FR'] = 70.
+        clock.now = 54
+        assert carbonIntensity('FR') == 5.
+        wait_for_fetches(provider)
+        assert carbonIntensity('FR') == 70.
+        assert server.requests == dict(FR=5)
+    finally:
+        provider.close()
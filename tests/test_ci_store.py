@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from ci_store import CIStore, write_CI_store
+from ci_timeseries import CISeries, CITimeSeries
+
+START = 1622505600. # 2021-06-01 00:00 UTC
+STEP = 3600.
+CHUNK_SIZE = 24
+
+# values are stored as float32, see write_CI_store
+RTOL = 2 ** -24
+
+@pytest.fixture
+def series():
+    rng = np.random.RandomState(0)
+    return CITimeSeries(dict(
+        GB=CISeries(START, STEP, rng.uniform(0, 800, 1000)), # 42 chunks, the last one partial
+        FR=CISeries(START + 50 * STEP, STEP, rng.uniform(20, 90, CHUNK_SIZE)), # a single chunk
+    ))
+
+@pytest.fixture
+def store(series, tmp_path):
+    return CIStore(write_CI_store(series, str(tmp_path / 'CI.store'), chunk_size=CHUNK_SIZE))
+
+def test_values(series, store):
+    assert sorted(store.locations()) == ['FR', 'GB']
+    for location in ['GB', 'FR']:
+        stored, original = store[location], series[location]
+        assert (stored.start, stored.step, stored.end) == (original.start, original.step, original.end)
+        np.testing.assert_allclose(stored.values, original.values, rtol=RTOL, atol=0)
+        assert np.array_equal(stored.values, original.values.astype(np.float32))
+
+def test_running_total(series, store):
+    stored, original = store['GB'], series['GB']
+    rng = np.random.RandomState(1)
+    # inside steps, on steps, on chunk boundaries, and at both ends
+    t = np.concatenate([rng.uniform(stored.start, stored.end, 500),
+                        START + STEP * np.arange(0, 1001, 7), START + STEP * CHUNK_SIZE * np.arange(42)])
+    # the sum of the rounding errors of the values up to t
+    atol = RTOL * original._running_total(t) + 1e-9
+    np.testing.assert_array_less(np.abs(stored._running_total(t) - original._running_total(t)), atol)
+    # and exactly the integral of the float32 values
+    rounded = CISeries(START, STEP, original.values.astype(np.float32))
+    np.testing.assert_allclose(stored._running_total(t), rounded._running_total(t), rtol=1e-12, atol=1e-9)
+
+    t0 = t[:250]
+    t1 = np.maximum(t0, t[250:500])
+    np.testing.assert_allclose(stored.mean(t0, t1), original.mean(t0, t1), rtol=1e-6)
+
+@pytest.mark.parametrize('t0, t1', [
+    (START, START + 10 * STEP),
+    (START + 3.5 * STEP, START + 100.5 * STEP), # across chunks, partway through steps
+    (START + 23 * STEP, START + 25 * STEP), # around a chunk boundary
+    (START - 5 * STEP, START + 2 * STEP), # before the start
+    (START + 990 * STEP, START + 2000 * STEP), # after the end
+    (START + 5 * STEP, START + 5 * STEP), # empty
+])
+def test_slice(series, store, t0, t1):
+    times, values = store['GB'].slice(t0, t1)
+    original = series['GB']
+    # the steps i whose interval [i, i + 1) overlaps [t0, t1), in steps from the start
+    i = np.arange(original.length)
+    expected = (i + 1 > (t0 - START) / STEP) & (i < (t1 - START) / STEP)
+    assert times.tolist() == (START + i[expected] * STEP).tolist()
+    np.testing.assert_allclose(values, original.values[expected], rtol=RTOL, atol=0)
+
+@pytest.mark.parametrize('duration, earliest, latest', [
+    (3, START, START + 24 * STEP),
+    (0.75, START + 10.3 * STEP, START + 200 * STEP),
+    (50, START + 100 * STEP, START + 900 * STEP),
+    (2, START + 950 * STEP, START + 2000 * STEP), # latest past the end
+])
+def test_best_start(series, store, duration, earliest, latest):
+    stored = store['GB'].best_start(duration, earliest, latest)
+    original = series['GB'].best_start(duration, earliest, latest)
+    assert stored.start == original.start
+    assert stored.start_now == original.start_now
+    assert stored.carbonIntensity == pytest.approx(original.carbonIntensity, rel=1e-6)
+    assert stored.carbonIntensity_now == pytest.approx(original.carbonIntensity_now, rel=1e-6)
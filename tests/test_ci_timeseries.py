@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from ci_timeseries import CISeries, CITimeSeries, to_seconds
+
+# 2021-06-01 12:00 UTC
+NOON = 1622548800.
+
+def test_to_seconds():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert to_seconds('2021-06-01T12:00:00') == NOON
+        assert to_seconds('2021-06-01T12:00:00Z') == NOON
+        assert to_seconds('2021-06-01T12:00:00+00:00') == NOON
+        assert to_seconds('2021-06-01T14:00:00+02:00') == NOON
+        assert to_seconds('2021-06-01T07:30:00-04:30') == NOON
+        assert to_seconds(datetime(2021, 6, 1, 12)) == NOON
+        assert to_seconds(datetime(2021, 6, 1, 13, tzinfo=timezone(timedelta(hours=1)))) == NOON
+        assert to_seconds(np.datetime64('2021-06-01T12:00')) == NOON
+        assert to_seconds(NOON) == NOON
+
+        times = to_seconds(['2021-06-01T12:00:00Z', '2021-06-01T15:00:00+02:00'])
+        assert times.tolist() == [NOON, NOON + 3600]
+        assert to_seconds(np.array([], dtype=str)).shape == (0,)
+
+def brute_force_integral(series, t0, t1, n=100000):
+    # midpoint rule on a fine grid, exact up to the steps cut by the grid
+    edges = np.linspace(t0, t1, n + 1)
+    middles = (edges[:-1] + edges[1:]) / 2
+    values = series.values[((middles - series.start) // series.step).astype(int)]
+    return np.sum(values) * (t1 - t0) / n / 3600.
+
+@pytest.fixture
+def series():
+    return CISeries(NOON, 3600, np.random.RandomState(0).uniform(0, 500, 48))
+
+@pytest.mark.parametrize('t0, t1', [
+    (NOON, NOON + 48 * 3600), # everything
+    (NOON + 3600, NOON + 5 * 3600), # whole steps
+    (NOON + 1800, NOON + 2700), # within a step
+    (NOON + 1234.5, NOON + 30 * 3600 + 17), # partway through the first and last steps
+    (NOON + 47.5 * 3600, NOON + 48 * 3600), # the end of the last step
+])
+def test_integral(series, t0, t1):
+    assert series.integral(t0, t1) == pytest.approx(brute_force_integral(series, t0, t1), rel=1e-4)
+    assert series.mean(t0, t1) == pytest.approx(series.integral(t0, t1) / ((t1 - t0) / 3600.))
+
+def test_integral_arrays(series):
+    t0 = NOON + np.array([0, 1234.5, 7200])
+    t1 = NOON + np.array([3600, 50000, 7200])
+    expected = [series.integral(a, b) for a, b in zip(t0, t1)]
+    assert series.integral(t0, t1).tolist() == expected
+    assert series.integral(to_seconds(['2021-06-01T12:00Z', '2021-06-01T14:00+02:00']), NOON + 3600).tolist() == \
+           [series.values[0], series.values[0]]
+
+def test_empty_window(series):
+    assert series.integral(NOON + 1000, NOON + 1000) == 0
+    # the value at the time of an empty window
+    assert series.mean(NOON + 5000, NOON + 5000) == series.values[1]
+    assert series.mean(NOON + 48 * 3600, NOON + 48 * 3600) == series.values[-1]
+
+@pytest.mark.parametrize('t0, t1', [
+    (NOON - 1, NOON + 3600), # starts before the series
+    (NOON, NOON + 48 * 3600 + 1), # ends after it
+    (NOON - 7200, NOON - 3600), # entirely before
+])
+def test_uncovered_window(series, t0, t1):
+    with pytest.raises(ValueError, match="The series only covers"):
+        series.integral(t0, t1)
+    with pytest.raises(ValueError):
+        series.mean(t0, t1)
+    # one uncovered window is enough
+    with pytest.raises(ValueError):
+        series.integral([NOON, t0], [NOON + 3600, t1])
+
+def test_window_backwards(series):
+    with pytest.raises(ValueError, match="before its start"):
+        series.integral(NOON + 7200, NOON + 3600)
+
+def test_mean_carbonIntensity(series):
+    timeseries = CITimeSeries(dict(GB=series))
+    t0 = NOON + np.array([0., 1800, 0, 1800])
+    t1 = NOON + np.array([3600., 9000, 3600, 100 * 3600])
+    means = timeseries.mean_carbonIntensity(['GB', 'GB', 'FR', 'GB'], t0, t1, fallback=dict(GB=250., FR=50.))
+    # FR has no series, and the last window isn't covered: the annual values are used
+    assert means.tolist() == [series.mean(t0[0], t1[0]), series.mean(t0[1], t1[1]), 50., 250.]
+    assert means[1] == pytest.approx(brute_force_integral(series, t0[1], t1[1]) / 2, rel=1e-4)
+
+    with pytest.raises(KeyError):
+        timeseries.mean_carbonIntensity(['FR'], t0[:1], t1[:1])
+    with pytest.raises(ValueError):
+        timeseries.mean_carbonIntensity(['GB'], t0[3:], t1[3:])
+    with pytest.raises(KeyError, match="Unknown location: DE"):
+        timeseries.mean_carbonIntensity(['DE'], t0[:1], t1[:1], fallback=dict(GB=250.))
+
+def test_best_start_brute_force():
+    # no start on a fine grid does better than the candidates of best_start
+    series = CISeries(NOON, 3600, np.random.RandomState(1).uniform(0, 500, 72))
+    for duration, earliest, latest in [(3, 0, 24), (0.25, 1.1, 30.7), (10.5, 20.25, 61.5), (1, 5.5, 5.5)]:
+        earliest, latest = NOON + earliest * 3600, NOON + latest * 3600
+        result = series.best_start(duration, earliest, latest)
+        assert earliest <= result.start <= latest
+        assert result.carbonIntensity == pytest.approx(series.mean(result.start, result.start + duration * 3600))
+        starts = np.linspace(earliest, latest, 10000)
+        assert result.carbonIntensity <= series.mean(starts, starts + duration * 3600).min() + 1e-9
+        assert result.start_now == earliest
+        assert result.carbonIntensity_now == pytest.approx(series.mean(earliest, earliest + duration * 3600))
+
+def test_best_start_latest_brought_forward():
+    # decreasing values: the best 3h job ends with the series, even if latest is later
+    series = CISeries(NOON, 3600, np.arange(24., 0., -1.))
+    result = series.best_start(3, NOON, NOON + 48 * 3600)
+    assert result.start == series.end - 3 * 3600
+    assert result.carbonIntensity == 2.
+    # latest within the series is kept
+    assert series.best_start(3, NOON, NOON + 10.5 * 3600).start == NOON + 10.5 * 3600
+    # no job fits
+    with pytest.raises(ValueError):
+        series.best_start(3, series.end - 2 * 3600, series.end)
+    with pytest.raises(ValueError):
+        series.best_start(3, NOON - 3600, NOON + 3600)
+
+def test_best_start_without_duration():
+    series = CISeries(NOON, 3600, [3., 2., 1., 1., 4.])
+    result = series.best_start(0, NOON + 1800, NOON + 4.5 * 3600)
+    # the earliest time of the lowest value
+    assert (result.start, result.carbonIntensity) == (NOON + 2 * 3600, 1.)
+    assert (result.start_now, result.carbonIntensity_now) == (NOON + 1800, 3.)
+    # within the lowest step, the earliest start
+    assert series.best_start(0, NOON + 2.5 * 3600, NOON + 4.5 * 3600).start == NOON + 2.5 * 3600
+
+def test_best_start_ties():
+    # the earliest of equally good starts
+    series = CISeries(NOON, 3600, [5., 1., 1., 5., 1., 1., 5.])
+    assert series.best_start(2, NOON, NOON + 5 * 3600).start == NOON + 3600
+    flat = CISeries(NOON, 3600, [7.] * 24)
+    result = flat.best_start(5, NOON + 1000, NOON + 10 * 3600)
+    assert (result.start, result.carbonIntensity) == (NOON + 1000, 7.)
+    assert result.carbonIntensity_now == 7.
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import json
+
+import pytest
+
+import calculator
+from cli import main
+
+JOB = dict(coreType='CPU', coreModel='Xeon E5-2683 v4', n_cores=12, memory=64, runTime_hours=12, runTime_min=0,
+           location='GB', usage=1, PSF=1, selected_platform='localServer')
+
+def expected(reference, **changes):
+    job = dict(JOB, PUE=reference.lookups.pue['Unknown'], **changes)
+    return calculator.aggregate(reference, **{name: job.get(name) for name in calculator.JOB_INPUTS})
+
+def write_csv(path, rows, columns):
+    with open(str(path), 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+def read_csv(path):
+    with open(str(path), newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_single_job(reference, capsys):
+    code = main(['--cores', '12', '--core-model', 'Xeon E5-2683 v4', '--memory', '64', '--hours', '12',
+                 '--location', 'GB', '--format', 'json'])
+    assert code == 0
+    output = json.loads(capsys.readouterr().out)
+    assert output['carbonEmissions'] == expected(reference)['carbonEmissions']
+
+def test_single_job_error(capsys):
+    code = main(['--cores', '12', '--core-model', 'Xeon E5-2683 v4', '--memory', '64', '--hours', '12',
+                 '--location', 'Atlantis'])
+    assert code == 1
+    assert not capsys.readouterr().out.startswith("Job")
+
+def test_missing_options(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(['--cores', '12'])
+    assert e.value.code == 2
+    assert "missing options for the job: coreModel, memory, location, runTime_hours" in capsys.readouterr().err
+
+def test_csv(reference, tmp_path):
+    rows = [dict(JOB, n_cores=n_cores, runTime_min='') for n_cores in [1, 12, 48]]
+    jobs = write_csv(tmp_path / 'jobs.csv', rows, list(JOB))
+    output = tmp_path / 'results.csv'
+    assert main(['--jobs', jobs, '--output', str(output)]) == 0
+
+    results = read_csv(output)
+    assert [float(x['carbonEmissions']) for x in results] == \
+           [expected(reference, n_cores=n_cores)['carbonEmissions'] for n_cores in [1, 12, 48]]
+    assert set(x['error'] for x in results) == {''}
+
+def test_json(reference, tmp_path, capsys):
+    jobs = tmp_path / 'jobs.jsonl'
+    jobs.write_text('\n'.join([json.dumps(JOB), '', 'not json', json.dumps(dict(JOB, location='FR'))]) + '\n')
+    # options apply to the jobs that don't have their own
+    assert main(['--jobs', str(jobs), '--format', 'json', '--memory', '8']) == 1
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]['carbonEmissions'] == expected(reference)['carbonEmissions']
+    assert lines[1] == dict(error="Invalid JSON")
+    assert lines[2]['carbonEmissions'] == expected(reference, location='FR')['carbonEmissions']
+
+def test_bad_cell(reference, tmp_path):
+    rows = [JOB, dict(JOB, n_cores='abc'), dict(JOB, memory=-1), dict(JOB, n_cores=4)]
+    jobs = write_csv(tmp_path / 'jobs.csv', rows, list(JOB))
+    output = tmp_path / 'results.csv'
+    assert main(['--jobs', jobs, '--output', str(output)]) == 1
+
+    results = read_csv(output)
+    assert [x['error'] for x in results] == ['', "n_cores must be a number", "memory can't be negative", '']
+    assert float(results[3]['carbonEmissions']) == expected(reference, n_cores=4)['carbonEmissions']
+
+def test_missing_column(tmp_path, capsys):
+    columns = [name for name in JOB if name != 'location']
+    jobs = write_csv(tmp_path / 'jobs.csv', [{name: JOB[name] for name in columns}], columns)
+    assert main(['--jobs', jobs, '--format', 'text']) == 1
+    assert capsys.readouterr().out == "Job 1: Missing input: location\n\n"
+
+    # unless the option gives it
+    assert main(['--jobs', jobs, '--format', 'text', '--location', 'GB']) == 0
+
+def test_stdin(reference, monkeypatch, capsys):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, list(JOB))
+    writer.writeheader()
+    writer.writerow(JOB)
+    monkeypatch.setattr('sys.stdin', io.StringIO(text.getvalue()))
+    assert main(['--jobs', '-', '--format', 'json']) == 0
+    assert json.loads(capsys.readouterr().out)['carbonEmissions'] == expected(reference)['carbonEmissions']
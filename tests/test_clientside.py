@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# The clientside callbacks (assets/clientside.js) must give the same results as their Python versions
+
+import json
+import random
+
+import pytest
+
+import calculator
+from reference_data import clientside_payload
+
+@pytest.fixture(scope='module')
+def referenceData(reference):
+    payload = clientside_payload(reference.lookups, reference.refValues_dict,
+                                 defaults=dict(usage=1, PUE=reference.lookups.pue['Unknown'], PSF=1))
+    payload['revision'] = 1
+    return payload
+
+def random_jobs(reference, n, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(n):
+        coreType = rng.choice(calculator.CORE_TYPES)
+        jobs.append(dict(
+            coreType=coreType,
+            coreModel=rng.choice(sorted(reference.lookups.cores[coreType]) + ['other']),
+            n_cores=rng.randint(1, 200),
+            tdp=rng.choice([12, 200, 35.5]),
+            memory=rng.choice([1, 16, 64, 1000.5]),
+            runTime_hours=rng.randint(0, 2000),
+            runTime_min=rng.randint(0, 59),
+            location=rng.choice(sorted(reference.lookups.CI)),
+            usage=rng.choice([1, 0.5, 0.73]),
+            PUE=rng.choice([1.67, 1.1, 2]),
+            PSF=rng.choice([1, 3, 10]),
+            selected_platform=rng.choice(['cloudComputing', 'personalComputer', 'localServer']),
+            selected_provider=rng.choice(['aws', 'gcp', 'azure', 'other']),
+        ))
+    return jobs
+
+# arguments of aggregate_input_values, in order
+FORM_INPUTS = ['coreType', 'coreModel', 'n_cores', 'tdp', 'memory', 'runTime_hours', 'runTime_min', 'location',
+               'usage', 'PUE', 'PSF', 'selected_platform', 'selected_provider']
+
+FIXTURE_JOBS = [
+    dict(coreType='CPU', coreModel='Xeon E5-2683 v4', n_cores=12, tdp=12, memory=64, runTime_hours=12, runTime_min=0,
+         location='GB', usage=1, PUE=1.67, PSF=1, selected_platform='localServer', selected_provider='other'),
+    dict(coreType='GPU', coreModel='Tesla V100', n_cores=4, tdp=200, memory=128, runTime_hours=0, runTime_min=45,
+         location='US-CA', usage=0.8, PUE=1.67, PSF=3, selected_platform='cloudComputing', selected_provider='gcp'),
+    dict(coreType='CPU', coreModel='other', n_cores=2, tdp=35.5, memory=8, runTime_hours=1, runTime_min=30,
+         location='FR', usage=1, PUE=2, PSF=1, selected_platform='personalComputer', selected_provider='other'),
+    dict(coreType='CPU', coreModel='Xeon E5-2683 v4', n_cores=1000, tdp=12, memory=4000, runTime_hours=2000,
+         runTime_min=0, location='IN', usage=1, PUE=1.1, PSF=10, selected_platform='localServer',
+         selected_provider='other'),
+]
+
+def test_formula(reference, referenceData, clientside):
+    jobs = FIXTURE_JOBS + random_jobs(reference, 2000)
+    results = clientside('aggregate_input_values',
+                         [[job[name] for name in FORM_INPUTS] + [referenceData] for job in jobs])
+
+    for job, result in zip(jobs, results):
+        expected = calculator.aggregate(reference, **{name: job[name] for name in calculator.JOB_INPUTS})
+        assert result['data_version'] == referenceData['revision']
+        for name in calculator.RESULT_FIELDS:
+            if name != 'data_version':
+                # same operations in the same order: the results are identical, not only close
+                assert result[name] == expected[name], (name, job)
+
+def test_missing_inputs(reference, referenceData, clientside):
+    job = dict(FIXTURE_JOBS[0], memory=None)
+    result, = clientside('aggregate_input_values', [[job[name] for name in FORM_INPUTS] + [referenceData]])
+    assert result['carbonEmissions'] == 0
+    assert result['location'] is None
+
+@pytest.mark.parametrize('name, cases', [
+    ('display_provider', [['cloudComputing'], ['localServer'], ['personalComputer'], [None]]),
+    ('display_TDP', [['other'], ['Xeon E5-2683 v4'], [None]]),
+    ('tdp_default', [['CPU'], ['GPU'], [None]]),
+    ('display_countryRegion', [['Africa'], ['Asia'], ['Europe'], ['North America'], ['Oceania'],
+                               ['South America'], ['World'], [None]]),
+    ('display_usage_input', [['Yes'], ['No'], [None]]),
+    ('display_pue_input', [['Yes'], ['No'], [None]]),
+    ('display_PSF_input', [['Yes'], ['No'], [None]]),
+])
+def test_show_hide(app_module, clientside, name, cases):
+    appData = app_module.reference_store.current
+    referenceData = clientside_payload(appData.lookups, appData.refValues_dict,
+                                       defaults=dict(usage=app_module.usageFactor_default, PUE=appData.PUE_default,
+                                                     PSF=app_module.PSF_default))
+    function = getattr(app_module, name)
+    # the functions with a value default also get the reference data
+    takes_reference = name in ('display_usage_input', 'display_pue_input', 'display_PSF_input')
+    results = clientside(name, [args + [referenceData] if takes_reference else args for args in cases])
+
+    for args, result in zip(cases, results):
+        expected = function(*args)
+        assert result == (list(expected) if isinstance(expected, tuple) else expected), args
+
+def test_regions_ranking(app_module, reference, clientside):
+    from plotly.utils import PlotlyJSONEncoder
+
+    appData = app_module.reference_store.current
+    referenceData = clientside_payload(appData.lookups, appData.refValues_dict, regions=appData.regions)
+    cases = []
+    for job in FIXTURE_JOBS + random_jobs(reference, 40, seed=1):
+        aggData = calculator.aggregate(reference, **{name: job[name] for name in calculator.JOB_INPUTS})
+        for scope in app_module.REGIONS_SCOPES:
+            for top in [10, 'all']:
+                cases.append([aggData, scope, top, ['show'], job['selected_provider']])
+    cases.append([aggData, 'all', 10, [], 'gcp'])
+    cases.append([None, 'all', 10, ['show'], 'gcp'])
+
+    results = clientside('update_regions_ranking', [args[:4] + [referenceData] + args[4:] for args in cases])
+    for args, result in zip(cases, results):
+        expected = json.loads(json.dumps(app_module.update_regions_ranking(*args), cls=PlotlyJSONEncoder))
+        assert result == expected, args[1:]
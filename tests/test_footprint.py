@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import calculator
+from footprint import FOOTPRINT_COLUMNS, score_jobs
+
+PLATFORMS = ['localServer', 'personalComputer', 'cloudComputing']
+
+def random_jobs(lookups, n, seed=0):
+    rng = np.random.RandomState(seed)
+    jobs = []
+    for _ in range(n):
+        coreType = str(rng.choice(calculator.CORE_TYPES))
+        models = sorted(lookups.cores[coreType]) + ['other']
+        platform = str(rng.choice(PLATFORMS))
+        # providers without a PUE of their own ('') and unknown ones keep the PUE of the job
+        providers = sorted(lookups.pue) + ['', 'unknown'] if platform == 'cloudComputing' else ['']
+        jobs.append(dict(
+            coreType=coreType,
+            coreModel=str(rng.choice(models)),
+            tdp=float(rng.uniform(1, 300)),
+            n_cores=int(rng.randint(1, 128)),
+            memory=float(rng.uniform(0, 512)),
+            runTime_hours=int(rng.randint(0, 200)),
+            runTime_min=int(rng.randint(0, 60)),
+            location=str(rng.choice(sorted(lookups.CI))),
+            usage=float(rng.uniform(0, 1)),
+            PUE=float(rng.uniform(1, 2.5)),
+            PSF=int(rng.randint(1, 10)),
+            selected_platform=platform,
+            selected_provider=str(rng.choice(providers)),
+        ))
+    return jobs
+
+def test_parity(reference):
+    # score_jobs gives the results of calculator.aggregate (the formula of the page), job by job
+    lookups = reference.lookups
+    jobs = random_jobs(lookups, 2000)
+    columns = {name: [job[name] for job in jobs] for name in calculator.JOB_INPUTS}
+    footprint = score_jobs(columns, cores_dict=lookups.cores, CI_dict=lookups.CI, pue_dict=lookups.pue,
+                           refValues_dict=reference.refValues_dict)
+    assert set(footprint) == set(FOOTPRINT_COLUMNS)
+
+    for i, job in enumerate(jobs):
+        expected = calculator.aggregate(reference, **job)
+        for name in FOOTPRINT_COLUMNS:
+            assert footprint[name][i] == expected[name], (name, job)
+
+    # every case was drawn
+    assert set(columns['selected_platform']) == set(PLATFORMS)
+    assert 'other' in columns['coreModel']
+    assert set(columns['selected_provider']) >= set(lookups.pue) | {''}
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+def test_all_providers(app_module):
+    options_index = app_module.reference_store.current.options_index
+    all_locations = options_index.locations[app_module.ALL_PROVIDERS]
+    # 'other' and personal computers can be anywhere
+    assert app_module.set_continents_options('other', 'cloudComputing') == all_locations.continents
+    assert app_module.set_continents_options('gcp', 'personalComputer') == all_locations.continents
+    assert app_module.set_continents_options('gcp', 'cloudComputing') == options_index.locations['gcp'].continents
+    assert len(options_index.locations['gcp'].continents) < len(all_locations.continents)
+
+def test_missing_provider(app_module):
+    # a missing provider isn't taken for every provider
+    assert None not in app_module.reference_store.current.options_index.locations
+    with pytest.raises(KeyError):
+        app_module.set_continents_options(None, 'cloudComputing')
+    with pytest.raises(KeyError):
+        app_module.set_countries_options('Europe', None, 'cloudComputing')
+    with pytest.raises(KeyError):
+        app_module.set_cities_options('Europe', 'France', None, 'cloudComputing')
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+from collections import namedtuple
+
+import pytest
+
+from reference_data import CSV_FILES
+from reference_store import ReferenceStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def data_dir(tmpdir):
+    for name in set(CSV_FILES.values()):
+        shutil.copy(os.path.join(ROOT, 'data', name), str(tmpdir))
+    return tmpdir
+
+# what ReferenceStore needs from the data it builds
+Data = namedtuple('Data', ['data_hash', 'revision'])
+
+def build(tables, data_hash, revision):
+    return Data(data_hash, revision)
+
+def edit(data_dir, name, old, new, mtime):
+    path = str(data_dir.join(CSV_FILES[name]))
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text.replace(old, new, 1))
+    os.utime(path, (mtime, mtime))
+
+def test_reload(data_dir, caplog):
+    store = ReferenceStore(str(data_dir), build, use_snapshot=False)
+    first = store.current
+    assert store.stats()['data_hash'] == first.data_hash
+
+    # same files: nothing is loaded
+    assert not store.reload()
+
+    edit(data_dir, 'cpu', 'A8-7680,45,4,11.3', 'A8-7680,45,4,11.4', 2e9)
+    assert store.reload()
+    assert store.current.data_hash != first.data_hash
+    assert store.current.revision > first.revision
+
+    # invalid files are rejected once, and the current version is kept
+    edit(data_dir, 'cpu', 'A8-7680,45,4,11.4', 'A8-7680,45,4,-1', 2.1e9)
+    valid = store.current
+    with caplog.at_level(logging.ERROR, logger='reference_store'):
+        for _ in range(3):
+            store.check()
+    assert store.current is valid
+    assert store.errors == 1
+    assert len([record for record in caplog.records if record.levelno == logging.ERROR]) == 1
+
+    edit(data_dir, 'cpu', 'A8-7680,45,4,-1', 'A8-7680,45,4,11.5', 2.2e9)
+    store.check()
+    assert store.current is not valid
+    assert store.errors == 1